@@ -5,7 +5,8 @@ from app.api.v1.endpoints import (
     chat,
     sentiment,
     memory,
-    services
+    services,
+    debug
 )
 
 api_router = APIRouter()
@@ -15,4 +16,5 @@ api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
 api_router.include_router(sentiment.router, prefix="/sentiment", tags=["sentiment"])
 api_router.include_router(memory.router, prefix="/memory", tags=["memory"])
-api_router.include_router(services.router, prefix="/services", tags=["services"]) 
\ No newline at end of file
+api_router.include_router(services.router, prefix="/services", tags=["services"]) 
+api_router.include_router(debug.router, prefix="/debug", tags=["debug"])
\ No newline at end of file
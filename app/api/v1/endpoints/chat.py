@@ -1,14 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.core.security import get_current_user
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from app.core.security import get_current_user, get_user_from_token
 from app.models.chat import ChatMessage, ChatRequest, ChatResponse, Message, ChatSession
 from app.db.mongodb import mongodb
+from app.db.pagination import dump_documents, keyset_page, parse_fields
 from app.core.config import settings
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 from bson import ObjectId
 from random import choice
-from app.core.analyzer import analyze_emotions, retrieve_context, update_psycho_profile, get_psycho_profile
-from app.core.responder import generate_response
+from app.core.pipeline import is_exit_command, prepare_turn, respond, store_turn, GOODBYE_RESPONSE
+from app.core.responder import generate_response_stream
+from app.core.scheduler import CircuitOpenError
+from app.core.deadline import deadline_scope, resolve_budget_ms
+from app.core.singleflight import (
+    IdempotencyKeyReusedError, RequestInProgressError, request_fingerprint, request_key, single_flight
+)
 
 router = APIRouter()
 
@@ -23,78 +31,210 @@ SYSTEM_RESPONSES = [
 @router.post("/send", response_model=ChatResponse)
 async def send_message(
     chat_request: ChatRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    deadline_ms: Optional[float] = Header(None, alias="X-Request-Deadline-Ms"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
+    """
+    Retries are coalesced per user: by `Idempotency-Key` when the client sends one, otherwise
+    by an identical message within SINGLE_FLIGHT_WINDOW_SECONDS. A retry waits for the
+    original request or gets its stored reply back. Reusing an `Idempotency-Key` for a
+    different message is rejected with 422.
+    """
     try:
         # Get user input
         user_input = chat_request.message
 
         # Check if user wants to exit
-        if user_input.lower() in ["quit", "exit"]:
+        if is_exit_command(user_input):
             return ChatResponse(
                 message=user_input,
-                response="👋 Goodbye. Take care."
+                response=GOODBYE_RESPONSE
             )
 
-        # Step 1: Analyze emotions
-        emotions = analyze_emotions(user_input)
-
-        # Step 2: Retrieve relevant context via RAG
-        context_chunks = []
-        # try:
-        #     context_chunks = retrieve_context(user_input)
-        # except (ValueError, Exception) as e:
-        #     print(f"[Error] Context retrieval failed: {str(e)}")
-        #     context_chunks = []
-
-        # Step 3: Update psychoanalytic profile based on input and context
-        update_psycho_profile(user_input, context_chunks)
-
-        # Step 4: Generate response using profile and user input
-        psycho_data = get_psycho_profile()
-        ai_response = generate_response(user_input, psycho_data, context_chunks)
-        print(f"💬 AI Response: {ai_response}")
-
-        # Store the conversation in MongoDB
-        chat_collection = mongodb.get_collection("chats")
-        chat_data = {
-            "user_id": str(current_user["_id"]),
-            "message": chat_request.message,
-            "emotion": chat_request.emotion,
-            "response": ai_response,
-            "created_at": datetime.utcnow()
-        }
-        
-        await chat_collection.insert_one(chat_data)
-
-        return ChatResponse(
-            message=chat_request.message,
-            response=ai_response
-        )
+        user_id = str(current_user["_id"])
+
+        async def reply() -> dict:
+            # Analyze the message, then generate response using profile and user input
+            emotion_hint = chat_request.emotion.value if chat_request.emotion else None
+            with deadline_scope(resolve_budget_ms(deadline_ms)) as deadline:
+                ai_response = await respond(user_id, user_input, emotion_hint)
+            print(f"💬 AI Response: {ai_response}")
+
+            # Store the conversation in MongoDB
+            await store_turn(user_id, chat_request.message, chat_request.emotion, ai_response)
+
+            return ChatResponse(
+                message=chat_request.message,
+                response=ai_response,
+                skipped_stages=deadline.skipped_stages if deadline else [],
+                degraded=deadline.degraded if deadline else False
+            ).model_dump()
+
+        key = request_key(user_id, idempotency_key, chat_request.message, chat_request.emotion)
+        fingerprint = request_fingerprint(chat_request.message, chat_request.emotion)
+        ttl = settings.SINGLE_FLIGHT_KEY_TTL_SECONDS if idempotency_key else settings.SINGLE_FLIGHT_WINDOW_SECONDS
+        return ChatResponse(**await single_flight.run(key, reply, ttl, fingerprint=fingerprint))
 
+    except IdempotencyKeyReusedError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different message"
+        )
+    except RequestInProgressError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An identical request is still being processed"
+        )
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The assistant is temporarily overloaded, please try again shortly",
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}"
         )
 
+async def _stream_reply(user_id: str, chat_request: ChatRequest):
+    """
+    Yield reply tokens as they arrive and persist the full reply once the stream ends.
+    """
+    user_input = chat_request.message
+    if is_exit_command(user_input):
+        yield GOODBYE_RESPONSE
+        return
+
+    turn = await prepare_turn(user_id, user_input)
+    parts = []
+    async for token in generate_response_stream(user_input, turn.psycho_data, turn.context_chunks, turn.conversation):
+        parts.append(token)
+        yield token
+
+    ai_response = "".join(parts).strip()
+    await store_turn(user_id, user_input, chat_request.emotion, ai_response)
+
+def _sse_event(data: dict, event: str = None) -> str:
+    payload = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+@router.post("/stream")
+async def stream_message(
+    chat_request: ChatRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Server-Sent Events variant of /send: emits a `data` event per token and a final `done` event.
+    """
+    user_id = str(current_user["_id"])
+
+    async def event_source():
+        parts = []
+        try:
+            async for token in _stream_reply(user_id, chat_request):
+                parts.append(token)
+                yield _sse_event({"token": token})
+            yield _sse_event({"message": chat_request.message, "response": "".join(parts).strip()}, event="done")
+        except Exception as e:
+            yield _sse_event({"detail": f"An error occurred: {str(e)}"}, event="error")
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, token: str):
+    """
+    WebSocket chat. The user is authenticated once from the `token` query parameter;
+    each incoming {"message", "emotion"} frame is answered with `token` frames and a `done` frame.
+    """
+    try:
+        current_user = await get_user_from_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    user_id = str(current_user["_id"])
+    try:
+        while True:
+            try:
+                chat_request = ChatRequest(**await websocket.receive_json())
+            except (ValueError, TypeError) as e:
+                await websocket.send_json({"type": "error", "detail": f"Invalid message: {str(e)}"})
+                continue
+
+            parts = []
+            try:
+                async for token_text in _stream_reply(user_id, chat_request):
+                    parts.append(token_text)
+                    await websocket.send_json({"type": "token", "content": token_text})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "detail": f"An error occurred: {str(e)}"})
+                continue
+
+            await websocket.send_json({
+                "type": "done",
+                "message": chat_request.message,
+                "response": "".join(parts).strip()
+            })
+    except WebSocketDisconnect:
+        pass
+
+def _page_response(docs: List[dict], next_cursor: Optional[str]) -> Response:
+    # Rows come straight from MongoDB in the model's shape, so they are serialized
+    # directly rather than re-validated through response_model one by one
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(content=dump_documents(docs), media_type="application/json", headers=headers)
+
+async def _list_page(collection_name: str, query: dict, sort_field: str, model,
+                     limit: Optional[int], cursor: Optional[str], fields: Optional[str]) -> Response:
+    limit = min(limit or settings.CHAT_PAGE_SIZE, settings.CHAT_PAGE_MAX_SIZE)
+    try:
+        docs, next_cursor = await keyset_page(
+            mongodb.get_collection(collection_name),
+            query,
+            sort_field,
+            limit,
+            cursor=cursor,
+            fields=parse_fields(fields, list(model.model_fields))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return _page_response(docs, next_cursor)
+
 @router.get("/history", response_model=List[ChatMessage])
-async def get_chat_history(current_user: dict = Depends(get_current_user)):
-    chat_collection = mongodb.get_collection("chats")
-    chat_history = await chat_collection.find(
-        {"user_id": str(current_user["_id"])}
-    ).sort("created_at", -1).to_list(length=50)  # Get last 50 messages
-    
-    return chat_history
+async def get_chat_history(
+    current_user: dict = Depends(get_current_user),
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Chat history, newest first. Pass the `X-Next-Cursor` response header back as
+    `cursor` for the next page; `fields` is a comma-separated subset of the fields.
+    """
+    return await _list_page(
+        "chats", {"user_id": str(current_user["_id"])}, "created_at", ChatMessage, limit, cursor, fields
+    )
 
 @router.get("/messages/{user_id}", response_model=List[Message])
-async def get_user_messages(user_id: str, skip: int = 0, limit: int = 100):
-    messages_collection = mongodb.get_collection("messages")
-    messages = await messages_collection.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).skip(skip).limit(limit).to_list(length=limit)
-    
-    return [Message(**msg) for msg in messages]
+async def get_user_messages(
+    user_id: str,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Messages newest first, paged like /history.
+    """
+    return await _list_page("messages", {"user_id": user_id}, "timestamp", Message, limit, cursor, fields)
 
 @router.get("/sessions/{user_id}", response_model=List[ChatSession])
 async def get_chat_sessions(user_id: str, date: str = None):
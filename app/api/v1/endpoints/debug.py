@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.core.security import get_current_user
+from app.core.tracing import tracer
+from app.core.metrics import metrics
+from app.core.config import settings
+from typing import List, Dict
+
+router = APIRouter()
+
+def _require_tracing():
+    if not tracer.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tracing is disabled"
+        )
+
+def _trace_owner(current_user: dict):
+    """
+    User whose traces the caller may read; None for trace admins, who see everyone's.
+    """
+    if current_user.get("email") in settings.TRACE_ADMIN_EMAILS:
+        return None
+    return str(current_user["_id"])
+
+def _require_admin(current_user: dict):
+    if current_user.get("email") not in settings.TRACE_ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only trace admins can read metrics"
+        )
+
+@router.get("/traces", response_model=List[Dict])
+async def get_recent_traces(limit: int = Query(50, ge=1), current_user: dict = Depends(get_current_user)):
+    _require_tracing()
+    return tracer.recent(limit, user_id=_trace_owner(current_user))
+
+@router.get("/traces/{request_id}", response_model=List[Dict])
+async def get_request_trace(request_id: str, current_user: dict = Depends(get_current_user)):
+    _require_tracing()
+    events = await tracer.for_request(request_id, user_id=_trace_owner(current_user))
+    if not events:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return events
+
+@router.get("/metrics", response_model=Dict[str, Dict])
+async def get_stage_metrics(current_user: dict = Depends(get_current_user)):
+    """
+    Per-stage call counts, fallbacks, errors and p50/p95 latency for tuning LLM routing.
+    Covers every user's traffic, so only trace admins may read it.
+    """
+    _require_admin(current_user)
+    return metrics.snapshot()
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException, status
+import json
+from fastapi import APIRouter, HTTPException, Request, status
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
 from app.models.chat import SentimentLog
 from app.db.mongodb import mongodb
+from app.core.config import settings
+from app.core.sentiment_rollups import ROLLUPS_COLLECTION, record_log, record_logs, to_naive_utc
 from datetime import datetime, timedelta
-from typing import List
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
 from bson import ObjectId
 
 router = APIRouter()
@@ -14,9 +19,103 @@ async def create_sentiment_log(log: SentimentLog):
     log_dict["timestamp"] = datetime.utcnow()
     
     result = await logs_collection.insert_one(log_dict)
+    await record_log(log_dict)
     log_dict["id"] = str(result.inserted_id)
     return SentimentLog(**log_dict)
 
+async def _ndjson_rows(request: Request) -> AsyncIterator[Any]:
+    """
+    Parse an NDJSON body line by line as it arrives; a line that is not valid JSON
+    yields the error instead of a row.
+    """
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if pending.strip():
+        yield _parse_line(pending)
+
+def _parse_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
+
+async def _json_array_rows(request: Request) -> AsyncIterator[Any]:
+    try:
+        rows = json.loads(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON: {str(e)}")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a JSON array of sentiment logs")
+    for row in rows:
+        yield row
+
+async def _insert_batch(logs_collection, batch: List[Tuple[int, Dict]], errors: List[Dict]) -> int:
+    """
+    Insert one unordered batch of (row number, log) pairs; rows the database rejects
+    are added to `errors` and the rest still go in. Returns the number inserted.
+    """
+    docs = [doc for _, doc in batch]
+    failed = set()
+    try:
+        await logs_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for write_error in e.details.get("writeErrors", []):
+            failed.add(write_error["index"])
+            errors.append({"row": batch[write_error["index"]][0], "error": write_error.get("errmsg", "Write failed")})
+    inserted = [doc for i, doc in enumerate(docs) if i not in failed]
+    await record_logs(inserted)
+    return len(inserted)
+
+@router.post("/logs/bulk")
+async def create_sentiment_logs_bulk(request: Request):
+    """
+    Store many sentiment logs in one request, sent as a JSON array or as NDJSON
+    (`Content-Type: application/x-ndjson`, one log per line, read as it streams in).
+
+    Rows are validated individually and written in unordered batches of
+    SENTIMENT_BULK_BATCH_SIZE. Invalid or rejected rows are reported by their
+    0-based position in `errors`; they do not stop the other rows. Each log keeps its
+    own `timestamp` (converted to UTC), so offline entries land on the UTC day they
+    were recorded.
+    """
+    logs_collection = mongodb.get_collection("sentiment_logs")
+    content_type = request.headers.get("content-type", "")
+    ndjson = "ndjson" in content_type or "jsonlines" in content_type
+    rows = _ndjson_rows(request) if ndjson else _json_array_rows(request)
+    
+    inserted = 0
+    errors: List[Dict] = []
+    batch: List[Tuple[int, Dict]] = []
+    row_number = -1
+    async for row in rows:
+        row_number += 1
+        if isinstance(row, Exception):
+            errors.append({"row": row_number, "error": f"Invalid JSON: {str(row)}"})
+            continue
+        try:
+            log = SentimentLog.model_validate(row)
+        except ValidationError as e:
+            errors.append({"row": row_number, "error": str(e)})
+            continue
+        # Leave _id to the database rather than storing the model's empty id
+        doc = log.model_dump(exclude={"id"})
+        # Offsets sent by clients are folded into UTC, like every other stored timestamp
+        doc["timestamp"] = to_naive_utc(doc["timestamp"])
+        batch.append((row_number, doc))
+        if len(batch) >= settings.SENTIMENT_BULK_BATCH_SIZE:
+            inserted += await _insert_batch(logs_collection, batch, errors)
+            batch = []
+    if batch:
+        inserted += await _insert_batch(logs_collection, batch, errors)
+    
+    errors.sort(key=lambda error: error["row"])
+    return {"inserted": inserted, "failed": len(errors), "errors": errors}
+
 @router.get("/logs/{user_id}", response_model=List[SentimentLog])
 async def get_user_sentiment_logs(
     user_id: str,
@@ -39,43 +138,68 @@ async def get_user_sentiment_logs(
 async def get_sentiment_summary(
     user_id: str,
     start_date: str = None,
-    end_date: str = None
+    end_date: str = None,
+    bucket: Optional[Literal["day", "week"]] = None
 ):
-    logs_collection = mongodb.get_collection("sentiment_logs")
+    """
+    Average sentiment and emotion tag counts, read from the daily rollups. With `bucket`,
+    also returns the same figures per day or week (weeks start on Monday), oldest first.
+    """
+    rollups_collection = mongodb.get_collection(ROLLUPS_COLLECTION)
     query = {"user_id": user_id}
     
     if start_date and end_date:
         start = datetime.strptime(start_date, "%Y-%m-%d")
         end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-        query["timestamp"] = {"$gte": start, "$lt": end}
+        query["day"] = {"$gte": start, "$lt": end}
     
-    # Aggregate sentiment scores and emotion tags
-    pipeline = [
-        {"$match": query},
-        {"$group": {
-            "_id": None,
-            "avg_sentiment": {"$avg": "$sentiment_score"},
-            "emotion_distribution": {"$push": "$emotion_tags"},
-            "total_messages": {"$sum": 1}
-        }}
+    # One small document per day with logs, whatever the number of logs
+    totals = {"count": {"$sum": "$count"}, "score_sum": {"$sum": "$score_sum"}}
+    emotion_rows = [
+        {"$project": {"day": 1, "emotion": {"$objectToArray": {"$ifNull": ["$emotions", {}]}}}},
+        {"$unwind": "$emotion"}
     ]
+    facets = {
+        "overall": [{"$group": {"_id": None, **totals}}],
+        "emotions": emotion_rows + [
+            {"$group": {"_id": "$emotion.k", "count": {"$sum": "$emotion.v"}}}
+        ]
+    }
+    if bucket:
+        period = "$day" if bucket == "day" else {"$dateTrunc": {"date": "$day", "unit": "week", "startOfWeek": "monday"}}
+        facets["buckets"] = [
+            {"$group": {"_id": period, **totals}},
+            {"$sort": {"_id": 1}}
+        ]
+        facets["bucket_emotions"] = emotion_rows + [
+            {"$group": {"_id": {"period": period, "emotion": "$emotion.k"}, "count": {"$sum": "$emotion.v"}}}
+        ]
+    
+    pipeline = [{"$match": query}, {"$facet": facets}]
+    result = (await rollups_collection.aggregate(pipeline).to_list(length=1))[0]
+    
+    def average(row: dict) -> float:
+        return row["score_sum"] / row["count"] if row["count"] else 0
     
-    result = await logs_collection.aggregate(pipeline).to_list(length=1)
-    if not result:
-        return {
-            "avg_sentiment": 0,
-            "emotion_distribution": {},
-            "total_messages": 0
-        }
+    overall = result["overall"][0] if result["overall"] else {"count": 0, "score_sum": 0}
+    summary = {
+        "avg_sentiment": average(overall),
+        "emotion_distribution": {row["_id"]: row["count"] for row in result["emotions"]},
+        "total_messages": overall["count"]
+    }
     
-    # Process emotion distribution
-    emotion_counts = {}
-    for tags in result[0]["emotion_distribution"]:
-        for tag in tags:
-            emotion_counts[tag] = emotion_counts.get(tag, 0) + 1
+    if bucket:
+        bucket_emotions = {}
+        for row in result["bucket_emotions"]:
+            bucket_emotions.setdefault(row["_id"]["period"], {})[row["_id"]["emotion"]] = row["count"]
+        summary["buckets"] = [
+            {
+                "start": row["_id"],
+                "avg_sentiment": average(row),
+                "emotion_distribution": bucket_emotions.get(row["_id"], {}),
+                "total_messages": row["count"]
+            }
+            for row in result["buckets"]
+        ]
     
-    return {
-        "avg_sentiment": result[0]["avg_sentiment"],
-        "emotion_distribution": emotion_counts,
-        "total_messages": result[0]["total_messages"]
-    } 
\ No newline at end of file
+    return summary
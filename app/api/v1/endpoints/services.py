@@ -3,35 +3,29 @@ from app.db.mongodb import mongodb
 from typing import Dict
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter()
 
 @router.post("/{user_id}/connect")
 async def connect_service(user_id: str, service_data: Dict):
     services_collection = mongodb.get_collection("connected_services")
+    now = datetime.utcnow()
     
-    # Check if service already connected
-    existing_service = await services_collection.find_one({
-        "user_id": user_id,
-        "service_type": service_data["service_type"]
-    })
-    
-    if existing_service:
-        # Update existing service connection
-        await services_collection.update_one(
-            {"_id": existing_service["_id"]},
-            {
-                "$set": {
-                    "credentials": service_data["credentials"],
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
-    else:
-        # Create new service connection
-        service_data["user_id"] = user_id
-        service_data["created_at"] = service_data["updated_at"] = datetime.utcnow()
-        await services_collection.insert_one(service_data)
+    # Update the existing connection or create it, in one atomic upsert on the
+    # unique (user_id, service_type) index
+    new_fields = {k: v for k, v in service_data.items() if k not in ("user_id", "service_type", "credentials")}
+    new_fields["created_at"] = now
+    update = {
+        "$set": {"credentials": service_data["credentials"], "updated_at": now},
+        "$setOnInsert": new_fields
+    }
+    query = {"user_id": user_id, "service_type": service_data["service_type"]}
+    try:
+        await services_collection.update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        # Lost an upsert race; the connection exists now, so update it
+        await services_collection.update_one(query, update)
     
     return {"message": f"Service {service_data['service_type']} connected successfully"}
 
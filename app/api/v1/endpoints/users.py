@@ -1,20 +1,40 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.core.security import get_current_user, get_password_hash
+from fastapi.responses import StreamingResponse
+from app.core.security import get_current_user, password_hasher, user_cache
+from app.core.export import export_stream
 from app.models.user import User, UserCreate, UserUpdate, UserProfile, StarterAnswers
 from app.models.about import AboutUser
 from app.db.mongodb import mongodb
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from typing import Optional
 
 router = APIRouter()
 
+async def _update_user_document(user_id: ObjectId, update_data: dict) -> dict:
+    """
+    Apply `update_data` to the user and return the updated document, refreshing the user cache.
+    """
+    users_collection = mongodb.get_collection("users")
+    updated_user = await users_collection.find_one_and_update(
+        {"_id": user_id},
+        {"$set": update_data},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated_user is None:
+        user_cache.invalidate(str(user_id))
+        raise HTTPException(status_code=404, detail="User not found")
+    user_cache.put(str(user_id), updated_user)
+    return updated_user
+
 @router.post("/", response_model=User)
 async def create_user(user: UserCreate):
     users_collection = mongodb.get_collection("users")
     
-    # Check if user already exists
-    if await users_collection.find_one({"email": user.email}):
+    # Check if user already exists, before spending a hashing slot on it
+    if await users_collection.find_one({"email": user.email}, {"_id": 1}):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -22,101 +42,78 @@ async def create_user(user: UserCreate):
     
     # Create new user
     user_dict = user.model_dump()
-    user_dict["hashed_password"] = get_password_hash(user_dict.pop("password"))
+    user_dict["hashed_password"] = await password_hasher.hash(user_dict.pop("password"))
     user_dict["created_at"] = datetime.utcnow()
     user_dict["updated_at"] = user_dict["created_at"]
     
-    result = await users_collection.insert_one(user_dict)
-    created_user = await users_collection.find_one({"_id": result.inserted_id})
-    return created_user
+    # The unique email index rejects a concurrent registration of the same address
+    try:
+        await users_collection.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    return user_dict
 
 @router.get("/me", response_model=User)
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
-    users_collection = mongodb.get_collection("users")
-    user = await users_collection.find_one({"_id": current_user["_id"]})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return current_user
 
 @router.put("/me", response_model=User)
 async def update_user(
     user_update: UserUpdate,
     current_user: dict = Depends(get_current_user)
 ):
-    users_collection = mongodb.get_collection("users")
     update_data = user_update.model_dump(exclude_unset=True)
     
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await password_hasher.hash(update_data.pop("password"))
     
     update_data["updated_at"] = datetime.utcnow()
     
-    result = await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$set": update_data}
+    return await _update_user_document(current_user["_id"], update_data)
+
+@router.get("/me/export")
+async def export_user_data(compress: bool = False, current_user: dict = Depends(get_current_user)):
+    """
+    Stream all of the user's data as NDJSON, one `{"type": ..., "data": ...}` record per line.
+    With `compress=true` the body is gzip-compressed.
+    """
+    filename = f"export-{current_user['_id']}.ndjson" + (".gz" if compress else "")
+    return StreamingResponse(
+        export_stream(current_user, compress=compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    updated_user = await users_collection.find_one({"_id": current_user["_id"]})
-    return updated_user
 
 @router.put("/me/profile", response_model=User)
 async def update_user_profile(
     profile_update: UserProfile,
     current_user: dict = Depends(get_current_user)
 ):
-    users_collection = mongodb.get_collection("users")
     update_data = {"profile": profile_update.model_dump(exclude_unset=True)}
     update_data["updated_at"] = datetime.utcnow()
     
-    result = await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$set": update_data}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    updated_user = await users_collection.find_one({"_id": current_user["_id"]})
-    return updated_user
+    return await _update_user_document(current_user["_id"], update_data)
 
 @router.get("/me/profile", response_model=UserProfile)
 async def get_user_profile(current_user: dict = Depends(get_current_user)):
-    users_collection = mongodb.get_collection("users")
-    user = await users_collection.find_one({"_id": current_user["_id"]})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user.get("profile", {})
+    return current_user.get("profile", {})
 
 @router.put("/me/about", response_model=User)
 async def update_user_about(
     about_update: AboutUser,
     current_user: dict = Depends(get_current_user)
 ):
-    users_collection = mongodb.get_collection("users")
     update_data = {"about": about_update.model_dump(exclude_unset=True)}
     update_data["updated_at"] = datetime.utcnow()
     
-    result = await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$set": update_data}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    updated_user = await users_collection.find_one({"_id": current_user["_id"]})
-    return updated_user
+    return await _update_user_document(current_user["_id"], update_data)
 
 @router.get("/me/about", response_model=AboutUser)
 async def get_user_about(current_user: dict = Depends(get_current_user)):
-    users_collection = mongodb.get_collection("users")
-    user = await users_collection.find_one({"_id": current_user["_id"]})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user.get("about", {})
+    return current_user.get("about", {})
 
 @router.post("/me/starter-answers", response_model=User)
 async def submit_starter_answers(
@@ -127,8 +124,6 @@ async def submit_starter_answers(
     Submit initial answers from the user and update their profile.
     This endpoint collects basic information about the user and updates their profile accordingly.
     """
-    users_collection = mongodb.get_collection("users")
-    
     # Calculate date of birth from age if provided
     date_of_birth = None
     if isinstance(answers.age, int):
@@ -156,15 +151,5 @@ async def submit_starter_answers(
         "onboarding_completed": answers.completed
     }
     
-    # The user ID is already an ObjectId in current_user["_id"]
-    result = await users_collection.update_one(
-        {"_id": ObjectId(current_user["_id"])},  # Convert string ID to ObjectId
-        {"$set": update_data}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Return updated user
-    updated_user = await users_collection.find_one({"_id": ObjectId(current_user["_id"])})  # Convert string ID to ObjectId
-    return updated_user 
+    # Update and return the user document
+    return await _update_user_document(ObjectId(current_user["_id"]), update_data) 
@@ -4,11 +4,18 @@ import json
 import numpy as np
 import faiss
 from dotenv import load_dotenv
-from typing import List, Dict
-import openai
+from typing import List, Dict, Optional
 from datetime import datetime
 import logging
-from functools import lru_cache
+from app.core.profile_store import profile_store
+from app.core.tracing import tracer
+from app.core.llm import llm_router
+from app.core.emotion_classifier import emotion_classifier, EMOTIONS
+from app.core.config import settings
+from app.core.embeddings import embedding_service
+from app.core.vector_memory import vector_memory
+from app.core.chunk_store import ChunkStore
+from app.core.prompts import build_prompt_messages
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -18,59 +25,51 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # Load API key from .env file
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 logger.debug(f"OpenAI API Key loaded: {os.getenv('OPENAI_API_KEY')[:5]}...")
 
 # Initialize FAISS index lazily
 _faiss_index = None
-_metadata = {}
+_chunk_store = None
 
 def get_faiss_index():
-    global _faiss_index, _metadata
+    global _faiss_index, _chunk_store
     if _faiss_index is None:
         try:
-            _faiss_index = faiss.read_index("faiss_index/vector.index")
-            with open("faiss_index/metadata.json", "r") as f:
-                _metadata = json.load(f)
-            logger.debug("FAISS index and metadata loaded successfully")
+            # Read fully into memory once per process; faiss cannot mmap flat indexes
+            _faiss_index = faiss.read_index(os.path.join(settings.FAISS_INDEX_DIR, "vector.index"))
+            _chunk_store = ChunkStore(os.path.join(settings.FAISS_INDEX_DIR, "chunks"))
+            logger.debug("FAISS index and chunk store loaded successfully")
         except Exception as e:
             logger.warning(f"Failed to load FAISS index: {str(e)}")
             _faiss_index = None
-            _metadata = {}
-    return _faiss_index, _metadata
-
-# Initialize psychoanalytic profile
-psycho_profile = {
-    "psychoanalysis": {},
-    "about_user": {}
-}
+            _chunk_store = None
+    return _faiss_index, _chunk_store
 
 # === Emotion Analysis ===
-def analyze_emotions(user_input: str) -> Dict[str, float]:
+EMOTION_SYSTEM_PROMPT = f"""You are an emotion analysis expert.
+Analyze the emotions in the user's text and provide a confidence score for each emotion (0.0 to 1.0).
+Use exactly these emotions as keys: {", ".join(EMOTIONS)}.
+Format the response as a JSON object with emotion names as keys and confidence scores as values."""
+
+async def analyze_emotions(user_input: str) -> Dict[str, float]:
     """
-    Analyze emotions in user input using OpenAI's API
+    Analyze emotions in user input. The local classifier answers when it is confident
+    enough; otherwise the message is scored with OpenAI's API.
     """
+    scores, confidence = emotion_classifier.classify(user_input)
+    if emotion_classifier.is_decisive(user_input, scores, confidence):
+        tracer.record("analyze_emotions", inputs=user_input, outputs={"tier": "local", "emotions": scores})
+        return scores
+
     try:
-        prompt = f"""
-Analyze the emotions in the following text and provide a confidence score for each emotion (0.0 to 1.0):
-"{user_input}"
-
-Format the response as a JSON object with emotion names as keys and confidence scores as values.
-"""
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an emotion analysis expert."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=200
+        response = await llm_router.complete(
+            "emotions",
+            messages=build_prompt_messages("emotions", EMOTION_SYSTEM_PROMPT, user_input),
+            temperature=0.3
         )
         
         emotions = json.loads(response.choices[0].message.content)
-        
-        with open("emotions.txt", "w", encoding="utf-8") as f:
-            json.dump(emotions, f, indent=2)
+        tracer.record("analyze_emotions", inputs=user_input, outputs={"tier": "llm", "emotions": emotions})
 
         return emotions
     except Exception as e:
@@ -78,45 +77,59 @@ Format the response as a JSON object with emotion names as keys and confidence s
         return {}
 
 # === RAG Retrieval ===
-def retrieve_context(query: str, k: int = 3) -> List[str]:
+async def retrieve_context(query: str, k: int = 3) -> List[str]:
     """
     Retrieve relevant context from memory using semantic search
     """
-    index, metadata = get_faiss_index()
+    index, chunks = get_faiss_index()
     if index is None:
         logger.warning("FAISS index is not loaded, returning empty list")
         return []
     
     try:
-        query_embedding = get_embedding(query)
-        query_embedding = np.array(query_embedding).astype('float32')
+        query_embedding = await get_embedding(query)
+        query_embedding = np.asarray(query_embedding, dtype='float32')
         query_embedding = query_embedding.reshape(1, -1)
         
         distances, indices = index.search(query_embedding, k)
-        results = []
+        results = chunks.get_many(indices[0])
         
-        for i in range(len(indices[0])):
-            idx = indices[0][i]
-            if idx < len(metadata):
-                results.append(metadata[idx])
-        
-        with open("rag_output.txt", "w", encoding="utf-8") as f:
-            for i, chunk in enumerate(results):
-                f.write(f"Chunk {i + 1}:\n{chunk}\n\n")
+        tracer.record("retrieve_context", inputs=query, outputs=results)
 
         return results
     except Exception as e:
         logger.error(f"Error in retrieve_context: {str(e)}")
         return []
 
-# === Update Psychoanalytic Profile ===
-def update_psycho_profile(user_input: str, context_chunks: List[str]) -> None:
+async def retrieve_memories(user_id: str, query: str, k: int = 3) -> List[str]:
     """
-    Update psychoanalytic profile based on user input and context
+    Retrieve the user's own past messages most similar to the query from their vector memory
     """
     try:
-        prompt = f"""
-You are a psychoanalyst AI. Based on the user input and context, provide:
+        query_embedding = await get_embedding(query)
+        hits = await vector_memory.search(user_id, query_embedding, k)
+        results = [text for text, _ in hits]
+
+        tracer.record("retrieve_memories", inputs=query, outputs=results)
+        return results
+    except Exception as e:
+        logger.error(f"Error in retrieve_memories: {str(e)}")
+        return []
+
+# === Update Psychoanalytic Profile ===
+# Keys of profile["psychoanalysis"], in the order of the numbered prompt items below
+PROFILE_CATEGORIES = [
+    "thinking_patterns",
+    "axioms",
+    "cognitive_distortions",
+    "defense_mechanisms",
+    "maladaptive_patterns",
+    "inferred_beliefs",
+    "emotional_regulation"
+]
+
+PROFILE_SYSTEM_PROMPT = f"""You are a psychoanalytic expert. You answer only with JSON.
+Based on the user input and context, provide:
 1. Good/Bad thinking patterns
 2. Axioms or core beliefs
 3. Cognitive distortions
@@ -125,78 +138,119 @@ You are a psychoanalyst AI. Based on the user input and context, provide:
 6. Inferred beliefs / self-schema
 7. Emotional regulation patterns
 
-Input:
-{user_input}
-
-Context:
-{''.join(context_chunks[:3])}
-"""
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a psychoanalytic expert."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
-        )
-        
-        psychoanalysis_output = json.loads(response.choices[0].message.content)
-        psycho_profile["psychoanalysis"] = psychoanalysis_output
+Return a single JSON object keyed by {", ".join(PROFILE_CATEGORIES)} (items 1-7 above);
+each value maps a short observation to {{"short_term": <0.0-1.0>, "long_term": <0.0-1.0>}}.
+The current profile (Profile, same format) is given when there is one: reuse its observation
+keys verbatim for observations that still apply and only rescore them; add a new key only for
+a new observation."""
 
-        with open("psychoanalysis.txt", "w", encoding="utf-8") as f:
-            json.dump(psycho_profile["psychoanalysis"], f, indent=2)
-    except Exception as e:
-        logger.error(f"Error in update_psycho_profile: {str(e)}")
+# Score given to observations the model returned without one
+UNSCORED_TRAIT_SCORE = 0.5
 
-# === Expose profile for external use ===
-def get_psycho_profile() -> Dict[str, Dict]:
-    return psycho_profile
+def _score(value) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return min(max(float(value), 0.0), 1.0)
+    return None
+
+def validate_psychoanalysis(raw) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Coerce model output to PROFILE_CATEGORIES -> {observation: {short_term, long_term}}.
+    A bare score is used for both terms; unscored observations (plain strings, lists of
+    strings) get UNSCORED_TRAIT_SCORE. Unknown categories and unusable entries are
+    dropped. Raises ValueError when nothing usable is left.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Profile output is not a JSON object")
+    psychoanalysis = {}
+    for category in PROFILE_CATEGORIES:
+        entries = raw.get(category)
+        if isinstance(entries, str):
+            entries = [entries]
+        if isinstance(entries, list):
+            entries = {item: UNSCORED_TRAIT_SCORE for item in entries if isinstance(item, str) and item.strip()}
+        if not isinstance(entries, dict):
+            continue
+        traits = {}
+        for name, value in entries.items():
+            if isinstance(value, str):
+                name, value = f"{name}: {value}", UNSCORED_TRAIT_SCORE
+            if isinstance(value, dict):
+                short_term, long_term = _score(value.get("short_term")), _score(value.get("long_term"))
+            else:
+                short_term = long_term = _score(value)
+            if short_term is None and long_term is None:
+                continue
+            traits[str(name)] = {
+                "short_term": short_term if short_term is not None else long_term,
+                "long_term": long_term if long_term is not None else short_term
+            }
+        if traits:
+            psychoanalysis[category] = traits
+    if not psychoanalysis:
+        raise ValueError("Profile output has no usable observations")
+    return psychoanalysis
 
-@lru_cache(maxsize=100)
-def get_embedding(text: str) -> List[float]:
+async def update_psycho_profile(user_id: str,
+                                user_input: str,
+                                context_chunks: List[str],
+                                current: Optional[Dict] = None) -> Optional[Dict]:
     """
-    Get embedding for text using OpenAI's API with caching
+    Update the user's psychoanalytic profile based on user input and context.
+    The `current` psychoanalysis (loaded when not given) is sent along so the model keeps
+    its observation keys stable. Returns the new psychoanalysis, or None if the update failed.
     """
     try:
-        response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text
+        if current is None:
+            current = (await profile_store.get(user_id)).get("psychoanalysis", {})
+        response = await llm_router.complete(
+            "profile",
+            messages=build_prompt_messages(
+                "profile", PROFILE_SYSTEM_PROMPT, user_input, profile=current, chunks=context_chunks[:3]
+            ),
+            temperature=0.3
         )
-        return response.data[0].embedding
+        
+        psychoanalysis_output = validate_psychoanalysis(json.loads(response.choices[0].message.content))
+        await profile_store.update(user_id, {"psychoanalysis": psychoanalysis_output})
+
+        tracer.record("update_psycho_profile", inputs=user_input, outputs=psychoanalysis_output)
+        return psychoanalysis_output
     except Exception as e:
-        logger.error(f"Error getting embedding: {str(e)}")
-        raise
+        logger.error(f"Error in update_psycho_profile: {str(e)}")
+        return None
 
-def update_psychoanalytic_profile(user_text: str, current_profile: Dict) -> Dict:
+# === Expose profile for external use ===
+async def get_psycho_profile(user_id: str) -> Dict[str, Dict]:
+    return await profile_store.get(user_id)
+
+async def get_embedding(text: str) -> np.ndarray:
     """
-    Update psychoanalytic profile based on new user input
+    Get embedding for text via the shared micro-batching, disk-cached embedding service
     """
-    try:
-        prompt = f"""
-Analyze the following user message from a psychoanalytic perspective:
-"{user_text}"
-
-Current profile:
-{json.dumps(current_profile, indent=2)}
+    return await embedding_service.embed(text)
 
-Provide insights about:
+PROFILE_INSIGHTS_SYSTEM_PROMPT = """You are a psychoanalytic expert.
+Analyze the user's message from a psychoanalytic perspective, taking the current profile
+(Profile, compact JSON, strongest traits only) into account. Provide insights about:
 1. Defense mechanisms
 2. Transference patterns
 3. Core conflicts
 4. Emotional themes
 5. Relationship patterns
 
-Format the response as a JSON object with these keys.
-"""
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a psychoanalytic expert."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
+Format the response as a JSON object with these keys."""
+
+async def update_psychoanalytic_profile(user_text: str, current_profile: Dict) -> Dict:
+    """
+    Update psychoanalytic profile based on new user input. Only the strongest traits of
+    the current profile that fit the stage's token budget are sent.
+    """
+    try:
+        profile = {key: value for key, value in current_profile.items() if key != "last_updated"}
+        response = await llm_router.complete(
+            "profile_insights",
+            messages=build_prompt_messages("profile_insights", PROFILE_INSIGHTS_SYSTEM_PROMPT, user_text, profile=profile),
+            temperature=0.3
         )
         
         new_insights = json.loads(response.choices[0].message.content)
@@ -0,0 +1,206 @@
+# === File: chunk_store.py ===
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+from typing import Iterable, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OFFSETS_SUFFIX = ".offsets"
+BLOB_SUFFIX = ".chunks"
+
+class ChunkStore:
+    """
+    Read-only text chunks addressed by FAISS row id.
+
+    `<prefix>.chunks` holds every chunk as one contiguous UTF-8 blob and
+    `<prefix>.offsets` holds n + 1 uint64 boundaries into it. Both files are
+    memory-mapped, so opening is O(1) and only the pages that are read become resident.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._offsets = np.memmap(prefix + OFFSETS_SUFFIX, dtype=np.uint64, mode="r")
+        with open(prefix + BLOB_SUFFIX, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    @classmethod
+    def exists(cls, prefix: str) -> bool:
+        return os.path.exists(prefix + OFFSETS_SUFFIX) and os.path.exists(prefix + BLOB_SUFFIX)
+
+    def __len__(self) -> int:
+        return max(len(self._offsets) - 1, 0)
+
+    def get_bytes(self, row_id: int) -> memoryview:
+        """
+        Zero-copy view of the chunk's UTF-8 bytes.
+        """
+        if row_id < 0 or row_id >= len(self):
+            raise IndexError(f"Chunk {row_id} out of range")
+        start, end = int(self._offsets[row_id]), int(self._offsets[row_id + 1])
+        if self._blob is None:
+            return memoryview(b"")
+        return memoryview(self._blob)[start:end]
+
+    def get(self, row_id: int) -> str:
+        return str(self.get_bytes(row_id), "utf-8")
+
+    def get_many(self, row_ids: Iterable[int]) -> List[str]:
+        size = len(self)
+        return [self.get(int(row_id)) for row_id in row_ids if 0 <= row_id < size]
+
+    def close(self) -> None:
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+        self._offsets = np.zeros(1, dtype=np.uint64)
+
+class ChunkStoreWriter:
+    """
+    Appends chunks to a store, creating it if needed. The blob is written before the
+    offset that publishes it, so readers never see a partially written chunk. Opening
+    discards whatever an interrupted writer left past the last published offset.
+    """
+
+    def __init__(self, prefix: str):
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._blob = open(prefix + BLOB_SUFFIX, "ab")
+        self._offsets = open(prefix + OFFSETS_SUFFIX, "ab")
+        offsets_size = self._offsets.tell()
+        if offsets_size < 8:
+            self._offsets.truncate(0)
+            self._offsets.write(np.uint64(0).tobytes())
+            self._count = 0
+            self._end = 0
+        else:
+            # Drop a partially written offset, then the bytes no offset publishes
+            offsets_size -= offsets_size % 8
+            self._offsets.truncate(offsets_size)
+            self._count = offsets_size // 8 - 1
+            with open(prefix + OFFSETS_SUFFIX, "rb") as f:
+                f.seek(offsets_size - 8)
+                self._end = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        if self._blob.tell() > self._end:
+            self._blob.truncate(self._end)
+        self._pending: List[int] = []
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, text: str) -> int:
+        data = text.encode("utf-8")
+        self._blob.write(data)
+        self._end += len(data)
+        self._pending.append(self._end)
+        self._count += 1
+        return self._count - 1
+
+    def flush(self) -> None:
+        self._blob.flush()
+        if self._pending:
+            self._offsets.write(np.asarray(self._pending, dtype=np.uint64).tobytes())
+            self._pending.clear()
+        self._offsets.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._blob.close()
+        self._offsets.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def chunk_count(prefix: str) -> int:
+    """Number of chunks in a store without mapping it (0 when it does not exist)."""
+    try:
+        return max(os.path.getsize(prefix + OFFSETS_SUFFIX) // 8 - 1, 0)
+    except FileNotFoundError:
+        return 0
+
+# === Builder ===
+def build_from_metadata(metadata_path: str, prefix: str, field: str = "text_preview") -> int:
+    """
+    Convert a JSON list of chunk records (e.g. faiss_index/metadata.json) into a chunk store.
+    Row i of the store is record i, matching the FAISS row ids of the index built from it.
+    """
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    _remove_store(prefix)
+    with ChunkStoreWriter(prefix) as writer:
+        for record in records:
+            writer.append(record.get(field, "") if isinstance(record, dict) else str(record))
+    return len(records)
+
+async def build_from_chats(user_id: str = None, batch_size: int = 256) -> int:
+    """
+    Rebuild per-user vector memories (vectors file + chunk store) from the chats collection.
+    """
+    from app.db.mongodb import mongodb
+    from app.core.embeddings import embedding_service
+    from app.core.vector_memory import vector_memory
+
+    await mongodb.connect_to_mongo()
+    try:
+        chats = mongodb.get_collection("chats")
+        user_ids = [user_id] if user_id else await chats.distinct("user_id")
+        total = 0
+        for uid in user_ids:
+            vector_memory.reset(uid)
+            batch = []
+            cursor = chats.find({"user_id": uid}, {"message": 1}).sort("created_at", 1)
+            async for chat in cursor.batch_size(batch_size):
+                if chat.get("message"):
+                    batch.append(chat["message"])
+                if len(batch) >= batch_size:
+                    total += await _index_batch(vector_memory, embedding_service, uid, batch)
+                    batch = []
+            if batch:
+                total += await _index_batch(vector_memory, embedding_service, uid, batch)
+            logger.info(f"Indexed chat history for user {uid}")
+        return total
+    finally:
+        await mongodb.close_mongo_connection()
+
+async def _index_batch(vector_memory, embedding_service, user_id: str, texts: List[str]) -> int:
+    vectors = await embedding_service.embed_many(texts)
+    await vector_memory.append(user_id, np.vstack(vectors), texts)
+    return len(texts)
+
+def _remove_store(prefix: str) -> None:
+    for suffix in (BLOB_SUFFIX, OFFSETS_SUFFIX):
+        if os.path.exists(prefix + suffix):
+            os.remove(prefix + suffix)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build memory-mapped chunk stores for FAISS hits")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    metadata_parser = subparsers.add_parser("from-metadata", help="Convert a metadata.json chunk list")
+    metadata_parser.add_argument("metadata_path")
+    metadata_parser.add_argument("prefix", help="Output path prefix, e.g. faiss_index/chunks")
+    metadata_parser.add_argument("--field", default="text_preview")
+
+    chats_parser = subparsers.add_parser("from-chats", help="Rebuild per-user vector memory from chat history")
+    chats_parser.add_argument("--user-id", default=None)
+    chats_parser.add_argument("--batch-size", type=int, default=256)
+
+    args = parser.parse_args()
+    if args.command == "from-metadata":
+        count = build_from_metadata(args.metadata_path, args.prefix, args.field)
+    else:
+        count = asyncio.run(build_from_chats(args.user_id, args.batch_size))
+    print(f"Wrote {count} chunks")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,28 @@
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
+
+class StageRoute(BaseModel):
+    """Model routing for one LLM pipeline stage."""
+    model: str
+    fallback_model: Optional[str] = None
+    timeout_seconds: float = 30.0
+    max_tokens: int = 500
+    # Latency SLO: past this, the call is abandoned for the fallback model
+    slo_ms: Optional[float] = None
+    # Scheduler priority: "chat" calls are served before queued "background" calls
+    priority: str = "chat"
+    # Token budget for the assembled prompt; profile traits and chunks are trimmed to fit
+    prompt_budget_tokens: Optional[int] = None
+
+DEFAULT_LLM_ROUTES = {
+    "emotions": StageRoute(model="gpt-4", fallback_model="gpt-3.5-turbo", timeout_seconds=10.0, max_tokens=200, slo_ms=3000, prompt_budget_tokens=600),
+    "profile": StageRoute(model="gpt-4", fallback_model="gpt-3.5-turbo", timeout_seconds=30.0, max_tokens=500, slo_ms=15000, priority="background", prompt_budget_tokens=1500),
+    "profile_insights": StageRoute(model="gpt-4", fallback_model="gpt-3.5-turbo", timeout_seconds=30.0, max_tokens=500, slo_ms=15000, priority="background", prompt_budget_tokens=1500),
+    "response": StageRoute(model="gpt-4", fallback_model="gpt-3.5-turbo", timeout_seconds=30.0, max_tokens=500, slo_ms=8000, prompt_budget_tokens=2500),
+    "single_pass": StageRoute(model="gpt-4", timeout_seconds=40.0, max_tokens=900, prompt_budget_tokens=3000),
+    "summary": StageRoute(model="gpt-3.5-turbo", timeout_seconds=30.0, max_tokens=300, priority="background"),
+}
 
 class Settings(BaseSettings):
     # Project settings
@@ -9,6 +32,10 @@ class Settings(BaseSettings):
     # MongoDB settings
     MONGODB_URL: str = "mongodb://localhost:27017"
     DATABASE_NAME: str = "emotional_companion"
+    # Create missing declared indexes at startup (a unique index that cannot be created
+    # aborts startup); optionally log queries that scan whole collections
+    MONGO_ENSURE_INDEXES: bool = True
+    MONGO_EXPLAIN_QUERIES: bool = False
     
     # JWT settings
     JWT_SECRET_KEY: str = "your-secret-key"  # Change this in production!
@@ -21,6 +48,124 @@ class Settings(BaseSettings):
     SPOTIFY_CLIENT_ID: Optional[str] = None
     SPOTIFY_CLIENT_SECRET: Optional[str] = None
     OPENAI_API_KEY: Optional[str] = None
+    OPENAI_BASE_URL: Optional[str] = None
+    
+    # LLM routing per pipeline stage (JSON in the environment, merged over the defaults)
+    LLM_ROUTES: Dict[str, StageRoute] = {}
+    LLM_ROUTE_DEGRADE_AFTER: int = 3
+    LLM_ROUTE_COOLDOWN_SECONDS: float = 60.0
+    
+    # LLM request scheduler: local rate limits, retries, hedging and circuit breaker
+    LLM_REQUESTS_PER_MINUTE: int = 500
+    LLM_TOKENS_PER_MINUTE: int = 40000
+    LLM_MAX_RETRIES: int = 3
+    LLM_BACKOFF_BASE_SECONDS: float = 0.5
+    LLM_BACKOFF_MAX_SECONDS: float = 8.0
+    LLM_HEDGE_AFTER_MS: Optional[float] = None
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+    
+    # Chat pipeline: "multi" (separate emotion/profile/response calls) or "single" (one structured call)
+    PIPELINE_MODE: str = "multi"
+    
+    # Speculative mode: reply from the last known profile while the profile updates inline;
+    # the reply is regenerated only if a trait score moved by more than the threshold
+    SPECULATIVE_RESPONSE: bool = False
+    SPECULATIVE_SIGNIFICANCE_THRESHOLD: float = 0.3
+    
+    # Rolling conversation memory: recent turns kept verbatim, older ones folded into a summary
+    CONVERSATION_RECENT_TURNS: int = 6
+    CONVERSATION_MAX_STORED_TURNS: int = 30
+    CONVERSATION_TURN_MAX_TOKENS: int = 300
+    
+    # Deduplication of retried /chat/send requests: "memory" (per process) or "mongo" (shared)
+    SINGLE_FLIGHT_BACKEND: str = "memory"
+    # How long a stored reply answers retries with the same Idempotency-Key, or the same message without one
+    SINGLE_FLIGHT_KEY_TTL_SECONDS: float = 86400
+    SINGLE_FLIGHT_WINDOW_SECONDS: float = 30
+    SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS: float = 60
+    SINGLE_FLIGHT_POLL_INTERVAL_SECONDS: float = 0.2
+    # Most stored replies the in-memory backend keeps; the least recently used go first
+    SINGLE_FLIGHT_MAX_ENTRIES: int = 10000
+    
+    # Per-request time budget for /chat/send; clients may lower it with X-Request-Deadline-Ms
+    CHAT_DEADLINE_MS: Optional[float] = 20000
+    CHAT_DEADLINE_MAX_MS: float = 60000
+    # Time kept back for the response call when running optional stages
+    CHAT_RESPONSE_RESERVE_MS: float = 8000
+    # Page size for /chat/history and /chat/messages (clients may ask for up to the max)
+    CHAT_PAGE_SIZE: int = 50
+    CHAT_PAGE_MAX_SIZE: int = 500
+
+    # Streaming data export: documents read per cursor batch and bytes buffered per response chunk
+    EXPORT_BATCH_SIZE: int = 500
+    EXPORT_CHUNK_BYTES: int = 65536
+
+    # Bulk sentiment log ingestion: rows per unordered insert_many batch
+    SENTIMENT_BULK_BATCH_SIZE: int = 1000
+    
+    # Password hashing pool: bcrypt runs off the event loop; calls beyond workers + queue get 503
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 32
+    
+    # Authenticated user cache (per process), keyed by token subject
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 30.0
+    
+    # Psychoanalytic profile cache (per process, write-behind to MongoDB)
+    PROFILE_CACHE_SIZE: int = 1000
+    PROFILE_CACHE_TTL_SECONDS: float = 60.0
+    PROFILE_FLUSH_INTERVAL_SECONDS: float = 2.0
+    
+    # Background job queue ("memory" or "mongo")
+    JOB_QUEUE_BACKEND: str = "memory"
+    JOB_QUEUE_WORKERS: int = 2
+    JOB_QUEUE_MAX_PENDING: int = 1000
+    JOB_QUEUE_POLL_INTERVAL_SECONDS: float = 0.5
+    JOB_QUEUE_DRAIN_TIMEOUT_SECONDS: float = 10.0
+    # A failed job is retried up to JOB_QUEUE_MAX_ATTEMPTS runs in total, waiting
+    # JOB_QUEUE_RETRY_DELAY_SECONDS, doubled after each attempt
+    JOB_QUEUE_MAX_ATTEMPTS: int = 3
+    JOB_QUEUE_RETRY_DELAY_SECONDS: float = 30.0
+    # Mongo backend: jobs that failed for good are kept this long for inspection
+    JOB_QUEUE_FAILED_TTL_SECONDS: int = 604800
+    # Mongo backend: a running job whose worker sent no heartbeat for this long is requeued
+    JOB_QUEUE_STALE_AFTER_SECONDS: float = 300.0
+    
+    # Pipeline tracing (sink: "none", "jsonl" or "mongo")
+    TRACE_ENABLED: bool = False
+    TRACE_BUFFER_SIZE: int = 1000
+    TRACE_SINK: str = "none"
+    TRACE_JSONL_PATH: str = "traces.jsonl"
+    TRACE_FLUSH_INTERVAL_SECONDS: float = 5.0
+    TRACE_CAPPED_COLLECTION_BYTES: int = 16 * 1024 * 1024
+    # Accounts allowed to read every user's traces and the stage metrics; everyone else only sees their own traces
+    TRACE_ADMIN_EMAILS: List[str] = []
+    
+    # Local emotion classifier (the LLM is only called below the confidence threshold)
+    EMOTION_LOCAL_CONFIDENCE_THRESHOLD: float = 0.6
+    # Lexicon cues for the top emotion required (and none for another) before skipping the LLM;
+    # calibrated with `python -m app.core.emotion_eval` (add --llm to compare with the LLM tier)
+    EMOTION_LOCAL_MIN_CUES: int = 2
+    EMOTION_HASH_FEATURES: int = 2 ** 16
+    EMOTION_MODEL_PATH: Optional[str] = None
+    
+    # Embeddings (micro-batched, cached on disk by content hash)
+    EMBEDDING_MODEL: str = "text-embedding-ada-002"
+    EMBEDDING_BATCH_WINDOW_MS: float = 10.0
+    EMBEDDING_MAX_BATCH: int = 64
+    EMBEDDING_CACHE_PATH: str = "data/embeddings.sqlite3"
+    EMBEDDING_MEMORY_CACHE_SIZE: int = 1000
+    
+    # Shared knowledge index (vector.index + chunk store built by app.core.chunk_store)
+    FAISS_INDEX_DIR: str = "faiss_index"
+    
+    # Per-user vector memory used for RAG retrieval
+    RAG_ENABLED: bool = True
+    RAG_TOP_K: int = 3
+    VECTOR_MEMORY_DIR: str = "data/vector_memory"
+    VECTOR_MEMORY_MAX_OPEN: int = 256
+    VECTOR_MEMORY_IDLE_SECONDS: float = 900.0
     
     # Encryption key for sensitive data
     ENCRYPTION_KEY: str = "your-encryption-key-32bytes-long!!"  # 32 bytes for Fernet
@@ -28,4 +173,7 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
 
+    def stage_route(self, stage: str) -> StageRoute:
+        return self.LLM_ROUTES.get(stage) or DEFAULT_LLM_ROUTES[stage]
+
 settings = Settings() 
\ No newline at end of file
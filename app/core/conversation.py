@@ -0,0 +1,162 @@
+# === File: conversation.py ===
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.core.llm import llm_router
+from app.core.tokens import count_tokens, truncate_tokens
+from app.core.tracing import tracer
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+class ConversationState:
+    __slots__ = ("summary", "turns")
+
+    def __init__(self, summary: str = "", turns: Optional[List[Dict]] = None):
+        self.summary = summary
+        self.turns = turns or []
+
+    def to_messages(self) -> List[Dict[str, str]]:
+        """
+        Chat messages carrying the running summary and the recent turns, oldest first.
+        """
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn["message"]})
+            messages.append({"role": "assistant", "content": turn["response"]})
+        return messages
+
+class ConversationMemory:
+    """
+    Bounded per-user conversation state in MongoDB: the last `recent_turns` turns are
+    kept verbatim (each capped at `turn_max_tokens`) and older turns are folded into
+    a running summary by a background job, so the prompt size stays constant however
+    long the conversation runs. Turns are only ever removed by folding them; when
+    summarization falls behind by more than `max_stored_turns`, the next append folds
+    inline instead of dropping unsummarized turns.
+    """
+
+    def __init__(self,
+                 collection_name: str = "conversation_state",
+                 recent_turns: int = settings.CONVERSATION_RECENT_TURNS,
+                 max_stored_turns: int = settings.CONVERSATION_MAX_STORED_TURNS,
+                 turn_max_tokens: int = settings.CONVERSATION_TURN_MAX_TOKENS):
+        self.collection_name = collection_name
+        self.recent_turns = recent_turns
+        self.max_stored_turns = max_stored_turns
+        self.turn_max_tokens = turn_max_tokens
+
+    @property
+    def collection(self):
+        return mongodb.get_collection(self.collection_name)
+
+    async def load(self, user_id: str) -> ConversationState:
+        doc = await self.collection.find_one(
+            {"user_id": user_id},
+            {"summary": 1, "turns": {"$slice": -self.recent_turns}}
+        )
+        if doc is None:
+            return ConversationState()
+        return ConversationState(doc.get("summary", ""), doc.get("turns", []))
+
+    async def append(self, user_id: str, message: str, response: str) -> bool:
+        """
+        Record one turn. Returns True when older turns are waiting to be folded into the summary.
+        """
+        turn = {
+            "id": ObjectId(),
+            "message": truncate_tokens(message, self.turn_max_tokens),
+            "response": truncate_tokens(response, self.turn_max_tokens),
+            "created_at": datetime.utcnow()
+        }
+        doc = await self.collection.find_one_and_update(
+            {"user_id": user_id},
+            {
+                "$push": {"turns": turn},
+                "$setOnInsert": {"summary": ""},
+                "$set": {"updated_at": datetime.utcnow()}
+            },
+            projection={"turns.id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        stored = len(doc.get("turns", []))
+        if stored > self.max_stored_turns:
+            # The summary job fell behind: fold now rather than let the document grow
+            return not await self.fold(user_id)
+        return stored > self.recent_turns
+
+    async def fold(self, user_id: str) -> bool:
+        """
+        Fold every turn older than the recent window into the running summary.
+        Returns False when turns are still waiting to be folded.
+        """
+        doc = await self.collection.find_one({"user_id": user_id}, {"summary": 1, "turns": 1})
+        if doc is None:
+            return True
+        overflow = doc.get("turns", [])[:-self.recent_turns]
+        if not overflow:
+            return True
+
+        previous = doc.get("summary", "")
+        summary = await summarize_turns(previous, overflow)
+        if summary is None:
+            # Keep the turns; the next fold retries them
+            return False
+
+        # Conditional on the summary we started from, so a concurrent fold is never lost
+        result = await self.collection.update_one(
+            {"user_id": user_id, "summary": previous},
+            {
+                "$set": {"summary": summary, "updated_at": datetime.utcnow()},
+                "$pull": {"turns": {"id": {"$in": [turn["id"] for turn in overflow]}}}
+            }
+        )
+        if result.modified_count == 0:
+            logger.info(f"Conversation summary for user {user_id} changed during fold, skipping")
+            return False
+        return True
+
+async def summarize_turns(summary: str, turns: List[Dict]) -> Optional[str]:
+    """
+    Update the running summary with the given turns. Returns None if the model call fails.
+    """
+    transcript = "\n".join(f"User: {turn['message']}\nTherapist: {turn['response']}" for turn in turns)
+    prompt = f"""
+Current summary of the conversation so far:
+{summary or "(none)"}
+
+New exchanges to fold in:
+{transcript}
+
+Rewrite the summary so it also covers the new exchanges. Keep the topics, events, feelings
+and commitments the user mentioned; drop small talk. Answer with the summary only.
+"""
+    try:
+        response = await llm_router.complete(
+            "summary",
+            messages=[
+                {"role": "system", "content": "You maintain a concise running summary of a therapy conversation."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2
+        )
+    except Exception as e:
+        logger.error(f"Error in summarize_turns: {str(e)}")
+        return None
+
+    new_summary = (response.choices[0].message.content or "").strip()
+    tracer.record("summarize_turns", inputs={"turns": len(turns)}, outputs={
+        "summary": new_summary,
+        "summary_tokens": count_tokens(new_summary)
+    })
+    return new_summary or None
+
+conversation_memory = ConversationMemory()
@@ -0,0 +1,98 @@
+# === File: deadline.py ===
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, List, Optional, TypeVar
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when a stage is started after the request's deadline has passed."""
+
+class Deadline:
+    """
+    Time budget for one chat request, plus the stages that were skipped or cut
+    short to stay within it.
+    """
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000
+        self.skipped_stages: List[str] = []
+        self.degraded = False
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def clamp(self, timeout: float) -> float:
+        return min(timeout, self.remaining())
+
+    def skip(self, stage: str) -> None:
+        if stage not in self.skipped_stages:
+            self.skipped_stages.append(stage)
+        metrics.increment("deadline", f"skipped:{stage}")
+
+    def degrade(self) -> None:
+        self.degraded = True
+        metrics.increment("deadline", "degraded")
+
+deadline_var: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    return deadline_var.get()
+
+def resolve_budget_ms(header_value: Optional[float]) -> Optional[float]:
+    """
+    Budget for a request: the client's X-Request-Deadline-Ms header when given
+    (capped at CHAT_DEADLINE_MAX_MS), otherwise CHAT_DEADLINE_MS.
+    """
+    if header_value is not None and header_value > 0:
+        return min(header_value, settings.CHAT_DEADLINE_MAX_MS)
+    return settings.CHAT_DEADLINE_MS
+
+@contextmanager
+def deadline_scope(budget_ms: Optional[float]):
+    """
+    Make a Deadline visible to every stage awaited inside the block.
+    Yields None (and imposes no budget) when `budget_ms` is None.
+    """
+    deadline = Deadline(budget_ms) if budget_ms else None
+    token = deadline_var.set(deadline)
+    try:
+        yield deadline
+    finally:
+        deadline_var.reset(token)
+
+async def optional_stage(stage: str, coro: Awaitable[T], default: T) -> T:
+    """
+    Run a stage the reply can do without. It only gets the time that is left after
+    reserving CHAT_RESPONSE_RESERVE_MS for the response, and returns `default` when
+    it is skipped or cut short.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return await coro
+
+    available = deadline.remaining() - settings.CHAT_RESPONSE_RESERVE_MS / 1000
+    if available <= 0:
+        coro.close()
+        deadline.skip(stage)
+        return default
+    try:
+        return await asyncio.wait_for(coro, timeout=available)
+    except asyncio.TimeoutError:
+        logger.info(f"Stage {stage} cut short by the request deadline")
+        deadline.skip(stage)
+        return default
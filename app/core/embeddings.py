@@ -0,0 +1,228 @@
+# === File: embeddings.py ===
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import openai
+
+from app.core.config import settings
+from app.core.llm import client as llm_client
+from app.core.metrics import metrics
+from app.core.scheduler import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+def content_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingStore:
+    """
+    On-disk embedding cache keyed by content hash. SQLite in WAL mode lets every
+    worker process on the host share the same file safely.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        if not keys:
+            return {}
+        with self._lock:
+            conn = self._connection()
+            found = {}
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            return found
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        if not items:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+            )
+            conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class EmbeddingService:
+    """
+    Embeds text with a persistent cache and request micro-batching.
+
+    Calls that arrive within `batch_window_ms` of each other are resolved together:
+    cached vectors come from memory or the on-disk store, and all misses go to the
+    API in a single batched request. Identical in-flight texts share one result. When
+    the API rejects a batch's input, the batch is split until the rejected texts are
+    isolated, so only their callers get the error.
+    """
+
+    def __init__(self,
+                 client=None,
+                 model: str = settings.EMBEDDING_MODEL,
+                 store: Optional[EmbeddingStore] = None,
+                 batch_window_ms: float = settings.EMBEDDING_BATCH_WINDOW_MS,
+                 max_batch: int = settings.EMBEDDING_MAX_BATCH,
+                 memory_cache_size: int = settings.EMBEDDING_MEMORY_CACHE_SIZE):
+        self.client = client or llm_client
+        self.model = model
+        self.store = store or EmbeddingStore(settings.EMBEDDING_CACHE_PATH)
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self.memory_cache_size = memory_cache_size
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._batch: List[Tuple[str, str]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def embed(self, text: str) -> np.ndarray:
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        futures = [self._enqueue(text) for text in texts]
+        # Futures are shared with concurrent callers; a cancelled caller must not cancel them
+        return list(await asyncio.shield(asyncio.gather(*futures)))
+
+    def _enqueue(self, text: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        key = content_key(self.model, text)
+
+        cached = self._memory.get(key)
+        if cached is not None:
+            self._memory.move_to_end(key)
+            future = loop.create_future()
+            future.set_result(cached)
+            return future
+
+        future = self._inflight.get(key)
+        if future is not None:
+            return future
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        self._batch.append((key, text))
+        if len(self._batch) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            # Keep collecting until the window closes
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.create_task(self._resolve(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, misses: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, np.ndarray]], Dict[str, Exception]]:
+        """
+        Embed `misses` via the API. Returns the fetched vectors and, for texts the API
+        rejected, their error; a rejected batch is split in half and retried.
+        """
+        started = time.perf_counter()
+        inputs = [text for _, text in misses]
+        try:
+            response = await llm_scheduler.submit(
+                lambda: self.client.embeddings.create(model=self.model, input=inputs),
+                estimated_tokens=sum(len(text) for text in inputs) // 4
+            )
+        except openai.BadRequestError as e:
+            metrics.observe("embeddings", (time.perf_counter() - started) * 1000, model=self.model, ok=False)
+            if len(misses) == 1:
+                return [], {misses[0][0]: e}
+            middle = len(misses) // 2
+            (left, left_errors), (right, right_errors) = await asyncio.gather(
+                self._fetch(misses[:middle]), self._fetch(misses[middle:])
+            )
+            return left + right, {**left_errors, **right_errors}
+        metrics.observe("embeddings", (time.perf_counter() - started) * 1000, model=self.model)
+        fetched = [
+            (key, np.asarray(item.embedding, dtype=np.float32))
+            for (key, _), item in zip(misses, sorted(response.data, key=lambda d: d.index))
+        ]
+        return fetched, {}
+
+    async def _resolve(self, batch: List[Tuple[str, str]]) -> None:
+        if not batch:
+            return
+        errors: Dict[str, Exception] = {}
+        try:
+            keys = [key for key, _ in batch]
+            vectors = await asyncio.to_thread(self.store.get_many, keys)
+            misses = [(key, text) for key, text in batch if key not in vectors]
+            if misses:
+                fetched, errors = await self._fetch(misses)
+                vectors.update(fetched)
+                await asyncio.to_thread(self.store.put_many, fetched)
+                logger.debug(f"Embedded {len(fetched)} text(s) via API, {len(batch) - len(misses)} from cache")
+                if errors:
+                    logger.error(f"Embedding API rejected {len(errors)} of {len(misses)} text(s): {str(next(iter(errors.values())))}")
+        except Exception as e:
+            logger.error(f"Error getting embeddings: {str(e)}")
+            for key, _ in batch:
+                future = self._inflight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        for key, _ in batch:
+            future = self._inflight.pop(key, None)
+            if key in errors:
+                if future is not None and not future.done():
+                    future.set_exception(errors[key])
+                continue
+            vector = vectors[key]
+            self._remember(key, vector)
+            if future is not None and not future.done():
+                future.set_result(vector)
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_cache_size:
+            self._memory.popitem(last=False)
+
+    def close(self) -> None:
+        self.store.close()
+
+embedding_service = EmbeddingService()
@@ -0,0 +1,186 @@
+# === File: emotion_classifier.py ===
+import logging
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.user import Emotion
+
+logger = logging.getLogger(__name__)
+
+EMOTIONS: List[str] = [emotion.value for emotion in Emotion]
+
+# Seed lexicon used when no trained weights are available
+EMOTION_LEXICON: Dict[str, List[str]] = {
+    "angry": [
+        "angry", "anger", "mad", "furious", "annoyed", "irritated", "pissed", "rage",
+        "hate", "frustrated", "frustrating", "resent", "outraged", "fed up", "sick of"
+    ],
+    "disgust": [
+        "disgust", "disgusted", "disgusting", "gross", "revolting", "nasty", "repulsed",
+        "sickening", "vile", "yuck", "ashamed of", "can't stand"
+    ],
+    "fear": [
+        "afraid", "scared", "fear", "terrified", "anxious", "anxiety", "worried", "worry",
+        "nervous", "panic", "panicking", "frightened", "dread", "uneasy", "overwhelmed"
+    ],
+    "joy": [
+        "happy", "glad", "joy", "excited", "great", "wonderful", "amazing", "love",
+        "grateful", "thankful", "proud", "relieved", "awesome", "fantastic", "delighted"
+    ],
+    "neutral": [
+        "okay", "ok", "fine", "alright", "normal", "usual", "nothing much", "so so"
+    ],
+    "sadness": [
+        "sad", "unhappy", "depressed", "down", "lonely", "alone", "cry", "crying", "hurt",
+        "miserable", "heartbroken", "hopeless", "grief", "lost", "empty", "tired of"
+    ],
+    "surprise": [
+        "surprised", "surprise", "shocked", "unexpected", "wow", "suddenly", "can't believe",
+        "astonished", "amazed", "shock"
+    ]
+}
+
+NEGATIONS = {"not", "no", "never", "don't", "dont", "isn't", "wasn't", "aren't", "didn't", "can't"}
+
+_TOKEN_RE = re.compile(r"[a-z']+")
+
+def tokenize(text: str) -> List[str]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    # Mark the word following a negation so "not happy" does not count as joy
+    marked = []
+    negate = False
+    for token in tokens:
+        marked.append(f"not_{token}" if negate else token)
+        negate = token in NEGATIONS
+    return marked
+
+class EmotionClassifier:
+    """
+    In-process emotion scorer: a linear model over hashed unigrams and bigrams.
+
+    Weights come from an optional `.npz` file (arrays `weights` and `bias`); otherwise
+    they are seeded from EMOTION_LEXICON with a small prior towards neutral, so text
+    without any emotional cue gets a low confidence and falls through to the LLM.
+    """
+
+    def __init__(self, n_features: int = settings.EMOTION_HASH_FEATURES, model_path: Optional[str] = None):
+        self.n_features = n_features
+        if model_path and os.path.exists(model_path):
+            data = np.load(model_path)
+            self.weights = data["weights"].astype(np.float32)
+            self.bias = data["bias"].astype(np.float32)
+            self.n_features = self.weights.shape[0]
+            logger.debug(f"Loaded emotion model weights from {model_path}")
+        else:
+            self.weights, self.bias = self._lexicon_weights()
+        self._cue_buckets, self._cue_emotions = self._cue_index()
+
+    def _hash(self, feature: str) -> int:
+        # crc32 is stable across processes, unlike the builtin hash()
+        return zlib.crc32(feature.encode("utf-8")) % self.n_features
+
+    def features(self, text: str) -> np.ndarray:
+        tokens = tokenize(text)
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return np.fromiter((self._hash(gram) for gram in grams), dtype=np.int64, count=len(grams))
+
+    def _cue_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sorted feature buckets of the lexicon terms, and for each bucket a row with the
+        number of cues of every emotion it holds, for counting explicit cues.
+        """
+        cues: Dict[int, np.ndarray] = {}
+        for column, emotion in enumerate(EMOTIONS):
+            for term in EMOTION_LEXICON[emotion]:
+                bucket = self._hash(" ".join(tokenize(term)))
+                cues.setdefault(bucket, np.zeros(len(EMOTIONS), dtype=np.int32))[column] = 1
+        buckets = np.array(sorted(cues), dtype=np.int64)
+        emotions = np.array([cues[bucket] for bucket in buckets], dtype=np.int32).reshape(-1, len(EMOTIONS))
+        return buckets, emotions
+
+    def _lexicon_weights(self) -> Tuple[np.ndarray, np.ndarray]:
+        weights = np.zeros((self.n_features, len(EMOTIONS)), dtype=np.float32)
+        for column, emotion in enumerate(EMOTIONS):
+            for term in EMOTION_LEXICON[emotion]:
+                term_tokens = tokenize(term)
+                weights[self._hash(" ".join(term_tokens)), column] += 3.0
+                # A negated cue ("not happy") counts against the emotion instead of for it
+                if len(term_tokens) == 1:
+                    weights[self._hash(f"not_{term_tokens[0]}"), column] -= 1.5
+        bias = np.zeros(len(EMOTIONS), dtype=np.float32)
+        bias[EMOTIONS.index(Emotion.NEUTRAL.value)] = 1.0
+        return weights, bias
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        shifted = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(shifted)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        return self._softmax(self.weights[self.features(text)].sum(axis=0) + self.bias)
+
+    def predict_proba_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Score many texts at once; returns an array of shape (len(texts), len(EMOTIONS)).
+        """
+        if not texts:
+            return np.zeros((0, len(EMOTIONS)), dtype=np.float32)
+        feature_rows = [self.features(text) for text in texts]
+        lengths = np.array([len(row) for row in feature_rows])
+        logits = np.tile(self.bias, (len(texts), 1))
+        if lengths.sum():
+            rows = np.repeat(np.arange(len(texts)), lengths)
+            np.add.at(logits, rows, self.weights[np.concatenate(feature_rows)])
+        return self._softmax(logits)
+
+    def classify(self, text: str) -> Tuple[Dict[str, float], float]:
+        """
+        Return ({emotion: score}, confidence) where confidence is the top score.
+        """
+        probs = self.predict_proba(text)
+        return self._scores(probs), float(probs.max())
+
+    def classify_batch(self, texts: List[str]) -> List[Tuple[Dict[str, float], float]]:
+        probs = self.predict_proba_batch(texts)
+        return [(self._scores(row), float(row.max())) for row in probs]
+
+    def cue_counts(self, text: str) -> Dict[str, int]:
+        """
+        Number of (non-negated) lexicon cues for each emotion found in `text`.
+        """
+        features = self.features(text)
+        rows = np.minimum(np.searchsorted(self._cue_buckets, features), len(self._cue_buckets) - 1)
+        rows = rows[self._cue_buckets[rows] == features]
+        counts = self._cue_emotions[rows].sum(axis=0)
+        return {emotion: int(count) for emotion, count in zip(EMOTIONS, counts)}
+
+    def is_decisive(self,
+                    text: str,
+                    scores: Dict[str, float],
+                    confidence: float,
+                    threshold: float = settings.EMOTION_LOCAL_CONFIDENCE_THRESHOLD,
+                    min_cues: int = settings.EMOTION_LOCAL_MIN_CUES) -> bool:
+        """
+        Whether the local result can be used without asking the LLM: confident, backed by
+        at least `min_cues` cues for the top emotion and no cue for any other emotion.
+        A single cue is too easily contradicted by context ("Great, I got fired").
+        """
+        if confidence < threshold:
+            return False
+        top = max(scores, key=scores.get)
+        counts = self.cue_counts(text)
+        if counts[top] < min_cues:
+            return False
+        return all(count == 0 for emotion, count in counts.items() if emotion != top)
+
+    @staticmethod
+    def _scores(probs: np.ndarray) -> Dict[str, float]:
+        return {emotion: round(float(p), 4) for emotion, p in zip(EMOTIONS, probs)}
+
+emotion_classifier = EmotionClassifier(model_path=settings.EMOTION_MODEL_PATH)
@@ -0,0 +1,134 @@
+# === File: emotion_eval.py ===
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.emotion_classifier import EMOTIONS, emotion_classifier
+
+# Hand-labelled messages, including mixed and sarcastic ones that a single cue gets wrong
+LABELLED_EXAMPLES: List[Tuple[str, str]] = [
+    ("I'm so angry and frustrated with my boss, he keeps ignoring me", "angry"),
+    ("I'm furious, I hate how they treated me", "angry"),
+    ("I'm fed up and pissed off at my roommate", "angry"),
+    ("He lied to me again and I'm mad", "angry"),
+    ("It is so frustrating, I'm annoyed all the time", "angry"),
+    ("Great, I got fired today", "angry"),
+    ("Thanks a lot for nothing, really wonderful service", "angry"),
+    ("That was disgusting and gross, I felt repulsed", "disgust"),
+    ("I'm disgusted by what he did, it's vile", "disgust"),
+    ("The whole thing was revolting and nasty", "disgust"),
+    ("I can't stand myself, I'm ashamed of what I did", "disgust"),
+    ("I'm scared and anxious about the exam tomorrow", "fear"),
+    ("I'm terrified and worried something bad will happen", "fear"),
+    ("My anxiety is through the roof, I keep panicking", "fear"),
+    ("I feel nervous and uneasy about the surgery", "fear"),
+    ("What if they find out, I can't sleep thinking about it", "fear"),
+    ("I'm afraid to be alone at night", "fear"),
+    ("I'm so happy and grateful for my friends", "joy"),
+    ("Today was wonderful, I feel proud and excited", "joy"),
+    ("I got the job! I'm thrilled and so glad", "joy"),
+    ("Feeling relieved and thankful after the results", "joy"),
+    ("I had an amazing day with my family, I love them", "joy"),
+    ("We laughed all evening, it was the best", "joy"),
+    ("I'm okay, nothing much happened today", "neutral"),
+    ("Things are fine, just the usual routine", "neutral"),
+    ("I went to the store and then came home", "neutral"),
+    ("Work was normal, alright I guess", "neutral"),
+    ("I had lunch and watched a show", "neutral"),
+    ("I feel sad and lonely since she left", "sadness"),
+    ("I'm depressed and hopeless, crying every night", "sadness"),
+    ("I love my mom but she died yesterday", "sadness"),
+    ("I miss him so much, everything feels empty", "sadness"),
+    ("I'm heartbroken and miserable", "sadness"),
+    ("I'm not happy at all, I feel down", "sadness"),
+    ("I feel so alone and hurt", "sadness"),
+    ("Nobody called on my birthday", "sadness"),
+    ("Wow I'm shocked, I can't believe she said that", "surprise"),
+    ("I was so surprised, it was completely unexpected", "surprise"),
+    ("Suddenly they announced the merger, I'm astonished", "surprise"),
+    ("What a shock, I never saw that coming", "surprise"),
+    ("I'm amazed and surprised by the news", "surprise"),
+]
+
+def load_examples(path: str) -> List[Tuple[str, str]]:
+    """
+    Read labelled examples from a JSONL file of {"text": ..., "label": ...} records.
+    """
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                examples.append((record["text"], record["label"]))
+    return examples
+
+def evaluate_local(examples: List[Tuple[str, str]],
+                   threshold: float = settings.EMOTION_LOCAL_CONFIDENCE_THRESHOLD,
+                   min_cues: int = settings.EMOTION_LOCAL_MIN_CUES) -> Dict[str, float]:
+    """
+    Coverage (share of messages answered locally), accuracy on those messages and mean
+    latency of the local tier at the given gate settings.
+    """
+    answered = correct = 0
+    started = time.perf_counter()
+    for text, label in examples:
+        scores, confidence = emotion_classifier.classify(text)
+        if emotion_classifier.is_decisive(text, scores, confidence, threshold, min_cues):
+            answered += 1
+            correct += max(scores, key=scores.get) == label
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return {
+        "coverage": answered / len(examples),
+        "accuracy": correct / answered if answered else 0.0,
+        "latency_ms": elapsed_ms / len(examples)
+    }
+
+async def evaluate_llm(examples: List[Tuple[str, str]]) -> Dict[str, float]:
+    """
+    Accuracy and mean latency of the LLM tier on every example (makes one call per example).
+    """
+    from app.core.analyzer import EMOTION_SYSTEM_PROMPT
+    from app.core.llm import llm_router
+    from app.core.prompts import build_prompt_messages
+
+    correct = 0
+    latencies = []
+    for text, label in examples:
+        started = time.perf_counter()
+        response = await llm_router.complete(
+            "emotions",
+            messages=build_prompt_messages("emotions", EMOTION_SYSTEM_PROMPT, text),
+            temperature=0.3
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        try:
+            scores = json.loads(response.choices[0].message.content)
+            correct += max(scores, key=scores.get) == label
+        except (ValueError, TypeError):
+            pass
+    return {"coverage": 1.0, "accuracy": correct / len(examples), "latency_ms": sum(latencies) / len(latencies)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the local emotion classifier with the LLM on labelled messages")
+    parser.add_argument("--examples", help="JSONL file of {\"text\", \"label\"} records (default: built-in set)")
+    parser.add_argument("--llm", action="store_true", help="Also score every example with the LLM")
+    args = parser.parse_args()
+    examples = load_examples(args.examples) if args.examples else LABELLED_EXAMPLES
+    unknown = {label for _, label in examples} - set(EMOTIONS)
+    if unknown:
+        parser.error(f"Unknown labels: {sorted(unknown)}")
+
+    print(f"{'tier':<22} {'coverage':>8} {'accuracy':>8} {'latency':>10}")
+    for min_cues in (1, 2, 3):
+        for threshold in (0.5, 0.6, 0.7, 0.8):
+            result = evaluate_local(examples, threshold, min_cues)
+            print(f"local t={threshold:.1f} cues>={min_cues:<3} {result['coverage']:>8.0%} {result['accuracy']:>8.0%} {result['latency_ms']:>8.2f}ms")
+    if args.llm:
+        result = asyncio.run(evaluate_llm(examples))
+        print(f"{'llm':<22} {result['coverage']:>8.0%} {result['accuracy']:>8.0%} {result['latency_ms']:>8.0f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# === File: export.py ===
+import logging
+import zlib
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from cryptography.fernet import InvalidToken
+
+from app.core.config import settings
+from app.core.security import decrypt_data
+from app.db.mongodb import mongodb
+from app.db.pagination import dump_document
+
+logger = logging.getLogger(__name__)
+
+def _decrypt_trait(doc: Dict) -> Dict:
+    try:
+        doc["trait_value"] = decrypt_data(doc["trait_value"])
+    except (InvalidToken, KeyError, AttributeError):
+        logger.warning(f"Could not decrypt memory trait {doc.get('_id')} for export")
+        doc["trait_value"] = None
+    return doc
+
+# (record type, collection, time field, per-document transform)
+EXPORT_SOURCES: List[Tuple[str, str, str, Optional[Callable[[Dict], Dict]]]] = [
+    ("chat", "chats", "created_at", None),
+    ("session", "chat_sessions", "start_time", None),
+    ("sentiment_log", "sentiment_logs", "timestamp", None),
+    ("memory_trait", "long_term_memory", "last_updated", _decrypt_trait),
+]
+
+async def export_lines(user: Dict, batch_size: int = settings.EXPORT_BATCH_SIZE) -> AsyncIterator[str]:
+    """
+    One NDJSON line per record: the user first, then every chat, session, sentiment
+    log and (decrypted) memory trait, oldest first. Each collection is read once,
+    `batch_size` documents at a time.
+    """
+    account = {key: value for key, value in user.items() if key != "hashed_password"}
+    yield dump_document({"type": "user", "data": account}) + "\n"
+
+    user_id = str(user["_id"])
+    for record_type, collection_name, time_field, transform in EXPORT_SOURCES:
+        cursor = mongodb.get_collection(collection_name).find(
+            {"user_id": user_id}
+        ).sort(time_field, 1).batch_size(batch_size)
+        async for doc in cursor:
+            if transform is not None:
+                doc = transform(doc)
+            yield dump_document({"type": record_type, "data": doc}) + "\n"
+
+async def export_stream(user: Dict,
+                        compress: bool = False,
+                        chunk_bytes: int = settings.EXPORT_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    """
+    The user's export as response chunks of roughly `chunk_bytes`, gzip-compressed on
+    the fly when `compress` is set. Only one chunk is held in memory at a time.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer: List[bytes] = []
+    size = 0
+    async for line in export_lines(user):
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b"".join(buffer)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,389 @@
+# === File: jobs.py ===
+import asyncio
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[str, List[Any]], Awaitable[None]]
+
+class QueueFullError(Exception):
+    """Raised when a job cannot be accepted because the queue is saturated or shutting down."""
+
+class Job:
+    __slots__ = ("id", "kind", "key", "items", "attempts", "not_before")
+
+    def __init__(self,
+                 kind: str,
+                 key: str,
+                 items: List[Any],
+                 id: Optional[str] = None,
+                 attempts: int = 0,
+                 not_before: float = 0.0):
+        self.id = id or uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.items = items
+        # Runs that already failed, and (in-memory backend) the monotonic time a retry may start
+        self.attempts = attempts
+        self.not_before = not_before
+
+# === Backends ===
+class JobBackend(ABC):
+    """
+    Storage for pending jobs. Pushing a job whose (kind, key) is already pending
+    coalesces the new item into it instead of creating a second job, and a key is
+    never popped while a job for it is running.
+    """
+
+    # Seconds between heartbeats of a running job, or None when the backend needs none
+    heartbeat_interval: Optional[float] = None
+
+    async def start(self) -> None:
+        pass
+
+    @abstractmethod
+    async def push(self, kind: str, key: str, item: Any) -> bool:
+        """Queue an item; returns False when it was merged into an existing pending job."""
+
+    @abstractmethod
+    async def pop(self) -> Optional[Job]:
+        """Claim the oldest runnable job, or return None when there is nothing to run."""
+
+    @abstractmethod
+    async def complete(self, job: Job) -> None:
+        pass
+
+    @abstractmethod
+    async def fail(self, job: Job, retry_delay: Optional[float]) -> None:
+        """
+        Record a failed run. With a `retry_delay` the items go back to the key's pending
+        job (runnable after the delay, with `attempts` counted); with None they are dropped.
+        """
+
+    async def heartbeat(self, job: Job) -> None:
+        pass
+
+    @abstractmethod
+    async def pending_count(self) -> int:
+        pass
+
+class InMemoryJobBackend(JobBackend):
+    """
+    Process-local backend. Jobs for a key never run concurrently: while one is
+    running, new items for the same key accumulate in the next pending job.
+    """
+
+    def __init__(self):
+        self._pending: "OrderedDict[Tuple[str, str], Job]" = OrderedDict()
+        self._running = set()
+
+    async def push(self, kind: str, key: str, item: Any) -> bool:
+        job = self._pending.get((kind, key))
+        if job is not None:
+            job.items.append(item)
+            return False
+        self._pending[(kind, key)] = Job(kind, key, [item])
+        return True
+
+    async def pop(self) -> Optional[Job]:
+        now = time.monotonic()
+        for job_key, job in self._pending.items():
+            if job_key not in self._running and job.not_before <= now:
+                del self._pending[job_key]
+                self._running.add(job_key)
+                return job
+        return None
+
+    async def complete(self, job: Job) -> None:
+        self._running.discard((job.kind, job.key))
+
+    async def fail(self, job: Job, retry_delay: Optional[float]) -> None:
+        self._running.discard((job.kind, job.key))
+        if retry_delay is None:
+            return
+        not_before = time.monotonic() + retry_delay
+        pending = self._pending.get((job.kind, job.key))
+        if pending is None:
+            self._pending[(job.kind, job.key)] = Job(job.kind, job.key, job.items, attempts=job.attempts, not_before=not_before)
+            return
+        # The failed items are older than the ones that arrived while it ran
+        pending.items[:0] = job.items
+        pending.attempts = max(pending.attempts, job.attempts)
+        pending.not_before = max(pending.not_before, not_before)
+
+    async def pending_count(self) -> int:
+        return len(self._pending)
+
+class MongoJobBackend(JobBackend):
+    """
+    Persistent backend storing jobs in a MongoDB collection so they survive restarts
+    and can be shared between workers. Coalescing is an atomic upsert on the pending
+    job, and the running_job_per_key unique index keeps two workers from running the
+    same key. Running jobs send heartbeats; a job whose worker stopped sending them is
+    requeued. Jobs that failed for good are kept with an `expires_at` TTL.
+    """
+
+    # How long a pending_count result is reused for backpressure checks
+    COUNT_CACHE_SECONDS = 1.0
+
+    def __init__(self,
+                 collection_name: str = "jobs",
+                 stale_after_seconds: float = settings.JOB_QUEUE_STALE_AFTER_SECONDS,
+                 failed_ttl_seconds: int = settings.JOB_QUEUE_FAILED_TTL_SECONDS):
+        self.collection_name = collection_name
+        self.stale_after_seconds = stale_after_seconds
+        self.failed_ttl_seconds = failed_ttl_seconds
+        self.heartbeat_interval = stale_after_seconds / 3
+        self._next_stale_check = 0.0
+        self._pending_count = 0
+        self._counted_at: Optional[float] = None
+
+    @property
+    def collection(self):
+        return mongodb.get_collection(self.collection_name)
+
+    async def start(self) -> None:
+        # Relies on the job indexes declared in app.db.indexes
+        await self._requeue_stale()
+
+    async def _requeue_stale(self) -> None:
+        # Jobs left running by a worker that died are folded back into the pending queue
+        self._next_stale_check = time.monotonic() + self.heartbeat_interval
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after_seconds)
+        while True:
+            doc = await self.collection.find_one_and_delete({"status": "running", "heartbeat_at": {"$lt": cutoff}})
+            if doc is None:
+                return
+            logger.warning(f"Requeueing job {doc['kind']}:{doc['key']}, its worker stopped responding")
+            await self._requeue(doc["kind"], doc["key"], doc.get("items", []), doc.get("attempts", 0), datetime.utcnow())
+
+    async def _requeue(self, kind: str, key: str, items: List[Any], attempts: int, run_after: datetime) -> None:
+        try:
+            await self.collection.update_one(
+                {"kind": kind, "key": key, "status": "pending"},
+                {
+                    "$push": {"items": {"$each": items, "$position": 0}},
+                    "$max": {"attempts": attempts, "run_after": run_after},
+                    "$setOnInsert": {"created_at": datetime.utcnow()}
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            await self._requeue(kind, key, items, attempts, run_after)
+
+    async def push(self, kind: str, key: str, item: Any) -> bool:
+        now = datetime.utcnow()
+        try:
+            result = await self.collection.update_one(
+                {"kind": kind, "key": key, "status": "pending"},
+                {
+                    "$push": {"items": item},
+                    "$setOnInsert": {"created_at": now, "run_after": now, "attempts": 0}
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race with another worker; the pending job exists now
+            return await self.push(kind, key, item)
+        created = result.upserted_id is not None
+        self._pending_count += created
+        return created
+
+    async def pop(self) -> Optional[Job]:
+        if time.monotonic() >= self._next_stale_check:
+            await self._requeue_stale()
+
+        busy: List[Dict[str, str]] = []
+        while True:
+            now = datetime.utcnow()
+            query = {"status": "pending", "run_after": {"$lte": now}}
+            if busy:
+                query["$nor"] = busy
+            candidate = await self.collection.find_one(query, {"_id": 1, "kind": 1, "key": 1}, sort=[("run_after", 1)])
+            if candidate is None:
+                return None
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {"_id": candidate["_id"], "status": "pending"},
+                    {"$set": {"status": "running", "started_at": now, "heartbeat_at": now}},
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Another worker is running this key; its new items wait for it to finish
+                busy.append({"kind": candidate["kind"], "key": candidate["key"]})
+                continue
+            if doc is not None:
+                self._pending_count = max(self._pending_count - 1, 0)
+                return Job(doc["kind"], doc["key"], doc.get("items", []), id=doc["_id"], attempts=doc.get("attempts", 0))
+
+    async def complete(self, job: Job) -> None:
+        await self.collection.delete_one({"_id": job.id})
+
+    async def fail(self, job: Job, retry_delay: Optional[float]) -> None:
+        now = datetime.utcnow()
+        if retry_delay is None:
+            await self.collection.update_one(
+                {"_id": job.id},
+                {"$set": {
+                    "status": "failed",
+                    "attempts": job.attempts,
+                    "failed_at": now,
+                    "expires_at": now + timedelta(seconds=self.failed_ttl_seconds)
+                }}
+            )
+            return
+        # Requeue before deleting the running job, so a crash in between repeats items rather than losing them
+        await self._requeue(job.kind, job.key, job.items, job.attempts, now + timedelta(seconds=retry_delay))
+        await self.collection.delete_one({"_id": job.id})
+
+    async def heartbeat(self, job: Job) -> None:
+        await self.collection.update_one({"_id": job.id, "status": "running"}, {"$set": {"heartbeat_at": datetime.utcnow()}})
+
+    async def pending_count(self) -> int:
+        # Counting on every submit would cost a collection query per chat message
+        now = time.monotonic()
+        if self._counted_at is None or now - self._counted_at > self.COUNT_CACHE_SECONDS:
+            self._pending_count = await self.collection.count_documents({"status": "pending"})
+            self._counted_at = now
+        return self._pending_count
+
+# === Queue ===
+class JobQueue:
+    """
+    Async job queue with a bounded worker pool, per-key coalescing, backpressure
+    (submissions are rejected once `max_pending` jobs are waiting) and a graceful
+    drain on shutdown.
+    """
+
+    def __init__(self,
+                 backend: JobBackend,
+                 workers: int = settings.JOB_QUEUE_WORKERS,
+                 max_pending: int = settings.JOB_QUEUE_MAX_PENDING,
+                 poll_interval: float = settings.JOB_QUEUE_POLL_INTERVAL_SECONDS,
+                 max_attempts: int = settings.JOB_QUEUE_MAX_ATTEMPTS,
+                 retry_delay: float = settings.JOB_QUEUE_RETRY_DELAY_SECONDS):
+        self.backend = backend
+        self.workers = workers
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._handlers: Dict[str, JobHandler] = {}
+        self._wakeup = asyncio.Semaphore(0)
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    async def submit(self, kind: str, key: str, item: Any) -> bool:
+        """
+        Queue `item` for the job identified by (kind, key).
+        Returns True if a new job was created and False if it was coalesced into a pending one.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+        if self._stopping:
+            raise QueueFullError("Job queue is shutting down")
+        if await self.backend.pending_count() >= self.max_pending:
+            raise QueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+        created = await self.backend.push(kind, key, item)
+        self._wakeup.release()
+        return created
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._stopping = False
+        await self.backend.start()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self, timeout: float = settings.JOB_QUEUE_DRAIN_TIMEOUT_SECONDS) -> None:
+        """
+        Stop accepting jobs, let workers finish what is pending, and cancel them after `timeout`.
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        for _ in self._tasks:
+            self._wakeup.release()
+        done, still_running = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in still_running:
+            task.cancel()
+        if still_running:
+            logger.warning(f"Job queue drain timed out, cancelled {len(still_running)} worker(s)")
+            await asyncio.gather(*still_running, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            try:
+                job = await self.backend.pop()
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} failed to fetch a job: {str(e)}")
+                job = None
+
+            if job is None:
+                if self._stopping:
+                    return
+                try:
+                    await asyncio.wait_for(self._wakeup.acquire(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} failed to record job outcome: {str(e)}")
+
+    async def _heartbeat(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(self.backend.heartbeat_interval)
+            try:
+                await self.backend.heartbeat(job)
+            except Exception as e:
+                logger.warning(f"Heartbeat of job {job.kind}:{job.key} failed: {str(e)}")
+
+    async def _run(self, job: Job) -> None:
+        handler = self._handlers.get(job.kind)
+        heartbeat = asyncio.create_task(self._heartbeat(job)) if self.backend.heartbeat_interval else None
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind: {job.kind}")
+            await handler(job.key, job.items)
+        except Exception as e:
+            job.attempts += 1
+            retry = handler is not None and job.attempts < self.max_attempts
+            retry_delay = self.retry_delay * 2 ** (job.attempts - 1) if retry else None
+            if retry:
+                logger.warning(f"Job {job.kind}:{job.key} failed (attempt {job.attempts}), retrying in {retry_delay:.0f}s: {str(e)}")
+            else:
+                logger.error(f"Job {job.kind}:{job.key} failed after {job.attempts} attempt(s): {str(e)}")
+            await self.backend.fail(job, retry_delay)
+        else:
+            await self.backend.complete(job)
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+
+def create_backend(name: str) -> JobBackend:
+    if name == "memory":
+        return InMemoryJobBackend()
+    if name == "mongo":
+        return MongoJobBackend()
+    raise ValueError(f"Unknown job queue backend: {name}")
+
+job_queue = JobQueue(create_backend(settings.JOB_QUEUE_BACKEND))
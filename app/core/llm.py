@@ -0,0 +1,162 @@
+# === File: llm.py ===
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import openai
+from dotenv import load_dotenv
+
+from app.core.config import settings, StageRoute
+from app.core.deadline import DeadlineExceeded, current_deadline
+from app.core.metrics import metrics
+from app.core.scheduler import CircuitOpenError, Priority, estimate_tokens, llm_scheduler
+from app.core.tokens import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Shared OpenAI client for every stage; retries are owned by the scheduler
+client = openai.AsyncOpenAI(
+    api_key=settings.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY"),
+    base_url=settings.OPENAI_BASE_URL,
+    max_retries=0
+)
+
+class LLMRouter:
+    """
+    Routes each pipeline stage to the model, timeout and max_tokens configured in
+    settings.LLM_ROUTES. When a stage has a fallback model, a primary call that fails
+    or exceeds the stage's latency SLO is retried on the fallback; after
+    LLM_ROUTE_DEGRADE_AFTER consecutive misses the stage goes straight to the fallback
+    for LLM_ROUTE_COOLDOWN_SECONDS. Every call's latency is recorded in `metrics`.
+    Calls go through `llm_scheduler`, so the budget covers queueing and retries, and
+    are cut off at the request deadline when one is set.
+    """
+
+    def __init__(self,
+                 degrade_after: int = settings.LLM_ROUTE_DEGRADE_AFTER,
+                 cooldown_seconds: float = settings.LLM_ROUTE_COOLDOWN_SECONDS):
+        self.degrade_after = degrade_after
+        self.cooldown_seconds = cooldown_seconds
+        self._misses: Dict[str, int] = {}
+        self._degraded_until: Dict[str, float] = {}
+
+    def route(self, stage: str) -> StageRoute:
+        return settings.stage_route(stage)
+
+    def _use_fallback(self, stage: str, route: StageRoute) -> bool:
+        return bool(route.fallback_model) and time.monotonic() < self._degraded_until.get(stage, 0.0)
+
+    def _record_primary(self, stage: str, hit: bool) -> None:
+        if hit:
+            self._misses[stage] = 0
+            return
+        self._misses[stage] = self._misses.get(stage, 0) + 1
+        if self._misses[stage] >= self.degrade_after:
+            logger.warning(f"Stage {stage} missed its SLO {self._misses[stage]} times, using fallback model")
+            self._degraded_until[stage] = time.monotonic() + self.cooldown_seconds
+            self._misses[stage] = 0
+
+    async def _call(self, stage: str, model: str, budget: float, **kwargs):
+        route = self.route(stage.split(":")[0])
+        priority = Priority.BACKGROUND if route.priority == "background" else Priority.CHAT
+        deadline = current_deadline()
+        clamped = False
+        if deadline is not None:
+            if deadline.expired:
+                raise DeadlineExceeded(f"No time left for stage {stage}")
+            clamped = deadline.clamp(budget) < budget
+            budget = deadline.clamp(budget)
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                llm_scheduler.submit(
+                    lambda: client.chat.completions.create(model=model, **kwargs),
+                    priority=priority,
+                    estimated_tokens=estimate_tokens(kwargs["messages"], kwargs["max_tokens"])
+                ),
+                timeout=budget
+            )
+        except asyncio.TimeoutError as e:
+            elapsed = time.perf_counter() - started
+            metrics.observe(stage, elapsed * 1000, model=model, ok=False)
+            if clamped and elapsed >= budget and not isinstance(e, DeadlineExceeded):
+                # Cut off by the request deadline, not the model's own budget: not an SLO miss
+                raise DeadlineExceeded(f"Request deadline reached during stage {stage}") from e
+            raise
+        except BaseException:
+            metrics.observe(stage, (time.perf_counter() - started) * 1000, model=model, ok=False)
+            raise
+        metrics.observe(stage, (time.perf_counter() - started) * 1000, model=model)
+        return response
+
+    async def complete(self,
+                       stage: str,
+                       messages: List[Dict[str, str]],
+                       temperature: float,
+                       **kwargs):
+        """
+        Run a chat completion for `stage` and return the OpenAI response object.
+        """
+        route = self.route(stage)
+        kwargs = {"messages": messages, "temperature": temperature, "max_tokens": route.max_tokens, **kwargs}
+        metrics.observe_tokens(stage, count_message_tokens(messages))
+
+        if not route.fallback_model:
+            return await self._call(stage, route.model, route.timeout_seconds, **kwargs)
+
+        if not self._use_fallback(stage, route):
+            budget = min(route.timeout_seconds, route.slo_ms / 1000) if route.slo_ms else route.timeout_seconds
+            try:
+                response = await self._call(stage, route.model, budget, **kwargs)
+                self._record_primary(stage, True)
+                return response
+            except (asyncio.CancelledError, CircuitOpenError, DeadlineExceeded):
+                raise
+            except Exception as e:
+                logger.warning(f"Stage {stage} primary model {route.model} failed or was too slow: {type(e).__name__}")
+                self._record_primary(stage, False)
+
+        metrics.increment(stage, "fallbacks")
+        return await self._call(stage, route.fallback_model, route.timeout_seconds, **kwargs)
+
+    async def stream(self,
+                     stage: str,
+                     messages: List[Dict[str, str]],
+                     temperature: float) -> AsyncIterator[str]:
+        """
+        Stream completion deltas for `stage`. Falls back only if the stream cannot be opened.
+        """
+        route = self.route(stage)
+        kwargs = {"messages": messages, "temperature": temperature, "max_tokens": route.max_tokens, "stream": True}
+        metrics.observe_tokens(stage, count_message_tokens(messages))
+        model = route.fallback_model if self._use_fallback(stage, route) else route.model
+        started = time.perf_counter()
+        try:
+            stream = await self._call(stage + ":open", model, route.timeout_seconds, **kwargs)
+        except (asyncio.CancelledError, CircuitOpenError, DeadlineExceeded):
+            raise
+        except Exception:
+            if not route.fallback_model or model == route.fallback_model:
+                raise
+            self._record_primary(stage, False)
+            metrics.increment(stage, "fallbacks")
+            model = route.fallback_model
+            stream = await self._call(stage + ":open", model, route.timeout_seconds, **kwargs)
+
+        ok = False
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+            ok = True
+        finally:
+            metrics.observe(stage, (time.perf_counter() - started) * 1000, model=model, ok=ok)
+
+llm_router = LLMRouter()
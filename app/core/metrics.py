@@ -0,0 +1,55 @@
+# === File: metrics.py ===
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+import numpy as np
+
+class StageMetrics:
+    """
+    In-process latency samples, prompt sizes and counters per pipeline stage, kept in bounded windows.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+        self._prompt_tokens: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+        self._counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+
+    def observe(self, stage: str, latency_ms: float, model: Optional[str] = None, ok: bool = True) -> None:
+        self._latencies[stage].append(latency_ms)
+        self.increment(stage, "calls")
+        if not ok:
+            self.increment(stage, "errors")
+        if model:
+            self.increment(stage, f"model:{model}")
+
+    def observe_tokens(self, stage: str, prompt_tokens: int) -> None:
+        self._prompt_tokens[stage].append(prompt_tokens)
+
+    def increment(self, stage: str, counter: str, value: float = 1) -> None:
+        self._counters[stage][counter] += value
+
+    def percentile(self, stage: str, q: float) -> Optional[float]:
+        samples = self._latencies.get(stage)
+        if not samples:
+            return None
+        return float(np.percentile(np.fromiter(samples, dtype=float), q))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        stages = set(self._latencies) | set(self._counters) | set(self._prompt_tokens)
+        result = {}
+        for stage in sorted(stages):
+            summary = dict(self._counters.get(stage, {}))
+            if self._latencies.get(stage):
+                summary["p50_ms"] = round(self.percentile(stage, 50), 1)
+                summary["p95_ms"] = round(self.percentile(stage, 95), 1)
+                summary["samples"] = len(self._latencies[stage])
+            if self._prompt_tokens.get(stage):
+                tokens = np.fromiter(self._prompt_tokens[stage], dtype=float)
+                summary["prompt_tokens_p50"] = round(float(np.percentile(tokens, 50)), 1)
+                summary["prompt_tokens_p95"] = round(float(np.percentile(tokens, 95)), 1)
+                summary["prompt_tokens_max"] = int(tokens.max())
+            result[stage] = summary
+        return result
+
+metrics = StageMetrics()
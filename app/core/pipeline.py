@@ -0,0 +1,268 @@
+# === File: pipeline.py ===
+import asyncio
+import itertools
+import logging
+import time
+from datetime import datetime
+from typing import Any, List, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from app.core.analyzer import (
+    analyze_emotions, retrieve_memories, update_psycho_profile, get_psycho_profile, validate_psychoanalysis
+)
+from app.core.profile_store import profile_store
+from app.core.responder import generate_response, fallback_response
+from app.core.single_pass import analyze_and_respond, merge_profile_updates
+from app.core.config import settings
+from app.core.conversation import ConversationState, conversation_memory
+from app.core.deadline import current_deadline, optional_stage
+from app.core.embeddings import embedding_service
+from app.core.jobs import job_queue, QueueFullError
+from app.core.metrics import metrics
+from app.core.prompts import trait_score
+from app.core.tracing import user_id_var
+from app.core.vector_memory import vector_memory
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+PROFILE_REFRESH_JOB = "profile_refresh"
+MEMORY_INDEX_JOB = "memory_index"
+CONVERSATION_SUMMARY_JOB = "conversation_summary"
+
+EXIT_COMMANDS = ["quit", "exit"]
+GOODBYE_RESPONSE = "👋 Goodbye. Take care."
+
+def is_exit_command(user_input: str) -> bool:
+    return user_input.lower() in EXIT_COMMANDS
+
+class TurnContext(NamedTuple):
+    context_chunks: List[str]
+    psycho_data: Dict[str, Dict]
+    emotions: Dict[str, float]
+    conversation: ConversationState
+
+# === Pre-response stages ===
+async def prepare_turn(user_id: str, user_input: str, queue_profile_refresh: bool = True) -> TurnContext:
+    """
+    Run every stage that has to finish before the reply can be generated.
+    Under a request deadline each stage is optional and falls back to an empty
+    result when there is no time for it.
+    """
+    # Step 1: Queue a background profile refresh; the reply uses the latest completed profile.
+    # Queueing is cheap, so it is never skipped under a tight deadline
+    if queue_profile_refresh:
+        await _submit_job(PROFILE_REFRESH_JOB, user_id, user_input)
+
+    # Step 2: Analyze emotions and retrieve the user's related memories while the profile loads
+    emotions, context_chunks, psycho_data, conversation = await asyncio.gather(
+        optional_stage("emotions", analyze_emotions(user_input), {}),
+        optional_stage("rag", _retrieve(user_id, user_input), []),
+        optional_stage("profile", get_psycho_profile(user_id), {}),
+        optional_stage("conversation", conversation_memory.load(user_id), ConversationState())
+    )
+
+    return TurnContext(context_chunks, psycho_data, emotions, conversation)
+
+async def respond(user_id: str, user_input: str, emotion_hint: Optional[str] = None) -> str:
+    """
+    Produce the reply for one message using the configured PIPELINE_MODE.
+    When the response model cannot finish before the request deadline, the reply
+    degrades to a canned response matching the user's emotion.
+    """
+    if settings.PIPELINE_MODE == "single":
+        reply = await _respond_single_pass(user_id, user_input)
+        if reply is not None:
+            return reply
+        logger.info("Single-pass output unusable, falling back to the multi-call pipeline")
+
+    if settings.SPECULATIVE_RESPONSE:
+        # The profile is updated inline, alongside the speculative reply
+        turn = await prepare_turn(user_id, user_input, queue_profile_refresh=False)
+        reply = _respond_speculative(user_id, user_input, turn)
+    else:
+        turn = await prepare_turn(user_id, user_input)
+        reply = generate_response(user_input, turn.psycho_data, turn.context_chunks, turn.conversation)
+
+    try:
+        return await reply
+    except asyncio.TimeoutError:
+        deadline = current_deadline()
+        if deadline is None:
+            raise
+        deadline.skip("response")
+        deadline.degrade()
+        return fallback_response(turn.emotions, emotion_hint)
+
+async def _respond_single_pass(user_id: str, user_input: str) -> Optional[str]:
+    context_chunks, psycho_data, conversation = await asyncio.gather(
+        optional_stage("rag", _retrieve(user_id, user_input), []),
+        get_psycho_profile(user_id),
+        optional_stage("conversation", conversation_memory.load(user_id), ConversationState())
+    )
+    result = await analyze_and_respond(user_input, psycho_data, context_chunks, conversation)
+    if result is None:
+        return None
+
+    if result.profile_updates:
+        # Same schema and score range as the multi-call profile update
+        try:
+            merged = validate_psychoanalysis(
+                merge_profile_updates(psycho_data.get("psychoanalysis", {}), result.profile_updates)
+            )
+        except ValueError as e:
+            logger.warning(f"Discarding single-pass profile updates for user {user_id}: {str(e)}")
+        else:
+            await profile_store.update(user_id, {"psychoanalysis": merged})
+    return result.reply
+
+async def _timed(coro) -> Any:
+    started = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - started) * 1000
+
+async def _respond_speculative(user_id: str, user_input: str, turn: TurnContext) -> str:
+    """
+    Generate the reply from the last known profile while the profile update runs, and
+    regenerate it only if the update changed the profile significantly.
+    """
+    started = time.perf_counter()
+    current = turn.psycho_data.get("psychoanalysis", {})
+    update = asyncio.create_task(_timed(
+        optional_stage("profile_update", update_psycho_profile(user_id, user_input, turn.context_chunks, current), None)
+    ))
+    reply, response_ms = await _timed(
+        generate_response(user_input, turn.psycho_data, turn.context_chunks, turn.conversation)
+    )
+    new_psychoanalysis, update_ms = await update
+
+    if new_psychoanalysis is None:
+        metrics.increment("speculative", "update_failed")
+        return reply
+
+    change = profile_change(current, new_psychoanalysis)
+    if change <= settings.SPECULATIVE_SIGNIFICANCE_THRESHOLD:
+        metrics.increment("speculative", "hits")
+        # Sequentially the reply would have waited for the update
+        metrics.increment("speculative", "latency_saved_ms", update_ms + response_ms - (time.perf_counter() - started) * 1000)
+        return reply
+
+    metrics.increment("speculative", "misses")
+    psycho_data = {**turn.psycho_data, "psychoanalysis": new_psychoanalysis}
+    try:
+        reply, regenerate_ms = await _timed(
+            generate_response(user_input, psycho_data, turn.context_chunks, turn.conversation)
+        )
+    except asyncio.TimeoutError:
+        # No time left to regenerate; the speculative reply is still better than none
+        metrics.increment("speculative", "stale_replies")
+        return reply
+    metrics.increment("speculative", "latency_saved_ms", update_ms + regenerate_ms - (time.perf_counter() - started) * 1000)
+    return reply
+
+def _has_score(value: Any) -> bool:
+    if isinstance(value, dict):
+        return any(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value.values())
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _trait_change(before: Any, after: Any) -> float:
+    """
+    Change of one trait: the score difference when both sides are scored; a trait that
+    appeared or disappeared counts its score, and any unscored change counts fully.
+    """
+    if before == after:
+        return 0.0
+    if before is None or after is None:
+        present = after if before is None else before
+        return trait_score(present) if _has_score(present) else 1.0
+    if _has_score(before) and _has_score(after):
+        return abs(trait_score(after) - trait_score(before))
+    return 1.0
+
+def profile_change(old: Dict[str, Any], new: Dict[str, Any]) -> float:
+    """
+    Largest change between two psychoanalysis profiles: the change of any trait (see
+    _trait_change), or the fraction of items changed in a list or text category.
+
+    Within a category, traits whose key disappeared are paired with new keys by score
+    rank, so an observation the model merely reworded counts as its score difference
+    rather than as one trait removed and another added.
+    """
+    changes = [0.0]
+    for category in set(old) | set(new):
+        before, after = old.get(category), new.get(category)
+        if isinstance(before, dict) or isinstance(after, dict):
+            before = before if isinstance(before, dict) else {}
+            after = after if isinstance(after, dict) else {}
+            for name in set(before) & set(after):
+                changes.append(_trait_change(before[name], after[name]))
+            removed = sorted((before[name] for name in set(before) - set(after)), key=trait_score, reverse=True)
+            added = sorted((after[name] for name in set(after) - set(before)), key=trait_score, reverse=True)
+            for before_value, after_value in itertools.zip_longest(removed, added):
+                changes.append(_trait_change(before_value, after_value))
+        elif before != after:
+            before_items = set(map(str, before if isinstance(before, list) else [before]))
+            after_items = set(map(str, after if isinstance(after, list) else [after]))
+            changes.append(len(before_items ^ after_items) / max(len(before_items | after_items), 1))
+    return max(changes)
+
+# === Background stages ===
+async def refresh_profile(user_id: str, messages: List[str]) -> None:
+    """
+    Job handler: refresh the user's profile once over every message queued since the last run.
+    """
+    user_id_var.set(user_id)
+    await update_psycho_profile(user_id, "\n".join(messages), [])
+
+async def index_messages(user_id: str, messages: List[str]) -> None:
+    """
+    Job handler: embed new messages and append them to the user's vector memory.
+    """
+    user_id_var.set(user_id)
+    vectors = await embedding_service.embed_many(messages)
+    await vector_memory.append(user_id, np.vstack(vectors), messages)
+
+async def summarize_conversation(user_id: str, _: List[str]) -> None:
+    """
+    Job handler: fold the user's turns that left the recent window into the running summary.
+    """
+    user_id_var.set(user_id)
+    await conversation_memory.fold(user_id)
+
+job_queue.register(PROFILE_REFRESH_JOB, refresh_profile)
+job_queue.register(MEMORY_INDEX_JOB, index_messages)
+job_queue.register(CONVERSATION_SUMMARY_JOB, summarize_conversation)
+
+async def _retrieve(user_id: str, user_input: str) -> List[str]:
+    if not settings.RAG_ENABLED:
+        return []
+    return await retrieve_memories(user_id, user_input, settings.RAG_TOP_K)
+
+async def _submit_job(kind: str, user_id: str, item: str) -> None:
+    try:
+        await job_queue.submit(kind, user_id, item)
+    except QueueFullError as e:
+        logger.warning(f"Skipping {kind} job for user {user_id}: {str(e)}")
+
+# === Persistence ===
+async def store_turn(user_id: str, message: str, emotion: Optional[str], response: str) -> None:
+    """
+    Store one user message and the assistant reply in the chats collection and
+    the user's rolling conversation memory.
+    """
+    chat_collection = mongodb.get_collection("chats")
+    chat_data = {
+        "user_id": user_id,
+        "message": message,
+        "emotion": emotion,
+        "response": response,
+        "created_at": datetime.utcnow()
+    }
+    await chat_collection.insert_one(chat_data)
+
+    if await conversation_memory.append(user_id, message, response):
+        await _submit_job(CONVERSATION_SUMMARY_JOB, user_id, "")
+
+    if settings.RAG_ENABLED:
+        await _submit_job(MEMORY_INDEX_JOB, user_id, message)
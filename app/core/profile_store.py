@@ -0,0 +1,257 @@
+# === File: profile_store.py ===
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SECTIONS = ("psychoanalysis", "about_user")
+# Levels of a section merged key by key on a version conflict: category, then trait
+MERGE_DEPTH = 2
+
+_MISSING = object()
+
+def empty_profile() -> Dict[str, Dict]:
+    return {section: {} for section in PROFILE_SECTIONS}
+
+def merge_changes(base: Any, ours: Any, theirs: Any, overridden: List[str], depth: int = MERGE_DEPTH, path: str = "") -> Any:
+    """
+    Three-way merge of one profile section: keys we changed relative to `base` take our
+    value (or are removed), every other key keeps `theirs`. Keys both sides changed
+    differently are added to `overridden`.
+    """
+    if depth == 0 or not all(isinstance(value, dict) for value in (base, ours, theirs)):
+        if ours == base:
+            return theirs
+        if theirs != base and theirs != ours:
+            overridden.append(path or "<section>")
+        return ours
+
+    merged = {}
+    for key in {**base, **ours, **theirs}:
+        before, mine, other = base.get(key, _MISSING), ours.get(key, _MISSING), theirs.get(key, _MISSING)
+        if mine is _MISSING or other is _MISSING or before is _MISSING:
+            if mine == before:
+                value = other
+            else:
+                value = mine
+                if other != before and other != mine:
+                    overridden.append(f"{path}.{key}" if path else str(key))
+        else:
+            value = merge_changes(before, mine, other, overridden, depth - 1, f"{path}.{key}" if path else str(key))
+        if value is not _MISSING:
+            merged[key] = value
+    return merged
+
+class _CachedProfile:
+    __slots__ = ("profile", "base", "pending", "version", "loaded_at")
+
+    def __init__(self, profile: Dict[str, Dict], version: int):
+        self.profile = profile
+        # The sections as stored at `version`, which pending changes are relative to
+        self.base = copy.deepcopy(profile)
+        self.pending: Dict[str, Dict] = {}
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+class ProfileStore:
+    """
+    Per-user psychoanalytic profiles stored in MongoDB.
+
+    Reads go through a bounded in-process LRU cache. Updates are applied to the cache
+    immediately and written behind in batches; every write is conditional on the
+    document `version`. When another worker wrote first, our changes (relative to the
+    version we read) are merged trait by trait into its copy and written again; traits
+    both workers changed keep ours and are logged.
+    """
+
+    def __init__(self,
+                 collection_name: str = "psycho_profiles",
+                 max_entries: int = settings.PROFILE_CACHE_SIZE,
+                 ttl_seconds: float = settings.PROFILE_CACHE_TTL_SECONDS,
+                 flush_interval: float = settings.PROFILE_FLUSH_INTERVAL_SECONDS):
+        self.collection_name = collection_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self._cache: "OrderedDict[str, _CachedProfile]" = OrderedDict()
+        self._dirty = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return mongodb.get_collection(self.collection_name)
+
+    # === Lifecycle ===
+    async def start(self) -> None:
+        # The unique user_id index is declared in app.db.indexes
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing psycho profiles: {str(e)}")
+
+    # === Reads ===
+    async def get(self, user_id: str) -> Dict[str, Dict]:
+        """
+        Return a copy of the user's profile, loading it from MongoDB on a cache miss.
+        """
+        entry = await self._load(user_id)
+        return copy.deepcopy(entry.profile)
+
+    async def _load(self, user_id: str) -> _CachedProfile:
+        entry = self._cache.get(user_id)
+        if entry is not None:
+            stale = time.monotonic() - entry.loaded_at > self.ttl_seconds
+            if not stale or user_id in self._dirty:
+                self._cache.move_to_end(user_id)
+                return entry
+
+        doc = await self.collection.find_one({"user_id": user_id})
+        entry = self._cache.get(user_id)
+        if entry is not None and user_id in self._dirty:
+            # An update landed while we were reading; keep the local changes
+            return entry
+
+        entry = _CachedProfile(self._profile_from_doc(doc), doc["version"] if doc else 0)
+        self._cache[user_id] = entry
+        self._cache.move_to_end(user_id)
+        await self._evict()
+        return entry
+
+    async def _evict(self) -> None:
+        while len(self._cache) > self.max_entries:
+            user_id, entry = next(iter(self._cache.items()))
+            if user_id in self._dirty:
+                await self._flush_user(user_id, entry)
+            # The entry may have been touched while flushing
+            if user_id not in self._dirty and user_id in self._cache:
+                del self._cache[user_id]
+            else:
+                self._cache.move_to_end(user_id)
+                break
+
+    @staticmethod
+    def _profile_from_doc(doc: Optional[Dict]) -> Dict[str, Dict]:
+        profile = empty_profile()
+        if doc:
+            for section in PROFILE_SECTIONS:
+                profile[section] = doc.get(section) or {}
+        return profile
+
+    # === Writes ===
+    async def update(self, user_id: str, changes: Dict[str, Dict]) -> Dict[str, Dict]:
+        """
+        Replace the given profile sections for a user. The write reaches MongoDB on the next flush.
+        """
+        entry = await self._load(user_id)
+        for section, value in changes.items():
+            if section not in PROFILE_SECTIONS:
+                raise ValueError(f"Unknown profile section: {section}")
+            entry.profile[section] = value
+            entry.pending[section] = value
+        self._dirty.add(user_id)
+        return copy.deepcopy(entry.profile)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            for user_id in list(self._dirty):
+                entry = self._cache.get(user_id)
+                if entry is None:
+                    self._dirty.discard(user_id)
+                    continue
+                # One failing user must not hold back everyone after it; it stays dirty for the next flush
+                try:
+                    await self._flush_user(user_id, entry, locked=True)
+                except Exception as e:
+                    logger.error(f"Error flushing psycho profile of user {user_id}: {str(e)}")
+
+    async def _flush_user(self, user_id: str, entry: _CachedProfile, locked: bool = False) -> None:
+        if not locked:
+            async with self._flush_lock:
+                return await self._flush_user(user_id, entry, locked=True)
+        if user_id not in self._dirty:
+            return
+
+        pending = entry.pending
+        entry.pending = {}
+        self._dirty.discard(user_id)
+        now = datetime.utcnow()
+        try:
+            if entry.version == 0:
+                sections = {**entry.base, **pending}
+                await self.collection.insert_one({
+                    "user_id": user_id,
+                    **sections,
+                    "version": 1,
+                    "updated_at": now
+                })
+                entry.base = copy.deepcopy(sections)
+                entry.version = 1
+                return
+
+            result = await self.collection.update_one(
+                {"user_id": user_id, "version": entry.version},
+                {"$set": {**pending, "updated_at": now}, "$inc": {"version": 1}}
+            )
+            if result.matched_count:
+                entry.base.update(copy.deepcopy(pending))
+                entry.version += 1
+                return
+        except DuplicateKeyError:
+            pass
+        except Exception:
+            self._requeue(user_id, entry, pending)
+            raise
+
+        # Another worker wrote this profile first: merge our changes into its copy and retry.
+        # Updates made while flushing were built on our copy, so they merge against the same base.
+        doc = await self.collection.find_one({"user_id": user_id})
+        theirs = self._profile_from_doc(doc)
+        pending.update(entry.pending)
+        entry.pending = {}
+        overridden: List[str] = []
+        for section, ours in pending.items():
+            pending[section] = merge_changes(entry.base.get(section) or {}, ours, theirs[section], overridden, path=section)
+        if overridden:
+            logger.warning(f"Profile version conflict for user {user_id}; both workers changed {', '.join(sorted(overridden))}, keeping ours")
+        else:
+            logger.info(f"Profile version conflict for user {user_id}, merged and retrying")
+        entry.profile = theirs
+        entry.base = copy.deepcopy(theirs)
+        entry.version = doc["version"] if doc else 0
+        entry.loaded_at = time.monotonic()
+        self._requeue(user_id, entry, pending)
+
+    def _requeue(self, user_id: str, entry: _CachedProfile, pending: Dict[str, Dict]) -> None:
+        pending.update(entry.pending)
+        entry.pending = pending
+        entry.profile.update(pending)
+        self._dirty.add(user_id)
+
+profile_store = ProfileStore()
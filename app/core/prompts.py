@@ -0,0 +1,178 @@
+# === File: prompts.py ===
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.tokens import MESSAGE_OVERHEAD_TOKENS, count_message_tokens, count_tokens, truncate_tokens
+
+# Share of the variable budget the current message may use before it is truncated
+USER_TEXT_SHARE = 0.5
+# Share of what is left after the message that conversation history may use;
+# whatever it does not use goes to the profile and chunks
+HISTORY_SHARE = 0.5
+# Share of what is left after the message and history that goes to profile traits; chunks get the rest
+PROFILE_SHARE = 0.6
+# Headers and separators of the profile, chunks and message sections
+SECTION_OVERHEAD_TOKENS = 24
+
+def _round_scores(value: Any) -> Any:
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {k: _round_scores(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round_scores(v) for v in value]
+    return value
+
+def compact_json(value: Any) -> str:
+    """
+    Serialize without whitespace, with sorted keys and scores rounded to two decimals,
+    so equal data always yields equal bytes.
+    """
+    return json.dumps(_round_scores(value), separators=(",", ":"), ensure_ascii=False, sort_keys=True, default=str)
+
+def trait_score(value: Any) -> float:
+    """Score of one profile trait: the value itself, or the largest number in a dict value."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, dict):
+        scores = [v for v in value.values() if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        if scores:
+            return float(max(scores))
+    return 0.0
+
+def fit_profile(profile: Dict[str, Any], max_tokens: Optional[int]) -> Dict[str, Any]:
+    """
+    Keep the highest-scoring traits of a profile (scores are the largest number in each
+    trait's value, e.g. max of short_term/long_term) that fit in `max_tokens`.
+    """
+    if max_tokens is None:
+        return profile
+
+    traits: List[Tuple[float, int, str, Optional[str], Any]] = []
+    for category, entries in profile.items():
+        if isinstance(entries, dict):
+            for name, value in entries.items():
+                traits.append((trait_score(value), len(traits), category, name, value))
+        else:
+            traits.append((trait_score(entries), len(traits), category, None, entries))
+    traits.sort(key=lambda trait: (-trait[0], trait[1]))
+
+    fitted: Dict[str, Any] = {}
+    used = 0
+    for _, _, category, name, value in traits:
+        if name is None:
+            cost = count_tokens(compact_json({category: value}))
+        else:
+            cost = count_tokens(compact_json({name: value})) + (0 if category in fitted else count_tokens(category) + 2)
+        if used + cost > max_tokens:
+            continue
+        used += cost
+        if name is None:
+            fitted[category] = value
+        else:
+            fitted.setdefault(category, {})[name] = value
+    return fitted
+
+def fit_chunks(chunks: List[str], max_tokens: Optional[int]) -> List[str]:
+    """
+    Keep chunks in their ranked order until `max_tokens` is used; the last one may be truncated.
+    """
+    if max_tokens is None:
+        return list(chunks)
+
+    fitted = []
+    remaining = max_tokens
+    for chunk in chunks:
+        cost = count_tokens(chunk) + 1
+        if cost <= remaining:
+            fitted.append(chunk)
+            remaining -= cost
+        else:
+            if remaining > 16:
+                fitted.append(truncate_tokens(chunk, remaining - 1))
+            break
+    return fitted
+
+def fit_history(history: List[Dict[str, str]], max_tokens: Optional[int]) -> List[Dict[str, str]]:
+    """
+    Keep the most recent turns that fit in `max_tokens`, then the leading summary
+    (a system message) in whatever room is left, truncated if need be.
+    """
+    if max_tokens is None or not history:
+        return list(history)
+
+    summary = history[0] if history[0]["role"] == "system" else None
+    turns = history[1:] if summary else list(history)
+
+    kept: List[Dict[str, str]] = []
+    remaining = max_tokens
+    for message in reversed(turns):
+        cost = count_message_tokens([message])
+        if cost > remaining:
+            break
+        kept.append(message)
+        remaining -= cost
+    kept.reverse()
+    # Never start the window with a reply whose user message was dropped
+    if kept and kept[0]["role"] == "assistant":
+        remaining += count_message_tokens([kept.pop(0)])
+
+    if summary:
+        if count_message_tokens([summary]) <= remaining:
+            kept.insert(0, summary)
+        elif remaining - MESSAGE_OVERHEAD_TOKENS > 16:
+            kept.insert(0, {**summary, "content": truncate_tokens(summary["content"], remaining - MESSAGE_OVERHEAD_TOKENS - 1)})
+    return kept
+
+def build_prompt_messages(stage: str,
+                          system_prompt: str,
+                          user_text: str,
+                          profile: Optional[Dict[str, Any]] = None,
+                          chunks: Optional[List[str]] = None,
+                          history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+    """
+    Assemble a stage's messages within its prompt_budget_tokens.
+
+    The static `system_prompt` comes first and is never formatted with request data, so
+    the prefix stays byte-identical across calls for provider-side prompt caching.
+    The current message is reserved first; conversation history (newest turns first,
+    then the summary), profile traits and retrieved chunks share what is left of the
+    budget, in that order of priority.
+    """
+    budget = settings.stage_route(stage).prompt_budget_tokens
+    history = history or []
+
+    text_budget = profile_budget = chunk_budget = None
+    if budget is not None:
+        available = budget - count_message_tokens([{"content": system_prompt}]) - MESSAGE_OVERHEAD_TOKENS - SECTION_OVERHEAD_TOKENS
+        available = max(available, 0)
+        text_budget = max(int(available * USER_TEXT_SHARE), 1)
+        user_text = truncate_tokens(user_text, text_budget)
+        available = max(available - count_tokens(user_text), 0)
+        history = fit_history(history, int(available * HISTORY_SHARE))
+        available -= count_message_tokens(history)
+        profile_budget = int(available * PROFILE_SHARE) if chunks else available
+
+    sections = []
+    if profile:
+        fitted_profile = fit_profile(profile, profile_budget)
+        if fitted_profile:
+            sections.append(f"Profile:\n{compact_json(fitted_profile)}")
+        if budget is not None:
+            used = count_tokens(sections[-1]) if fitted_profile else 0
+            chunk_budget = max(available - used, 0)
+    elif budget is not None:
+        chunk_budget = available
+
+    if chunks:
+        fitted_chunks = fit_chunks(chunks, chunk_budget)
+        if fitted_chunks:
+            sections.append("Related things the user said before:\n" + "\n".join(f"- {chunk}" for chunk in fitted_chunks))
+
+    sections.append(f"Message:\n{user_text}")
+    return [
+        {"role": "system", "content": system_prompt},
+        *history,
+        {"role": "user", "content": "\n\n".join(sections)}
+    ]
@@ -1,10 +1,14 @@
 # === File: responder.py ===
-import openai
 from dotenv import load_dotenv
 import os
 import json
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator, Optional
 import logging
+from random import choice
+from app.core.tracing import tracer
+from app.core.llm import llm_router
+from app.core.conversation import ConversationState
+from app.core.prompts import build_prompt_messages
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,9 +16,6 @@ logger = logging.getLogger(__name__)
 
 # Load API key from .env file
 load_dotenv()
-# openai.api_key = os.getenv("OPENAI_API_KEY")
-# logger.debug(f"OpenAI API Key loaded: {openai.api_key[:5]}...")
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 logger.debug(f"OpenAI API Key loaded: {os.getenv('OPENAI_API_KEY')[:5]}...")
 
 SYSTEM_RESPONSES = [
@@ -30,9 +31,54 @@ SYSTEM_RESPONSES = [
     "I'm here to support you through this. What's the next step you'd like to take?"
 ]
 
-def generate_response(user_text: str,
-                     psycho_profile: Dict[str, Dict],
-                     retrieved_chunks: List[str] = None) -> str:
+# SYSTEM_RESPONSES indexes that suit each dominant emotion, used when the reply has to degrade
+EMOTION_RESPONSES = {
+    "angry": [0, 1, 6],
+    "disgust": [0, 3, 7],
+    "fear": [1, 8, 9],
+    "joy": [5, 7, 3],
+    "neutral": [2, 3, 4],
+    "sadness": [1, 8, 9],
+    "surprise": [5, 6, 7],
+}
+
+def fallback_response(emotions: Dict[str, float], emotion_hint: Optional[str] = None) -> str:
+    """
+    Pick a canned reply matching the strongest detected emotion (or the client's emotion
+    tag when analysis was skipped), for when the response model cannot answer in time.
+    """
+    emotion = max(emotions, key=emotions.get) if emotions else emotion_hint
+    candidates = EMOTION_RESPONSES.get(emotion, EMOTION_RESPONSES["neutral"])
+    return SYSTEM_RESPONSES[choice(candidates)]
+
+RESPONSE_SYSTEM_PROMPT = (
+    "You are a deeply compassionate, emotionally intelligent AI therapist. "
+    "You receive the user's message, psychoanalytic observations about the user (Profile, compact JSON) "
+    "and things the user said before. Respond like a therapist would — warm, curious, open-minded, "
+    "and reflective. Use their language when possible."
+)
+
+def build_response_messages(user_text: str,
+                            psycho_profile: Dict[str, Dict],
+                            retrieved_chunks: List[str] = None,
+                            conversation: Optional[ConversationState] = None) -> List[Dict[str, str]]:
+    """
+    Build the chat messages sent to the response model, within the stage's token budget.
+    The conversation summary and recent turns go between the system message and the current message.
+    """
+    return build_prompt_messages(
+        "response",
+        RESPONSE_SYSTEM_PROMPT,
+        user_text,
+        profile=psycho_profile.get("psychoanalysis", {}),
+        chunks=retrieved_chunks,
+        history=conversation.to_messages() if conversation else None
+    )
+
+async def generate_response(user_text: str,
+                           psycho_profile: Dict[str, Dict],
+                           retrieved_chunks: List[str] = None,
+                           conversation: Optional[ConversationState] = None) -> str:
     """
     Generate a thoughtful response using GPT-4, considering the psychoanalytic profile and retrieved memory.
     """
@@ -41,31 +87,38 @@ def generate_response(user_text: str,
         logger.debug(f"User text: {user_text}")
         logger.debug(f"Psycho profile: {json.dumps(psycho_profile, indent=2)}")
 
-        prompt = f"""
-You are a deeply compassionate, emotionally intelligent AI therapist.
-Here is the user's message:
-"{user_text}"
-
-Here are psychoanalytic observations about the user:
-{json.dumps(psycho_profile.get("psychoanalysis", {}), indent=2)}
-
-Please respond like a therapist would — warm, curious, open-minded, and reflective. Use their language when possible.
-"""
-
         logger.debug("Sending request to OpenAI API...")
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an insightful and compassionate AI therapist."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6,
-            max_tokens=500
+        response = await llm_router.complete(
+            "response",
+            messages=build_response_messages(user_text, psycho_profile, retrieved_chunks, conversation),
+            temperature=0.6
         )
         logger.debug("Received response from OpenAI API")
         
-        return response.choices[0].message.content.strip()
+        reply = response.choices[0].message.content.strip()
+        tracer.record("generate_response", inputs=user_text, outputs=reply)
+        return reply
     except Exception as e:
         logger.error(f"Error in generate_response: {str(e)}")
         logger.error(f"Error type: {type(e)}")
-        raise
\ No newline at end of file
+        raise
+
+async def generate_response_stream(user_text: str,
+                                   psycho_profile: Dict[str, Dict],
+                                   retrieved_chunks: List[str] = None,
+                                   conversation: Optional[ConversationState] = None) -> AsyncIterator[str]:
+    """
+    Stream the therapist response token by token as the model produces it.
+    """
+    try:
+        logger.debug("Starting streamed response generation...")
+        async for delta in llm_router.stream(
+            "response",
+            messages=build_response_messages(user_text, psycho_profile, retrieved_chunks, conversation),
+            temperature=0.6
+        ):
+            yield delta
+    except Exception as e:
+        logger.error(f"Error in generate_response_stream: {str(e)}")
+        logger.error(f"Error type: {type(e)}")
+        raise
@@ -0,0 +1,274 @@
+# === File: scheduler.py ===
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+import openai
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.tokens import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class Priority(IntEnum):
+    CHAT = 0
+    BACKGROUND = 1
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM provider circuit is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+# === Rate limiting ===
+class RateLimiter:
+    """
+    Local requests-per-minute and tokens-per-minute buckets. Waiters are served
+    strictly by priority, then arrival order, so chat calls overtake queued
+    background work instead of both being rejected by the provider.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._waiters: List = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def _can_take(self, tokens: int) -> bool:
+        # A request larger than the whole bucket may go once the bucket is full
+        return self._requests >= 1 and self._tokens >= min(tokens, self.tpm)
+
+    def _take(self, tokens: int) -> None:
+        self._requests -= 1
+        self._tokens -= tokens
+
+    def try_acquire(self, tokens: int) -> bool:
+        self._refill()
+        if not self._waiters and self._can_take(tokens):
+            self._take(tokens)
+            return True
+        return False
+
+    async def acquire(self, tokens: int, priority: Priority = Priority.CHAT) -> None:
+        if self.try_acquire(tokens):
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), tokens, future))
+        metrics.increment("scheduler", f"queued:{priority.name.lower()}")
+        self._dispatch()
+        await future
+
+    def adjust(self, tokens: int) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        self._tokens = min(self.tpm, self._tokens - tokens)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_take(tokens):
+                missing_requests = max(0.0, 1 - self._requests) * 60.0 / self.rpm
+                missing_tokens = max(0.0, min(tokens, self.tpm) - self._tokens) * 60.0 / self.tpm
+                delay = max(missing_requests, missing_tokens, 0.01)
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._take(tokens)
+            future.set_result(None)
+
+# === Circuit breaker ===
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive provider failures and sheds calls
+    for `reset_seconds`; then lets a single probe through before closing again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError while open. Returns True when this call is the half-open
+        probe, in which case the caller must call `end_probe` once it finishes.
+        """
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        retry_after = self.reset_seconds - (time.monotonic() - self._opened_at)
+        metrics.increment("scheduler", "shed")
+        raise CircuitOpenError(max(retry_after, 1.0))
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            if self._opened_at is None or self._probing:
+                logger.warning("LLM circuit breaker opened")
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def end_probe(self) -> None:
+        """
+        Called after the probe finishes however it ended. A probe that neither succeeded
+        nor failed (cancelled, or an unexpected error) re-opens the breaker, so the next
+        probe is allowed after another `reset_seconds`.
+        """
+        if self._probing:
+            logger.warning("LLM circuit breaker probe did not complete; reopening")
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+# === Scheduler ===
+class LLMScheduler:
+    """
+    Single entry point for provider calls: local rate limiting with priorities,
+    retries with full-jitter exponential backoff (honouring Retry-After), optional
+    hedging of slow calls and a circuit breaker.
+    """
+
+    def __init__(self,
+                 limiter: Optional[RateLimiter] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 max_retries: int = settings.LLM_MAX_RETRIES,
+                 backoff_base: float = settings.LLM_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = settings.LLM_BACKOFF_MAX_SECONDS,
+                 hedge_after_ms: Optional[float] = settings.LLM_HEDGE_AFTER_MS):
+        self.limiter = limiter or RateLimiter(settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_TOKENS_PER_MINUTE)
+        self.breaker = breaker or CircuitBreaker(settings.LLM_BREAKER_FAILURE_THRESHOLD, settings.LLM_BREAKER_RESET_SECONDS)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms else None
+
+    async def submit(self,
+                     call: Callable[[], Awaitable[T]],
+                     priority: Priority = Priority.CHAT,
+                     estimated_tokens: int = 1000) -> T:
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                await self.limiter.acquire(estimated_tokens, priority)
+                if self.hedge_after and priority == Priority.CHAT:
+                    result = await self._hedged(call, estimated_tokens)
+                else:
+                    result = await call()
+            except RETRYABLE_ERRORS as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    metrics.increment("scheduler", "exhausted")
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                metrics.increment("scheduler", "retries")
+                logger.info(f"Retrying LLM call in {delay:.2f}s after {type(e).__name__} (attempt {attempt})")
+                await asyncio.sleep(delay)
+                continue
+            except openai.APIStatusError:
+                # Other 4xx responses are caller errors, not provider health problems;
+                # the provider did answer, so a probe counts as a success
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+            finally:
+                if probe:
+                    self.breaker.end_probe()
+
+            usage = getattr(result, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                self.limiter.adjust(usage.total_tokens - estimated_tokens)
+            return result
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(0, cap)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    async def _hedged(self, call: Callable[[], Awaitable[T]], estimated_tokens: int) -> T:
+        primary = asyncio.ensure_future(call())
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done or not self.limiter.try_acquire(estimated_tokens):
+            return await primary
+
+        metrics.increment("scheduler", "hedged")
+        hedge = asyncio.ensure_future(call())
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+def estimate_tokens(messages, max_tokens: int) -> int:
+    """Prompt size plus the completion allowance."""
+    return count_message_tokens(messages) + max_tokens
+
+llm_scheduler = LLMScheduler()
@@ -1,5 +1,10 @@
+import asyncio
+import copy
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from cryptography.fernet import Fernet
@@ -7,6 +12,8 @@ from app.core.config import settings
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.db.mongodb import mongodb
+from app.core.metrics import metrics
+from app.core.tracing import user_id_var
 from bson import ObjectId
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -19,6 +26,48 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a dedicated thread pool (bcrypt releases
+    the GIL), so a login burst does not block the event loop. At most `workers` calls
+    run and `max_queue` wait; beyond that calls are rejected at once with a 503.
+    """
+
+    def __init__(self,
+                 workers: int = settings.PASSWORD_HASH_WORKERS,
+                 max_queue: int = settings.PASSWORD_HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._inflight = 0
+
+    async def _run(self, fn, *args):
+        if self._inflight >= self.workers + self.max_queue:
+            metrics.increment("password_hash", "rejected")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-in requests, please try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self._inflight += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._inflight -= 1
+            metrics.observe("password_hash", (time.perf_counter() - started) * 1000)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+password_hasher = PasswordHasher()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -35,7 +84,48 @@ def encrypt_data(data: str) -> str:
 def decrypt_data(encrypted_data: str) -> str:
     return fernet.decrypt(encrypted_data.encode()).decode()
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+class UserCache:
+    """
+    Bounded, TTL-limited cache of user documents keyed by token subject (the user id).
+    Writes to a user must call `invalidate` or `put`; other workers see the change
+    once their entry expires.
+    """
+
+    def __init__(self,
+                 max_entries: int = settings.USER_CACHE_SIZE,
+                 ttl_seconds: float = settings.USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+
+    def get(self, subject: str) -> Optional[dict]:
+        entry = self._entries.get(subject)
+        if entry is None:
+            return None
+        user, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl_seconds:
+            del self._entries[subject]
+            return None
+        self._entries.move_to_end(subject)
+        return copy.deepcopy(user)
+
+    def put(self, subject: str, user: dict) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[subject] = (copy.deepcopy(user), time.monotonic())
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, subject: str) -> None:
+        self._entries.pop(subject, None)
+
+user_cache = UserCache()
+
+async def get_user_from_token(token: str):
+    """
+    Resolve the user document for a bearer token, raising 401 when it is invalid.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -48,12 +138,22 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    user_id_var.set(user_id)
     
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
     users_collection = mongodb.get_collection("users")
     user = await users_collection.find_one({"_id": ObjectId(user_id)})
     
     if user is None:
         raise credentials_exception
+    user_cache.put(user_id, user)
     
     # Keep the ObjectId as is
-    return user 
\ No newline at end of file
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # FastAPI caches dependencies per request, so every consumer in a request shares this document
+    return await get_user_from_token(token)
@@ -0,0 +1,149 @@
+# === File: sentiment_rollups.py ===
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.db.indexes import ensure_indexes
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_COLLECTION = "sentiment_rollups"
+LOGS_COLLECTION = "sentiment_logs"
+
+def to_naive_utc(timestamp: datetime) -> datetime:
+    """
+    Naive UTC datetime, the form MongoDB returns and the summaries query with.
+    """
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+def day_start(timestamp: datetime) -> datetime:
+    """UTC day of `timestamp`, matching $dateTrunc in the backfill."""
+    timestamp = to_naive_utc(timestamp)
+    return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+def _tag_name(tag: Any) -> str:
+    return tag.value if isinstance(tag, Enum) else str(tag)
+
+def rollup_update(log: Dict) -> Tuple[Dict, Dict]:
+    """
+    Filter and `$inc` upsert that adds one sentiment log to its user's daily rollup.
+    """
+    increments = {"count": 1, "score_sum": log["sentiment_score"]}
+    for tag in log.get("emotion_tags") or []:
+        key = f"emotions.{_tag_name(tag)}"
+        increments[key] = increments.get(key, 0) + 1
+    return (
+        {"user_id": log["user_id"], "day": day_start(log["timestamp"])},
+        {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+async def record_log(log: Dict) -> None:
+    """
+    Add a stored sentiment log to the daily rollups. A single upsert, so concurrent
+    writers for the same day never lose an increment.
+    """
+    query, update = rollup_update(log)
+    await mongodb.get_collection(ROLLUPS_COLLECTION).update_one(query, update, upsert=True)
+
+async def record_logs(logs: List[Dict]) -> None:
+    """
+    Add a batch of stored logs, combining the increments so each rollup is written once.
+    """
+    updates: Dict[Tuple[str, datetime], Dict] = {}
+    for log in logs:
+        query, update = rollup_update(log)
+        key = (query["user_id"], query["day"])
+        if key not in updates:
+            updates[key] = update
+            continue
+        increments = updates[key]["$inc"]
+        for field, value in update["$inc"].items():
+            increments[field] = increments.get(field, 0) + value
+    if not updates:
+        return
+    await mongodb.get_collection(ROLLUPS_COLLECTION).bulk_write(
+        [UpdateOne({"user_id": user_id, "day": day}, update, upsert=True) for (user_id, day), update in updates.items()],
+        ordered=False
+    )
+
+def _backfill_pipeline(match: Dict, rebuilt_at: datetime) -> List[Dict]:
+    """
+    One $group/$merge pass that writes each matched day's totals and emotion counts
+    together, so a rollup is never left with its totals but without its emotions.
+    """
+    day = {"$dateTrunc": {"date": "$timestamp", "unit": "day"}}
+    # A log with n tags unwinds into n rows (one untagged row when it has none); only its first row counts the log
+    first_row = {"$lte": [{"$ifNull": ["$tag_index", 0]}, 0]}
+    return [
+        {"$match": match},
+        {"$unwind": {"path": "$emotion_tags", "includeArrayIndex": "tag_index", "preserveNullAndEmptyArrays": True}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "day": day, "tag": "$emotion_tags"},
+            "count": {"$sum": {"$cond": [first_row, 1, 0]}},
+            "score_sum": {"$sum": {"$cond": [first_row, "$sentiment_score", 0]}},
+            "tag_count": {"$sum": 1}
+        }},
+        {"$group": {
+            "_id": {"user_id": "$_id.user_id", "day": "$_id.day"},
+            "count": {"$sum": "$count"},
+            "score_sum": {"$sum": "$score_sum"},
+            "emotions": {"$push": {"k": "$_id.tag", "v": "$tag_count"}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "day": "$_id.day",
+            "count": 1,
+            "score_sum": 1,
+            "emotions": {"$arrayToObject": {"$filter": {"input": "$emotions", "cond": {"$eq": [{"$type": "$$this.k"}, "string"]}}}},
+            "updated_at": {"$literal": rebuilt_at}
+        }},
+        {"$merge": {"into": ROLLUPS_COLLECTION, "on": ["user_id", "day"], "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+async def backfill(user_id: Optional[str] = None) -> None:
+    """
+    Rebuild the daily rollups from sentiment_logs, for one user or everyone.
+
+    The rollups are recomputed inside MongoDB with $group/$merge, so nothing is read
+    into the application. Rollups of the rebuilt users that no log backs any more are
+    deleted. Logs written while it runs may be counted twice or not at all for that
+    day; run it again for the affected users to reconcile.
+    """
+    match = {"user_id": user_id} if user_id else {}
+    # Millisecond precision, as stored, so rebuilt rollups compare equal to it
+    now = datetime.utcnow()
+    rebuilt_at = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    async for _ in mongodb.get_collection(LOGS_COLLECTION).aggregate(_backfill_pipeline(match, rebuilt_at)):
+        pass
+    # Every rollup the pass wrote, or a live write touched since, has updated_at >= rebuilt_at
+    result = await mongodb.get_collection(ROLLUPS_COLLECTION).delete_many({**match, "updated_at": {"$lt": rebuilt_at}})
+    if result.deleted_count:
+        logger.info(f"Deleted {result.deleted_count} sentiment rollups without logs")
+
+async def _run(user_id: Optional[str]) -> None:
+    await mongodb.connect_to_mongo()
+    try:
+        # $merge needs the unique (user_id, day) index on the rollups
+        await ensure_indexes()
+        await backfill(user_id)
+        print(f"Rebuilt sentiment rollups for {'user ' + user_id if user_id else 'all users'}")
+    finally:
+        await mongodb.close_mongo_connection()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the daily sentiment rollups from sentiment_logs")
+    parser.add_argument("--user-id", help="Only rebuild this user's rollups")
+    args = parser.parse_args()
+    asyncio.run(_run(args.user_id))
+
+if __name__ == "__main__":
+    main()
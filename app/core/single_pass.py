@@ -0,0 +1,125 @@
+# === File: single_pass.py ===
+import logging
+import re
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+from app.core.analyzer import PROFILE_CATEGORIES
+from app.core.conversation import ConversationState
+from app.core.emotion_classifier import EMOTIONS
+from app.core.llm import llm_router
+from app.core.prompts import build_prompt_messages
+from app.core.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+class SinglePassResult(BaseModel):
+    emotions: Dict[str, float]
+    profile_updates: Dict[str, Dict]
+    reply: str
+
+    @field_validator("emotions")
+    @classmethod
+    def validate_emotions(cls, v: Dict[str, float]) -> Dict[str, float]:
+        unknown = set(v) - set(EMOTIONS)
+        if unknown:
+            raise ValueError(f"Unknown emotions: {sorted(unknown)}")
+        if any(score < 0.0 or score > 1.0 for score in v.values()):
+            raise ValueError("Emotion scores must be between 0.0 and 1.0")
+        return v
+
+    @field_validator("profile_updates")
+    @classmethod
+    def validate_profile_updates(cls, v: Dict[str, Dict]) -> Dict[str, Dict]:
+        unknown = set(v) - set(PROFILE_CATEGORIES)
+        if unknown:
+            raise ValueError(f"Unknown profile categories: {sorted(unknown)}")
+        return v
+
+    @field_validator("reply")
+    @classmethod
+    def validate_reply(cls, v: str) -> str:
+        v = v.strip()
+        if not v:
+            raise ValueError("Reply is empty")
+        return v
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+def parse_single_pass(raw: str) -> Optional[SinglePassResult]:
+    """
+    Validate the model output; returns None when it does not match the expected structure.
+    """
+    try:
+        return SinglePassResult.model_validate_json(_FENCE_RE.sub("", raw.strip()))
+    except ValidationError as e:
+        logger.warning(f"Single-pass output failed validation: {str(e)}")
+        return None
+
+def merge_profile_updates(psychoanalysis: Dict[str, Dict], updates: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Apply per-category deltas: new or changed entries overwrite, everything else is kept.
+    A stored category that is not an observation mapping (older profiles) is replaced
+    by the update.
+    """
+    merged = {category: dict(entries) if isinstance(entries, dict) else entries
+              for category, entries in psychoanalysis.items()}
+    for category, entries in updates.items():
+        if not isinstance(entries, dict):
+            continue
+        if not isinstance(merged.get(category), dict):
+            merged[category] = {}
+        merged[category].update(entries)
+    return merged
+
+SINGLE_PASS_SYSTEM_PROMPT = f"""You are an insightful and compassionate AI therapist and psychoanalytic expert. You answer only with JSON.
+You receive the user's message, current psychoanalytic observations about the user (Profile, compact JSON)
+and related things the user said before.
+
+Return a single JSON object with exactly these keys:
+- "emotions": confidence scores (0.0 to 1.0) keyed by {", ".join(EMOTIONS)}
+- "profile_updates": only the observations that are new or changed, keyed by any of
+  {", ".join(PROFILE_CATEGORIES)}; each value maps an observation to
+  {{"short_term": <0.0-1.0>, "long_term": <0.0-1.0>}}
+- "reply": your response to the user, written like a therapist would — warm, curious,
+  open-minded, and reflective, using their language when possible"""
+
+def build_single_pass_messages(user_text: str,
+                               psycho_profile: Dict[str, Dict],
+                               retrieved_chunks: List[str] = None,
+                               conversation: Optional[ConversationState] = None) -> List[Dict[str, str]]:
+    return build_prompt_messages(
+        "single_pass",
+        SINGLE_PASS_SYSTEM_PROMPT,
+        user_text,
+        profile=psycho_profile.get("psychoanalysis", {}),
+        chunks=retrieved_chunks,
+        history=conversation.to_messages() if conversation else None
+    )
+
+async def analyze_and_respond(user_text: str,
+                              psycho_profile: Dict[str, Dict],
+                              retrieved_chunks: List[str] = None,
+                              conversation: Optional[ConversationState] = None) -> Optional[SinglePassResult]:
+    """
+    Get emotions, profile deltas and the reply from one model call.
+    Returns None on API or validation errors so the caller can fall back to the multi-call path.
+    """
+    try:
+        response = await llm_router.complete(
+            "single_pass",
+            messages=build_single_pass_messages(user_text, psycho_profile, retrieved_chunks, conversation),
+            temperature=0.5
+        )
+    except Exception as e:
+        logger.error(f"Error in analyze_and_respond: {str(e)}")
+        return None
+
+    result = parse_single_pass(response.choices[0].message.content or "")
+    usage = response.usage.model_dump() if response.usage else None
+    tracer.record("single_pass", inputs=user_text, outputs={
+        "result": result.model_dump() if result else None,
+        "usage": usage
+    })
+    return result
@@ -0,0 +1,270 @@
+# === File: singleflight.py ===
+import asyncio
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+
+class RequestInProgressError(Exception):
+    """Raised when a duplicate request gave up waiting for the original to finish."""
+
+class IdempotencyKeyReusedError(Exception):
+    """Raised when an idempotency key is reused for a request with a different body."""
+
+def request_fingerprint(*parts: Any) -> str:
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+def request_key(user_id: str, idempotency_key: Optional[str], *parts: Any) -> str:
+    """
+    Dedupe key: the client's idempotency key when it sent one, otherwise a hash of the request.
+    """
+    if idempotency_key:
+        return f"{user_id}:key:{idempotency_key}"
+    return f"{user_id}:hash:{request_fingerprint(*parts)}"
+
+def _check_fingerprint(key: str, stored: Optional[str], fingerprint: Optional[str]) -> None:
+    if stored is not None and fingerprint is not None and stored != fingerprint:
+        raise IdempotencyKeyReusedError(f"Request {key} was already used for a different request")
+
+# === Backends ===
+class SingleFlightBackend(ABC):
+    """
+    Shared record of in-flight and recently completed requests.
+    """
+
+    async def start(self) -> None:
+        pass
+
+    @abstractmethod
+    async def claim(self, key: str, pending_ttl: float, fingerprint: Optional[str] = None) -> Tuple[str, Optional[Dict]]:
+        """
+        Try to become the owner of `key`. Returns (None, None) when claimed,
+        (PENDING, None) while another request runs, or (DONE, result) once it finished.
+        Raises IdempotencyKeyReusedError when the live record was made for a request with
+        a different `fingerprint`.
+        """
+
+    @abstractmethod
+    async def complete(self, key: str, result: Dict, ttl: float) -> None:
+        pass
+
+    @abstractmethod
+    async def release(self, key: str) -> None:
+        """Forget a failed request so the next duplicate runs it again."""
+
+    @abstractmethod
+    async def wait(self, key: str, timeout: float) -> Optional[Dict]:
+        """
+        Wait for the owner of `key`; returns its result, or None if it was released.
+        Raises RequestInProgressError after `timeout`.
+        """
+
+class _Flight:
+    __slots__ = ("future", "expires_at", "fingerprint")
+
+    def __init__(self, future: asyncio.Future, expires_at: float, fingerprint: Optional[str]):
+        self.future = future
+        self.expires_at = expires_at
+        self.fingerprint = fingerprint
+
+class InMemorySingleFlightBackend(SingleFlightBackend):
+    """
+    Process-local backend; duplicates await the original request's future directly.
+    At most `max_entries` completed results are kept, least recently used first out.
+    """
+
+    def __init__(self,
+                 sweep_interval: float = 60.0,
+                 max_entries: int = settings.SINGLE_FLIGHT_MAX_ENTRIES):
+        self.sweep_interval = sweep_interval
+        self.max_entries = max_entries
+        # In-flight requests are kept apart and never evicted; their waiters hold the future
+        self._pending: Dict[str, _Flight] = {}
+        # Completed requests in LRU order, oldest first
+        self._done: "OrderedDict[str, _Flight]" = OrderedDict()
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def _sweep(self, now: float) -> None:
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        for key in [key for key, flight in self._done.items() if flight.expires_at <= now]:
+            del self._done[key]
+
+    def _evict(self) -> None:
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    async def claim(self, key: str, pending_ttl: float, fingerprint: Optional[str] = None) -> Tuple[str, Optional[Dict]]:
+        now = time.monotonic()
+        self._sweep(now)
+        flight = self._pending.get(key)
+        if flight is not None:
+            _check_fingerprint(key, flight.fingerprint, fingerprint)
+            return PENDING, None
+        flight = self._done.pop(key, None)
+        if flight is not None and flight.expires_at > now:
+            _check_fingerprint(key, flight.fingerprint, fingerprint)
+            self._done[key] = flight
+            return DONE, flight.future.result()
+        self._pending[key] = _Flight(asyncio.get_running_loop().create_future(), now + pending_ttl, fingerprint)
+        return None, None
+
+    async def complete(self, key: str, result: Dict, ttl: float) -> None:
+        flight = self._pending.pop(key, None)
+        if flight is not None:
+            flight.future.set_result(result)
+            flight.expires_at = time.monotonic() + ttl
+            self._done[key] = flight
+            self._evict()
+
+    async def release(self, key: str) -> None:
+        flight = self._pending.pop(key, None)
+        if flight is not None:
+            flight.future.set_result(None)
+
+    async def wait(self, key: str, timeout: float) -> Optional[Dict]:
+        flight = self._pending.get(key) or self._done.get(key)
+        if flight is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.future), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise RequestInProgressError(f"Request {key} is still in progress")
+
+class MongoSingleFlightBackend(SingleFlightBackend):
+    """
+    Shared backend for multi-worker deployments. Claiming is an insert on a unique
+    `_id`; duplicates poll the record until it completes. Records expire through a
+    TTL index (declared in app.db.indexes), and a pending record whose owner died
+    becomes claimable at `expires_at`.
+    """
+
+    def __init__(self,
+                 collection_name: str = "request_dedup",
+                 poll_interval: float = settings.SINGLE_FLIGHT_POLL_INTERVAL_SECONDS):
+        self.collection_name = collection_name
+        self.poll_interval = poll_interval
+
+    @property
+    def collection(self):
+        return mongodb.get_collection(self.collection_name)
+
+    async def claim(self, key: str, pending_ttl: float, fingerprint: Optional[str] = None) -> Tuple[str, Optional[Dict]]:
+        now = datetime.utcnow()
+        record = {
+            "_id": key,
+            "status": PENDING,
+            "fingerprint": fingerprint,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=pending_ttl)
+        }
+        try:
+            await self.collection.insert_one(record)
+            return None, None
+        except DuplicateKeyError:
+            pass
+
+        doc = await self.collection.find_one({"_id": key})
+        if doc is not None and doc["expires_at"] > now:
+            _check_fingerprint(key, doc.get("fingerprint"), fingerprint)
+            return doc["status"], doc.get("result")
+
+        # Expired but not yet removed by the TTL monitor: take it over unless someone else just did
+        result = await self.collection.replace_one({"_id": key, "expires_at": {"$lte": now}}, record)
+        if result.modified_count == 1:
+            return None, None
+        return PENDING, None
+
+    async def complete(self, key: str, result: Dict, ttl: float) -> None:
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"status": DONE, "result": result, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)}}
+        )
+
+    async def release(self, key: str) -> None:
+        await self.collection.delete_one({"_id": key, "status": PENDING})
+
+    async def wait(self, key: str, timeout: float) -> Optional[Dict]:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            doc = await self.collection.find_one({"_id": key}, {"status": 1, "result": 1})
+            if doc is None:
+                return None
+            if doc["status"] == DONE:
+                return doc.get("result")
+            await asyncio.sleep(self.poll_interval)
+        raise RequestInProgressError(f"Request {key} is still in progress")
+
+# === Coalescing ===
+class SingleFlight:
+    """
+    Runs a request once per key: a duplicate that arrives while the original is in
+    flight awaits its result, and one that arrives after completion gets the stored
+    result back without running anything.
+    """
+
+    def __init__(self,
+                 backend: SingleFlightBackend,
+                 wait_timeout: float = settings.SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS):
+        self.backend = backend
+        self.wait_timeout = wait_timeout
+
+    async def start(self) -> None:
+        await self.backend.start()
+
+    async def run(self,
+                  key: str,
+                  fn: Callable[[], Awaitable[Dict]],
+                  ttl: float,
+                  fingerprint: Optional[str] = None) -> Dict:
+        """
+        Return the result for `key`, calling `fn` only if no other request owns it.
+        Results are kept for `ttl` seconds. When `fingerprint` is given, a duplicate with
+        a different fingerprint raises IdempotencyKeyReusedError instead of getting the
+        other request's result.
+        """
+        while True:
+            # A pending claim outlives the wait so an owner that died is eventually replaced
+            state, result = await self.backend.claim(key, self.wait_timeout * 2, fingerprint)
+            if state == DONE:
+                metrics.increment("single_flight", "replayed")
+                return result
+            if state == PENDING:
+                result = await self.backend.wait(key, self.wait_timeout)
+                if result is not None:
+                    metrics.increment("single_flight", "coalesced")
+                    return result
+                # The original failed and released the key; try to run it ourselves
+                continue
+
+            try:
+                result = await fn()
+            except BaseException:
+                await self.backend.release(key)
+                raise
+            await self.backend.complete(key, result, ttl)
+            return result
+
+def create_backend(name: str) -> SingleFlightBackend:
+    if name == "memory":
+        return InMemorySingleFlightBackend()
+    if name == "mongo":
+        return MongoSingleFlightBackend()
+    raise ValueError(f"Unknown single-flight backend: {name}")
+
+single_flight = SingleFlight(create_backend(settings.SINGLE_FLIGHT_BACKEND))
@@ -0,0 +1,34 @@
+# === File: tokens.py ===
+import logging
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a character estimate
+    _encoding = None
+
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut `text` down to at most `max_tokens` tokens, marking the cut with an ellipsis.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens]) + "…"
+    return text[:max_tokens * 4] + "…"
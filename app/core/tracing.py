@@ -0,0 +1,135 @@
+# === File: tracing.py ===
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# User the current request or job acts for; events are only shown back to that user
+user_id_var: ContextVar[Optional[str]] = ContextVar("trace_user_id", default=None)
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+class Tracer:
+    """
+    Records per-request pipeline stage inputs and outputs into a bounded ring buffer.
+
+    When disabled, `record` returns immediately. An optional sink ("jsonl" or "mongo")
+    receives events in batches from a background task, never from the request path.
+    """
+
+    def __init__(self,
+                 enabled: bool = settings.TRACE_ENABLED,
+                 buffer_size: int = settings.TRACE_BUFFER_SIZE,
+                 sink: str = settings.TRACE_SINK,
+                 flush_interval: float = settings.TRACE_FLUSH_INTERVAL_SECONDS,
+                 jsonl_path: str = settings.TRACE_JSONL_PATH,
+                 collection_name: str = "traces",
+                 capped_size_bytes: int = settings.TRACE_CAPPED_COLLECTION_BYTES):
+        self.enabled = enabled
+        self.sink = sink if sink in ("jsonl", "mongo") else None
+        self.flush_interval = flush_interval
+        self.jsonl_path = jsonl_path
+        self.collection_name = collection_name
+        self.capped_size_bytes = capped_size_bytes
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._unflushed: deque = deque(maxlen=buffer_size)
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # === Recording ===
+    def record(self, stage: str, inputs: Any = None, outputs: Any = None) -> None:
+        if not self.enabled:
+            return
+        event = {
+            "request_id": request_id_var.get() or "background",
+            "user_id": user_id_var.get(),
+            "stage": stage,
+            "inputs": inputs,
+            "outputs": outputs,
+            "timestamp": time.time()
+        }
+        self._buffer.append(event)
+        if self.sink:
+            self._unflushed.append(event)
+
+    def recent(self, limit: int = 50, user_id: Optional[str] = None) -> List[Dict]:
+        """
+        Newest events first; only `user_id`'s events when given.
+        """
+        if limit <= 0:
+            return []
+        events = [event for event in self._buffer if user_id is None or event.get("user_id") == user_id]
+        return events[-limit:][::-1]
+
+    async def for_request(self, request_id: str, user_id: Optional[str] = None) -> List[Dict]:
+        query = {"request_id": request_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        events = [event for event in self._buffer if all(event.get(key) == value for key, value in query.items())]
+        if events or self.sink != "mongo":
+            return events
+        # Older requests may only be in the capped collection
+        cursor = self.collection.find(query, {"_id": 0}).sort("timestamp", 1)
+        return await cursor.to_list(length=None)
+
+    @property
+    def collection(self):
+        return mongodb.get_collection(self.collection_name)
+
+    # === Background persistence ===
+    async def start(self) -> None:
+        if not (self.enabled and self.sink) or self._flush_task is not None:
+            return
+        if self.sink == "mongo":
+            existing = await mongodb.db.list_collection_names(filter={"name": self.collection_name})
+            if not existing:
+                await mongodb.db.create_collection(self.collection_name, capped=True, size=self.capped_size_bytes)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task is None:
+            return
+        self._flush_task.cancel()
+        try:
+            await self._flush_task
+        except asyncio.CancelledError:
+            pass
+        self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing traces: {str(e)}")
+
+    async def flush(self) -> None:
+        batch = []
+        while self._unflushed:
+            batch.append(self._unflushed.popleft())
+        if not batch:
+            return
+        if self.sink == "jsonl":
+            await asyncio.to_thread(self._append_jsonl, batch)
+        elif self.sink == "mongo":
+            # insert_many adds _id to the dicts; copy so the ring buffer stays JSON-friendly
+            await self.collection.insert_many([dict(event) for event in batch], ordered=False)
+
+    def _append_jsonl(self, batch: List[Dict]) -> None:
+        with open(self.jsonl_path, "a", encoding="utf-8") as f:
+            for event in batch:
+                f.write(json.dumps(event, default=str) + "\n")
+
+tracer = Tracer()
@@ -0,0 +1,208 @@
+# === File: vector_memory.py ===
+import asyncio
+import fcntl
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.chunk_store import ChunkStore, ChunkStoreWriter, chunk_count
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+VECTORS_SUFFIX = ".vectors"
+# The vectors file starts with the dimension as one little-endian int64
+HEADER = np.dtype("<i8")
+HEADER_BYTES = HEADER.itemsize
+# Rows scored per matrix product, bounding the temporary arrays of a search
+SEARCH_BLOCK_ROWS = 65536
+
+def _read_dim(path: str) -> int:
+    with open(path, "rb") as f:
+        header = f.read(HEADER_BYTES)
+    if len(header) < HEADER_BYTES:
+        raise ValueError(f"Vector file {path} has no header")
+    return int(np.frombuffer(header, dtype=HEADER)[0])
+
+def _row_count(size: int, dim: int) -> int:
+    return max(size - HEADER_BYTES, 0) // (dim * 4)
+
+class _OpenMemory:
+    __slots__ = ("vectors", "chunks", "size", "last_used")
+
+    def __init__(self, vectors: np.memmap, chunks: ChunkStore, size: int):
+        self.vectors = vectors
+        self.chunks = chunks
+        self.size = size
+        self.last_used = time.monotonic()
+
+class VectorMemory:
+    """
+    Per-user memory of embedded chat messages. `<user>.vectors` holds the L2-normalised
+    float32 embeddings row by row and `<user>.chunks`/`.offsets` (a ChunkStore) the
+    message texts, both addressed by the same row id.
+
+    Both files are np.memmap / mmap views: searching computes inner products block by
+    block straight from the mapping, so the process keeps no private copy of the vectors
+    and the pages it touches are page cache the kernel can reclaim. Open mappings are
+    held in a bounded LRU and idle users are evicted. Appends take an exclusive file
+    lock and only write the new rows; readers remap when the file grew, so several
+    worker processes can share the directory. Searches run on a worker thread, as a
+    brute-force scan of a large memory would otherwise hold up the event loop.
+    """
+
+    def __init__(self,
+                 directory: str = settings.VECTOR_MEMORY_DIR,
+                 max_open: int = settings.VECTOR_MEMORY_MAX_OPEN,
+                 idle_seconds: float = settings.VECTOR_MEMORY_IDLE_SECONDS):
+        self.directory = directory
+        self.max_open = max_open
+        self.idle_seconds = idle_seconds
+        self._open: "OrderedDict[str, _OpenMemory]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prefix(self, user_id: str) -> str:
+        # User ids are ObjectId hex strings; keep anything else out of the path
+        safe_id = "".join(c for c in user_id if c.isalnum())
+        return os.path.join(self.directory, safe_id)
+
+    def _path(self, user_id: str) -> str:
+        return self._prefix(user_id) + VECTORS_SUFFIX
+
+    @contextmanager
+    def _file_lock(self, user_id: str):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._prefix(user_id) + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # === Mapping cache ===
+    def _get(self, user_id: str) -> Optional[_OpenMemory]:
+        path = self._path(user_id)
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            entry = self._open.get(user_id)
+            if entry is not None and entry.size == size:
+                entry.last_used = time.monotonic()
+                self._open.move_to_end(user_id)
+                return entry
+
+        dim = _read_dim(path)
+        rows = _row_count(size, dim)
+        vectors = np.memmap(path, dtype=np.float32, mode="r", offset=HEADER_BYTES, shape=(rows, dim)) if rows else np.zeros((0, dim), dtype=np.float32)
+        entry = _OpenMemory(vectors, ChunkStore(self._prefix(user_id)), size)
+        with self._lock:
+            self._open[user_id] = entry
+            self._open.move_to_end(user_id)
+            self._evict()
+        return entry
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._open:
+            user_id, entry = next(iter(self._open.items()))
+            if len(self._open) > self.max_open or now - entry.last_used > self.idle_seconds:
+                # Mappings are released once in-flight searches drop their references
+                del self._open[user_id]
+            else:
+                break
+
+    # === Writes ===
+    def _append(self, user_id: str, vectors: np.ndarray, texts: List[str]) -> List[int]:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        dim = vectors.shape[1]
+        path = self._path(user_id)
+        prefix = self._prefix(user_id)
+        with self._file_lock(user_id):
+            # Row ids are chunk positions; texts are published before the vectors that point at them
+            start = chunk_count(prefix)
+            with ChunkStoreWriter(prefix) as writer:
+                for text in texts:
+                    writer.append(text)
+
+            with open(path, "ab+") as f:
+                if f.tell() == 0:
+                    f.write(np.asarray([dim], dtype=HEADER).tobytes())
+                elif _read_dim(path) != dim:
+                    raise ValueError(f"Vector memory of user {user_id} has a different dimension than {dim}")
+                # Realign after an interrupted append: drop a partial row, or pad rows
+                # whose texts were written without their vectors
+                rows = _row_count(f.tell(), dim)
+                f.truncate(HEADER_BYTES + min(rows, start) * dim * 4)
+                f.seek(0, os.SEEK_END)
+                if rows < start:
+                    f.write(np.zeros((start - rows, dim), dtype=np.float32).tobytes())
+                f.write(vectors.astype(np.float32).tobytes())
+        self._close(user_id)
+        return list(range(start, start + len(vectors)))
+
+    async def append(self, user_id: str, vectors: np.ndarray, texts: List[str]) -> List[int]:
+        """
+        Append embedded chunks and their texts to the user's memory and return their row ids.
+        """
+        return await asyncio.to_thread(self._append, user_id, vectors, texts)
+
+    def reset(self, user_id: str) -> None:
+        """
+        Delete the user's stored memory (used when rebuilding it from chat history).
+        """
+        prefix = self._prefix(user_id)
+        with self._file_lock(user_id):
+            for suffix in (VECTORS_SUFFIX, ".chunks", ".offsets"):
+                if os.path.exists(prefix + suffix):
+                    os.remove(prefix + suffix)
+        self._close(user_id)
+
+    def _close(self, user_id: str) -> None:
+        with self._lock:
+            self._open.pop(user_id, None)
+
+    # === Reads ===
+    def _search(self, user_id: str, vector: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        entry = self._get(user_id)
+        if entry is None or k <= 0:
+            return []
+        size = min(len(entry.vectors), len(entry.chunks))
+        if size == 0:
+            return []
+        query = np.ascontiguousarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        best_ids = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, size, SEARCH_BLOCK_ROWS):
+            scores = entry.vectors[start:min(start + SEARCH_BLOCK_ROWS, size)] @ query
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k] if len(scores) > k else np.arange(len(scores))
+            best_ids = np.concatenate([best_ids, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_ids) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_ids, best_scores = best_ids[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores)
+        return [(entry.chunks.get(int(best_ids[i])), float(best_scores[i])) for i in order]
+
+    async def search(self, user_id: str, vector: np.ndarray, k: int = 3) -> List[Tuple[str, float]]:
+        """
+        Return (chunk text, cosine similarity) pairs for the user's nearest stored messages.
+        """
+        return await asyncio.to_thread(self._search, user_id, vector, k)
+
+vector_memory = VectorMemory()
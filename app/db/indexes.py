@@ -0,0 +1,247 @@
+# === File: indexes.py ===
+import argparse
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+
+from app.core.config import settings
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+class IndexCreationError(Exception):
+    """Raised when a unique index the application relies on could not be created."""
+
+    def __init__(self, message: str, report: List[Dict[str, Any]]):
+        super().__init__(message)
+        self.report = report
+
+class IndexSpec:
+    """
+    One index the application relies on. `when` limits it to deployments that use
+    the collection (e.g. the Mongo job queue backend).
+    """
+
+    def __init__(self,
+                 collection: str,
+                 keys: List[Tuple[str, int]],
+                 name: Optional[str] = None,
+                 unique: bool = False,
+                 when: Optional[Callable[[], bool]] = None,
+                 **options: Any):
+        self.collection = collection
+        self.keys = keys
+        self.name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        self.unique = unique
+        self.when = when
+        self.options = options
+
+    @property
+    def enabled(self) -> bool:
+        return self.when is None or self.when()
+
+    def matches(self, info: Dict[str, Any]) -> bool:
+        if [tuple(key) for key in info["key"]] != [tuple(key) for key in self.keys]:
+            return False
+        if bool(info.get("unique", False)) != self.unique:
+            return False
+        return all(info.get(option) == value for option, value in self.options.items())
+
+    async def create(self) -> None:
+        collection = mongodb.get_collection(self.collection)
+        await collection.create_index(self.keys, name=self.name, unique=self.unique, **self.options)
+
+    async def duplicate_count(self) -> int:
+        """
+        Number of key values held by more than one document, which would make creating
+        this unique index fail (0 for non-unique indexes).
+        """
+        if not self.unique:
+            return 0
+        pipeline = []
+        if "partialFilterExpression" in self.options:
+            pipeline.append({"$match": self.options["partialFilterExpression"]})
+        pipeline += [
+            {"$group": {"_id": {field.replace(".", "_"): f"${field}" for field, _ in self.keys}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$count": "duplicates"}
+        ]
+        result = await mongodb.get_collection(self.collection).aggregate(pipeline).to_list(length=1)
+        return result[0]["duplicates"] if result else 0
+
+INDEXES: List[IndexSpec] = [
+    IndexSpec("users", [("email", 1)], unique=True),
+    IndexSpec("chats", [("user_id", 1), ("created_at", -1), ("_id", -1)]),
+    IndexSpec("messages", [("user_id", 1), ("timestamp", -1), ("_id", -1)]),
+    IndexSpec("chat_sessions", [("user_id", 1), ("start_time", -1)]),
+    IndexSpec("sentiment_logs", [("user_id", 1), ("timestamp", -1)]),
+    IndexSpec("sentiment_rollups", [("user_id", 1), ("day", 1)], unique=True),
+    IndexSpec("long_term_memory", [("user_id", 1), ("last_updated", -1)]),
+    IndexSpec("long_term_memory", [("user_id", 1), ("trait_type", 1), ("last_updated", -1)]),
+    IndexSpec("connected_services", [("user_id", 1), ("service_type", 1)], unique=True),
+    IndexSpec("psycho_profiles", [("user_id", 1)], unique=True),
+    IndexSpec("conversation_state", [("user_id", 1)], unique=True),
+    IndexSpec(
+        "jobs", [("kind", 1), ("key", 1)],
+        name="pending_job_per_key",
+        unique=True,
+        partialFilterExpression={"status": "pending"},
+        when=lambda: settings.JOB_QUEUE_BACKEND == "mongo"
+    ),
+    # Keys in the other order: index key patterns must differ to be declared side by side
+    IndexSpec(
+        "jobs", [("key", 1), ("kind", 1)],
+        name="running_job_per_key",
+        unique=True,
+        partialFilterExpression={"status": "running"},
+        when=lambda: settings.JOB_QUEUE_BACKEND == "mongo"
+    ),
+    IndexSpec("jobs", [("status", 1), ("run_after", 1)], when=lambda: settings.JOB_QUEUE_BACKEND == "mongo"),
+    IndexSpec("jobs", [("status", 1), ("heartbeat_at", 1)], when=lambda: settings.JOB_QUEUE_BACKEND == "mongo"),
+    IndexSpec(
+        "jobs", [("expires_at", 1)],
+        expireAfterSeconds=0,
+        when=lambda: settings.JOB_QUEUE_BACKEND == "mongo"
+    ),
+    IndexSpec(
+        "request_dedup", [("expires_at", 1)],
+        expireAfterSeconds=0,
+        when=lambda: settings.SINGLE_FLIGHT_BACKEND == "mongo"
+    ),
+]
+
+# Representative queries from the endpoints, checked with explain() for collection scans
+QUERY_SHAPES: List[Tuple[str, Dict[str, Any], List[Tuple[str, int]]]] = [
+    ("chats", {"user_id": ""}, [("created_at", -1), ("_id", -1)]),
+    ("messages", {"user_id": ""}, [("timestamp", -1), ("_id", -1)]),
+    ("chat_sessions", {"user_id": ""}, [("start_time", -1)]),
+    ("sentiment_logs", {"user_id": ""}, [("timestamp", -1)]),
+    ("sentiment_rollups", {"user_id": ""}, [("day", 1)]),
+    ("long_term_memory", {"user_id": ""}, [("last_updated", -1)]),
+    ("long_term_memory", {"user_id": "", "trait_type": ""}, [("last_updated", -1)]),
+    ("connected_services", {"user_id": ""}, []),
+    ("users", {"email": ""}, []),
+]
+
+async def ensure_indexes(dry_run: bool = False) -> List[Dict[str, Any]]:
+    """
+    Compare INDEXES with what exists and create the missing ones.
+
+    Returns one entry per index with an `action`: "ok", "create" (created, or would be
+    with `dry_run`), "failed" (creation failed, or would fail on duplicate keys; the
+    entry has an `error`), "conflict" (same name, different definition; left untouched)
+    or "unmanaged" (exists but is not declared).
+
+    Unique indexes enforce invariants the endpoints rely on (one account per email, one
+    connection per service), so when one failed, or conflicts with an existing index that
+    is not unique, IndexCreationError is raised after the report is logged. Other
+    failures are only logged and startup goes on without the index.
+    """
+    report = []
+    unenforced = []
+    specs_by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in INDEXES:
+        if spec.enabled:
+            specs_by_collection.setdefault(spec.collection, []).append(spec)
+
+    for collection_name, specs in specs_by_collection.items():
+        existing = await mongodb.get_collection(collection_name).index_information()
+        for spec in specs:
+            info = existing.get(spec.name)
+            entry = {"collection": collection_name, "index": spec.name}
+            if info is None:
+                entry["action"] = "create"
+                try:
+                    if dry_run:
+                        duplicates = await spec.duplicate_count()
+                        if duplicates:
+                            entry.update(action="failed", error=f"{duplicates} duplicate key values")
+                    else:
+                        await spec.create()
+                except PyMongoError as e:
+                    entry.update(action="failed", error=str(e))
+                if entry["action"] == "failed" and spec.unique:
+                    unenforced.append(entry)
+            elif spec.matches(info):
+                entry["action"] = "ok"
+            else:
+                entry["action"] = "conflict"
+                if spec.unique and not info.get("unique", False):
+                    unenforced.append(entry)
+            report.append(entry)
+
+        declared = {spec.name for spec in specs}
+        for name in existing:
+            if name != "_id_" and name not in declared:
+                report.append({"collection": collection_name, "index": name, "action": "unmanaged"})
+
+    for entry in report:
+        level = logging.ERROR if entry in unenforced else logging.WARNING
+        if entry["action"] == "conflict":
+            logger.log(level, f"Index {entry['collection']}.{entry['index']} differs from its declaration; drop it to recreate")
+        elif entry["action"] == "failed":
+            logger.log(level, f"Index {entry['collection']}.{entry['index']} {'would fail' if dry_run else 'failed'}: {entry['error']}")
+        elif entry["action"] == "create":
+            logger.info(f"{'Would create' if dry_run else 'Created'} index {entry['collection']}.{entry['index']}")
+
+    if unenforced and not dry_run:
+        names = ", ".join(f"{entry['collection']}.{entry['index']}" for entry in unenforced)
+        raise IndexCreationError(f"Unique indexes are not enforced: {names}", report)
+    return report
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return [stage for stage in stages if stage]
+
+async def find_collection_scans() -> List[Dict[str, Any]]:
+    """
+    Explain every QUERY_SHAPES query and return the ones whose winning plan is a COLLSCAN.
+    """
+    scans = []
+    for collection_name, query, sort in QUERY_SHAPES:
+        cursor = mongodb.get_collection(collection_name).find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            scans.append({"collection": collection_name, "filter": list(query), "sort": sort, "plan": stages})
+            logger.warning(f"Query on {collection_name} by {list(query)} sorted by {sort} is a collection scan")
+    return scans
+
+async def _run(dry_run: bool, explain: bool) -> None:
+    await mongodb.connect_to_mongo()
+    try:
+        failure = None
+        try:
+            report = await ensure_indexes(dry_run=dry_run)
+        except IndexCreationError as e:
+            failure, report = e, e.report
+        for entry in report:
+            error = f"  ({entry['error']})" if "error" in entry else ""
+            print(f"{entry['action']:<10} {entry['collection']}.{entry['index']}{error}")
+        if failure:
+            raise SystemExit(str(failure))
+        if explain:
+            scans = await find_collection_scans()
+            print(f"{len(scans)} quer{'y' if len(scans) == 1 else 'ies'} fall back to a collection scan")
+            for scan in scans:
+                print(f"COLLSCAN   {scan['collection']} filter={scan['filter']} sort={scan['sort']}")
+    finally:
+        await mongodb.close_mongo_connection()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ensure the declared MongoDB indexes exist")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the differences")
+    parser.add_argument("--explain", action="store_true", help="Report queries that fall back to a collection scan")
+    args = parser.parse_args()
+    asyncio.run(_run(args.dry_run, args.explain))
+
+if __name__ == "__main__":
+    main()
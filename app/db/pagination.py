@@ -0,0 +1,100 @@
+# === File: pagination.py ===
+import base64
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+class InvalidCursorError(ValueError):
+    """Raised when a page cursor was not produced by encode_cursor."""
+
+def encode_cursor(value: datetime, doc_id: ObjectId) -> str:
+    """
+    Opaque cursor for the position right after (value, doc_id) in a newest-first listing.
+    """
+    raw = json.dumps([value.isoformat(), str(doc_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, doc_id = json.loads(raw)
+        return datetime.fromisoformat(value), ObjectId(doc_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """
+    Comma-separated field list from a query parameter, restricted to `allowed`;
+    all allowed fields when none are given.
+    """
+    if not fields:
+        return list(allowed)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+async def keyset_page(collection,
+                      query: Dict[str, Any],
+                      sort_field: str,
+                      limit: int,
+                      cursor: Optional[str] = None,
+                      fields: Optional[Sequence[str]] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    One page of `collection` newest first by (sort_field, _id), starting after `cursor`.
+
+    Seeks with a range on the compound index instead of skipping, so every page costs
+    the same however deep it is. Returns the documents (limited to `fields`, when given)
+    and the cursor for the next page, or None on the last page.
+    """
+    query = dict(query)
+    if cursor:
+        value, doc_id = decode_cursor(cursor)
+        query["$or"] = [
+            {sort_field: {"$lt": value}},
+            {sort_field: value, "_id": {"$lt": doc_id}}
+        ]
+
+    projection = None
+    if fields is not None:
+        # The sort key is always read so the next cursor can be built
+        projection = {field: 1 for field in fields}
+        projection[sort_field] = 1
+
+    docs = await collection.find(query, projection).sort(
+        [(sort_field, -1), ("_id", -1)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(last[sort_field], last["_id"])
+
+    if fields is not None:
+        wanted = set(fields)
+        docs = [{key: value for key, value in doc.items() if key in wanted} for doc in docs]
+    return docs, next_cursor
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dump_document(doc: Dict) -> str:
+    return json.dumps(doc, default=_json_default, separators=(",", ":"))
+
+def dump_documents(docs: List[Dict]) -> str:
+    """
+    Serialize raw MongoDB documents straight to JSON, without building a model per row.
+    """
+    return json.dumps(docs, default=_json_default, separators=(",", ":"))
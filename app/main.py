@@ -1,8 +1,15 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api.v1.api import api_router
 from app.db.mongodb import mongodb
+from app.db.indexes import ensure_indexes, find_collection_scans
+from app.core.profile_store import profile_store
+from app.core.jobs import job_queue
+from app.core.tracing import tracer, request_id_var, new_request_id
+from app.core.embeddings import embedding_service
+from app.core.singleflight import single_flight
+from app.core.security import password_hasher
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -18,12 +25,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 @app.on_event("startup")
 async def startup_event():
     await mongodb.connect_to_mongo()
+    if settings.MONGO_ENSURE_INDEXES:
+        await ensure_indexes()
+    if settings.MONGO_EXPLAIN_QUERIES:
+        await find_collection_scans()
+    await profile_store.start()
+    await single_flight.start()
+    await job_queue.start()
+    await tracer.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await job_queue.stop()
+    await profile_store.stop()
+    await tracer.stop()
+    embedding_service.close()
+    password_hasher.shutdown()
     await mongodb.close_mongo_connection()
 
 # Include API router
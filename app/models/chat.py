@@ -58,6 +58,10 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     message: str
     response: str
+    # Stages skipped or cut short to meet the request deadline
+    skipped_stages: List[str] = []
+    # True when the reply is a canned response because the model ran out of time
+    degraded: bool = False
 
 class ChatSession(BaseModel):
     id: Annotated[PyObjectId, Field(default_factory=PyObjectId, alias="_id")]
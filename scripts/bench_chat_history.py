@@ -0,0 +1,113 @@
+# === File: bench_chat_history.py ===
+"""
+Page latency of the chat history at increasing depth: keyset cursors against the
+skip/limit paging they replaced.
+
+Seeds `--messages` chats for a throwaway user into the configured MongoDB (MONGODB_URL,
+DATABASE_NAME), walks the history once to collect the cursor of every page, then times
+fetching the pages at each depth and reports the documents MongoDB examined for them.
+The seeded chats are deleted afterwards unless `--keep` is given.
+
+    python -m scripts.bench_chat_history [--messages 100000] [--page-size 50]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.db.indexes import ensure_indexes
+from app.db.mongodb import mongodb
+from app.db.pagination import decode_cursor, dump_documents, keyset_page
+
+SORT = [("created_at", -1), ("_id", -1)]
+FIELDS = ["message", "response", "emotion", "created_at"]
+
+async def _seed(collection, user_id: str, count: int, batch_size: int = 5000) -> None:
+    started = datetime.utcnow() - timedelta(seconds=count)
+    for offset in range(0, count, batch_size):
+        await collection.insert_many([
+            {
+                "user_id": user_id,
+                "message": f"Seeded message {i}",
+                "response": f"Seeded reply {i}",
+                "emotion": None,
+                "created_at": started + timedelta(seconds=i)
+            }
+            for i in range(offset, min(offset + batch_size, count))
+        ], ordered=False)
+
+async def _cursors(collection, query: Dict, page_size: int) -> List[Optional[str]]:
+    """The cursor that starts every page (None for the first)."""
+    cursors: List[Optional[str]] = [None]
+    while True:
+        _, cursor = await keyset_page(collection, query, "created_at", page_size, cursor=cursors[-1], fields=FIELDS)
+        if cursor is None:
+            return cursors
+        cursors.append(cursor)
+
+async def _time(fetch, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        dump_documents(await fetch())
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+async def _examined(cursor) -> int:
+    plan = await cursor.explain()
+    return plan.get("executionStats", {}).get("totalDocsExamined", -1)
+
+async def _run(args: argparse.Namespace) -> None:
+    await mongodb.connect_to_mongo()
+    collection = mongodb.get_collection("chats")
+    user_id = f"bench-history-{ObjectId()}"
+    query = {"user_id": user_id}
+    projection = {field: 1 for field in FIELDS}
+    try:
+        await ensure_indexes()
+        await _seed(collection, user_id, args.messages)
+        cursors = await _cursors(collection, query, args.page_size)
+        depths = sorted({page for page in (1, 10, 100, 1000, len(cursors)) if page <= len(cursors)})
+
+        print(f"Seeded {args.messages} messages, {len(cursors)} pages of {args.page_size}")
+        print(f"{'page':>6} {'keyset':>9} {'examined':>9} {'skip':>9} {'examined':>9}")
+        for page in depths:
+            cursor = cursors[page - 1]
+            keyset_ms = await _time(
+                lambda: keyset_page(collection, query, "created_at", args.page_size, cursor=cursor, fields=FIELDS),
+                args.repeats
+            )
+            skipped = (page - 1) * args.page_size
+            skip_ms = await _time(
+                lambda: collection.find(query, projection).sort(SORT).skip(skipped).limit(args.page_size).to_list(length=args.page_size),
+                args.repeats
+            )
+            keyset_query = dict(query)
+            if cursor:
+                # The range keyset_page seeks with
+                value, doc_id = decode_cursor(cursor)
+                keyset_query["$or"] = [{"created_at": {"$lt": value}}, {"created_at": value, "_id": {"$lt": doc_id}}]
+            keyset_examined = await _examined(collection.find(keyset_query, projection).sort(SORT).limit(args.page_size + 1))
+            skip_examined = await _examined(collection.find(query, projection).sort(SORT).skip(skipped).limit(args.page_size))
+            print(f"{page:>6} {keyset_ms:>7.1f}ms {keyset_examined:>9} {skip_ms:>7.1f}ms {skip_examined:>9}")
+    finally:
+        if not args.keep:
+            await collection.delete_many({"user_id": user_id})
+        await mongodb.close_mongo_connection()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark chat history page latency by depth")
+    parser.add_argument("--messages", type=int, default=100_000, help="Messages seeded for the benchmark user")
+    parser.add_argument("--page-size", type=int, default=settings.CHAT_PAGE_SIZE)
+    parser.add_argument("--repeats", type=int, default=20, help="Fetches per page; the median is reported")
+    parser.add_argument("--keep", action="store_true", help="Leave the seeded messages in place")
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+if __name__ == "__main__":
+    main()
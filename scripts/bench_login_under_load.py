@@ -0,0 +1,128 @@
+# === File: bench_login_under_load.py ===
+"""
+Measure login throughput and /chat/send latency while a login burst is running,
+with bcrypt on the password hashing pool and, for comparison, inline on the event loop.
+
+The real app is driven in-process. Users live in memory, and the chat model is
+simulated with `--model-ms` of latency, so bcrypt is the only CPU-heavy work.
+
+    python -m scripts.bench_login_under_load [--seconds 5] [--login-clients 16]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import logging
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+import httpx
+import numpy as np
+from bson import ObjectId
+
+from app.api.v1.endpoints import chat
+from app.core import llm
+from app.core.config import settings
+from app.core.security import get_current_user, get_password_hash, password_hasher
+from app.db.mongodb import mongodb
+from app.main import app
+from scripts.bench_pipeline_modes import TokenMeter, _use_in_memory_state
+
+EMAIL = "bench@example.com"
+PASSWORD = "correct horse battery staple"
+# Every chat message is distinct, so none is answered from the single-flight window
+MESSAGE_IDS = itertools.count()
+
+class InMemoryUsers:
+    def __init__(self, user: Dict):
+        self.user = user
+
+    async def find_one(self, query: Dict, projection: Dict = None):
+        return self.user if query.get("email") == self.user["email"] else None
+
+async def _login_load(client: httpx.AsyncClient, until: float, counts: Dict[str, int]) -> None:
+    while time.monotonic() < until:
+        response = await client.post(f"{settings.API_V1_STR}/auth/token", data={"username": EMAIL, "password": PASSWORD})
+        if response.status_code == 200:
+            counts["ok"] += 1
+        elif response.status_code == 503:
+            counts["rejected"] += 1
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")) / 10)
+        else:
+            raise RuntimeError(f"Login failed with {response.status_code}: {response.text}")
+
+async def _chat_load(client: httpx.AsyncClient, until: float, latencies: List[float]) -> None:
+    while time.monotonic() < until:
+        started = time.perf_counter()
+        message = f"Bench message {next(MESSAGE_IDS)} about my day"
+        response = await client.post(f"{settings.API_V1_STR}/chat/send", json={"message": message})
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+async def _bench(client: httpx.AsyncClient, seconds: float, login_clients: int, chat_clients: int) -> Dict[str, float]:
+    counts = {"ok": 0, "rejected": 0}
+    latencies: List[float] = []
+    until = time.monotonic() + seconds
+    await asyncio.gather(
+        *[_login_load(client, until, counts) for _ in range(login_clients)],
+        *[_chat_load(client, until, latencies) for _ in range(chat_clients)]
+    )
+    return {
+        "logins_per_second": counts["ok"] / seconds,
+        "rejected": counts["rejected"],
+        "chat_p50_ms": float(np.percentile(latencies, 50)) if latencies else float("nan"),
+        "chat_p95_ms": float(np.percentile(latencies, 95)) if latencies else float("nan")
+    }
+
+async def _run(args: argparse.Namespace) -> None:
+    user = {"_id": ObjectId(), "email": EMAIL, "hashed_password": get_password_hash(PASSWORD)}
+    mongodb.db = {"users": InMemoryUsers(user)}
+    meter = TokenMeter(None, True, args.model_ms, 0.0)
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=meter))
+    _use_in_memory_state()
+
+    async def store_turn(user_id, message, emotion, response):
+        pass
+
+    chat.store_turn = store_turn
+    app.dependency_overrides[get_current_user] = lambda: user
+
+    pooled_run = password_hasher._run
+
+    async def inline_run(fn, *args):
+        return fn(*args)
+
+    print(f"{'bcrypt':<12} {'logins/s':>9} {'rejected':>9} {'chat p50':>10} {'chat p95':>10}")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        # Warm up the pipeline (classifier, tokenizer) outside the timed runs
+        with contextlib.redirect_stdout(io.StringIO()):
+            await _chat_load(client, time.monotonic() + 0.5, [])
+        for name, run, login_clients in (
+            ("no logins", pooled_run, 0),
+            ("pool", pooled_run, args.login_clients),
+            ("event loop", inline_run, args.login_clients)
+        ):
+            password_hasher._run = run
+            # /chat/send prints every reply
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = await _bench(client, args.seconds, login_clients, args.chat_clients)
+            print(f"{name:<12} {result['logins_per_second']:>9.1f} {result['rejected']:>9} "
+                  f"{result['chat_p50_ms']:>8.0f}ms {result['chat_p95_ms']:>8.0f}ms")
+    password_hasher._run = pooled_run
+    password_hasher.shutdown()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark login throughput and chat latency during a login burst")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each run")
+    parser.add_argument("--login-clients", type=int, default=16, help="Clients logging in back to back")
+    parser.add_argument("--chat-clients", type=int, default=4, help="Clients sending chat messages back to back")
+    parser.add_argument("--model-ms", type=float, default=50.0, help="Simulated latency of every model call")
+    args = parser.parse_args()
+    # The analyzer configures DEBUG logging on import; keep the table readable
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(_run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# === File: bench_pipeline_modes.py ===
+"""
+Compare PIPELINE_MODE "multi" and "single": reply latency (p50/p95), LLM calls and
+token spend per message, including the background profile refresh of the multi mode.
+
+Profiles and conversation state are kept in memory and retrieval is off, so only the
+model calls differ between the modes. By default the model is simulated (latency of
+`--base-ms` plus `--ms-per-token` per completion token, tokens counted like the
+prompts are); with `--live` the configured OpenAI models are called.
+
+    python -m scripts.bench_pipeline_modes [--requests 20] [--live]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+import numpy as np
+from openai.types.chat import ChatCompletion
+
+from app.core import llm, pipeline
+from app.core.analyzer import EMOTION_SYSTEM_PROMPT, PROFILE_CATEGORIES, PROFILE_SYSTEM_PROMPT
+from app.core.config import settings
+from app.core.conversation import ConversationState, conversation_memory
+from app.core.emotion_classifier import EMOTIONS
+from app.core.emotion_eval import LABELLED_EXAMPLES
+from app.core.jobs import job_queue
+from app.core.profile_store import empty_profile, profile_store
+from app.core.single_pass import SINGLE_PASS_SYSTEM_PROMPT
+from app.core.tokens import count_message_tokens, count_tokens
+
+REPLY = ("It sounds like this has been weighing on you. What part of it feels the heaviest "
+         "right now, and what do you notice in yourself when you think about it?")
+
+def _simulated_content(messages: List[Dict[str, str]]) -> str:
+    system_prompt = messages[0]["content"]
+    emotions = {emotion: round(1.0 / len(EMOTIONS), 2) for emotion in EMOTIONS}
+    observation = {"feels overwhelmed by recent events": {"short_term": 0.6, "long_term": 0.4}}
+    if system_prompt == EMOTION_SYSTEM_PROMPT:
+        return json.dumps(emotions)
+    if system_prompt == PROFILE_SYSTEM_PROMPT:
+        return json.dumps({category: observation for category in PROFILE_CATEGORIES})
+    if system_prompt == SINGLE_PASS_SYSTEM_PROMPT:
+        return json.dumps({"emotions": emotions, "profile_updates": {"thinking_patterns": observation}, "reply": REPLY})
+    return REPLY
+
+class TokenMeter:
+    """
+    Wraps the chat completions call and adds up calls and token usage.
+    """
+
+    def __init__(self, create, simulate: bool, base_ms: float, ms_per_token: float):
+        self._create = create
+        self.simulate = simulate
+        self.base_ms = base_ms
+        self.ms_per_token = ms_per_token
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = self.prompt_tokens = self.completion_tokens = 0
+
+    async def create(self, model: str, messages: List[Dict[str, str]], **kwargs) -> ChatCompletion:
+        if self.simulate:
+            content = _simulated_content(messages)
+            completion_tokens = count_tokens(content)
+            await asyncio.sleep((self.base_ms + self.ms_per_token * completion_tokens) / 1000)
+            response = ChatCompletion.model_validate({
+                "id": "simulated",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {
+                    "prompt_tokens": count_message_tokens(messages),
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": count_message_tokens(messages) + completion_tokens
+                }
+            })
+        else:
+            response = await self._create(model=model, messages=messages, **kwargs)
+        self.calls += 1
+        if response.usage:
+            self.prompt_tokens += response.usage.prompt_tokens
+            self.completion_tokens += response.usage.completion_tokens
+        return response
+
+def _use_in_memory_state() -> List[str]:
+    profiles: Dict[str, Dict] = {}
+    queued: List[str] = []
+
+    async def get(user_id: str) -> Dict[str, Dict]:
+        return json.loads(json.dumps(profiles.get(user_id, empty_profile())))
+
+    async def update(user_id: str, changes: Dict[str, Dict]) -> Dict[str, Dict]:
+        profiles.setdefault(user_id, empty_profile()).update(changes)
+        return await get(user_id)
+
+    async def load(user_id: str) -> ConversationState:
+        return ConversationState()
+
+    async def submit(kind: str, key: str, item) -> bool:
+        if kind == pipeline.PROFILE_REFRESH_JOB:
+            queued.append(item)
+        return True
+
+    profile_store.get, profile_store.update = get, update
+    conversation_memory.load = load
+    job_queue.submit = submit
+    settings.RAG_ENABLED = False
+    return queued
+
+async def _bench_mode(mode: str, messages: List[str], meter: TokenMeter, queued: List[str]) -> Dict[str, float]:
+    settings.PIPELINE_MODE = mode
+    meter.reset()
+    latencies = []
+    for i, message in enumerate(messages):
+        user_id = f"bench-{mode}-{i % 4}"
+        started = time.perf_counter()
+        await pipeline.respond(user_id, message)
+        latencies.append((time.perf_counter() - started) * 1000)
+        # The multi mode refreshes the profile in a background job: run it untimed, but count its tokens
+        while queued:
+            await pipeline.refresh_profile(user_id, [queued.pop(0)])
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "calls": meter.calls / len(messages),
+        "prompt_tokens": meter.prompt_tokens / len(messages),
+        "completion_tokens": meter.completion_tokens / len(messages)
+    }
+
+async def _run(args: argparse.Namespace) -> None:
+    meter = TokenMeter(llm.client.chat.completions.create, not args.live, args.base_ms, args.ms_per_token)
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=meter))
+    queued = _use_in_memory_state()
+    texts = [text for text, _ in LABELLED_EXAMPLES]
+    messages = [texts[i % len(texts)] for i in range(args.requests)]
+
+    print(f"{'mode':<8} {'p50':>9} {'p95':>9} {'calls/msg':>10} {'prompt tok/msg':>15} {'completion tok/msg':>19}")
+    for mode in ("multi", "single"):
+        result = await _bench_mode(mode, messages, meter, queued)
+        print(f"{mode:<8} {result['p50_ms']:>7.0f}ms {result['p95_ms']:>7.0f}ms {result['calls']:>10.2f} "
+              f"{result['prompt_tokens']:>15.0f} {result['completion_tokens']:>19.0f}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare latency and token spend of the multi-call and single-pass pipelines")
+    parser.add_argument("--requests", type=int, default=20, help="Messages sent in each mode")
+    parser.add_argument("--live", action="store_true", help="Call the configured OpenAI models instead of simulating them")
+    parser.add_argument("--base-ms", type=float, default=200.0, help="Simulated latency of every call")
+    parser.add_argument("--ms-per-token", type=float, default=5.0, help="Simulated latency per completion token")
+    args = parser.parse_args()
+    # The analyzer configures DEBUG logging on import; keep the table readable
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(_run(args))
+
+if __name__ == "__main__":
+    main()
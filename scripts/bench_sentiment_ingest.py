@@ -0,0 +1,97 @@
+# === File: bench_sentiment_ingest.py ===
+"""
+Sentiment log ingestion throughput: the single-row endpoint (with `--concurrency`
+requests in flight) against the bulk endpoint with a JSON array and with NDJSON.
+
+The real app is driven in-process against the configured MongoDB (MONGODB_URL,
+DATABASE_NAME). Logs are written for a throwaway user and deleted afterwards, along
+with the user's rollups.
+
+    python -m scripts.bench_sentiment_ingest [--rows 10000] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List
+
+import httpx
+from bson import ObjectId
+
+from app.core.config import settings
+from app.core.sentiment_rollups import LOGS_COLLECTION, ROLLUPS_COLLECTION
+from app.db.indexes import ensure_indexes
+from app.db.mongodb import mongodb
+from app.main import app
+
+TAGS = ["joy", "sadness", "fear", "angry", "neutral"]
+
+def _logs(user_id: str, count: int) -> List[Dict]:
+    return [
+        {
+            "message_id": f"bench-{i}",
+            "user_id": user_id,
+            "timestamp": f"2024-01-{1 + i % 28:02d}T{i % 24:02d}:00:00Z",
+            "sentiment_score": (i % 21 - 10) / 10,
+            "emotion_tags": [TAGS[i % len(TAGS)]]
+        }
+        for i in range(count)
+    ]
+
+async def _single(client: httpx.AsyncClient, logs: List[Dict], concurrency: int) -> None:
+    queue = list(reversed(logs))
+
+    async def worker() -> None:
+        while queue:
+            response = await client.post(f"{settings.API_V1_STR}/sentiment/logs", json=queue.pop())
+            response.raise_for_status()
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+async def _bulk_json(client: httpx.AsyncClient, logs: List[Dict], concurrency: int) -> None:
+    response = await client.post(f"{settings.API_V1_STR}/sentiment/logs/bulk", json=logs)
+    response.raise_for_status()
+    assert response.json()["failed"] == 0, response.json()["errors"][:3]
+
+async def _bulk_ndjson(client: httpx.AsyncClient, logs: List[Dict], concurrency: int) -> None:
+    body = "\n".join(json.dumps(log) for log in logs).encode("utf-8")
+    response = await client.post(
+        f"{settings.API_V1_STR}/sentiment/logs/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    response.raise_for_status()
+    assert response.json()["failed"] == 0, response.json()["errors"][:3]
+
+async def _run(args: argparse.Namespace) -> None:
+    await mongodb.connect_to_mongo()
+    user_ids = []
+    try:
+        await ensure_indexes()
+        print(f"{'endpoint':<14} {'rows':>7} {'seconds':>8} {'rows/s':>9}")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            for name, ingest in (("single-row", _single), ("bulk json", _bulk_json), ("bulk ndjson", _bulk_ndjson)):
+                user_id = f"bench-ingest-{ObjectId()}"
+                user_ids.append(user_id)
+                logs = _logs(user_id, args.rows)
+                started = time.perf_counter()
+                await ingest(client, logs, args.concurrency)
+                elapsed = time.perf_counter() - started
+                print(f"{name:<14} {args.rows:>7} {elapsed:>8.2f} {args.rows / elapsed:>9.0f}")
+    finally:
+        for collection_name in (LOGS_COLLECTION, ROLLUPS_COLLECTION):
+            await mongodb.get_collection(collection_name).delete_many({"user_id": {"$in": user_ids}})
+        await mongodb.close_mongo_connection()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark single-row against bulk sentiment log ingestion")
+    parser.add_argument("--rows", type=int, default=10000, help="Logs ingested by each endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="Single-row requests in flight")
+    args = parser.parse_args()
+    # The analyzer configures DEBUG logging on import; keep the table readable
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(_run(args))
+
+if __name__ == "__main__":
+    main()
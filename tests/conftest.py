@@ -0,0 +1,12 @@
+import base64
+import os
+
+# Settings are read at import time; give the required ones test values
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("ENCRYPTION_KEY", base64.urlsafe_b64encode(b"0" * 32).decode())
+
+import pytest
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
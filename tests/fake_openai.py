@@ -0,0 +1,119 @@
+"""
+A local stand-in for the OpenAI API that injects rate limits, server errors and latency.
+
+Tests script the responses one request at a time with `inject` and talk to the app
+in-process through `client()`. Run it as a server to exercise a full deployment
+(point OPENAI_BASE_URL at it):
+
+    python -m tests.fake_openai --port 8100 --rate-limit-rate 0.2 --latency-ms 300
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import List, NamedTuple, Optional
+
+import httpx
+import openai
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+class Fault(NamedTuple):
+    status: int = 200
+    delay: float = 0.0
+    retry_after: Optional[float] = None
+
+ERROR_TYPES = {429: "rate_limit_exceeded", 400: "invalid_request_error", 500: "server_error", 503: "server_error"}
+
+class FakeOpenAI:
+    """
+    Answers /v1/chat/completions and /v1/embeddings. Each request takes the next
+    injected Fault; when none is queued, it fails with 429 at `rate_limit_rate` and
+    waits `latency` seconds otherwise.
+    """
+
+    def __init__(self, latency: float = 0.0, rate_limit_rate: float = 0.0):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.faults: List[Fault] = []
+        self.requests = 0
+        self.completed = 0
+        self.app = Starlette(routes=[
+            Route("/v1/chat/completions", self._chat_completions, methods=["POST"]),
+            Route("/v1/embeddings", self._embeddings, methods=["POST"]),
+        ])
+
+    def inject(self, *faults: Fault) -> None:
+        self.faults.extend(faults)
+
+    def client(self) -> openai.AsyncOpenAI:
+        """An OpenAI client wired to this app in-process, with the client's own retries off."""
+        transport = httpx.ASGITransport(app=self.app)
+        return openai.AsyncOpenAI(
+            api_key="sk-fake",
+            base_url="http://fake-openai/v1",
+            max_retries=0,
+            http_client=httpx.AsyncClient(transport=transport, base_url="http://fake-openai/v1")
+        )
+
+    def _next_fault(self) -> Fault:
+        if self.faults:
+            return self.faults.pop(0)
+        if random.random() < self.rate_limit_rate:
+            return Fault(429, retry_after=1.0)
+        return Fault(delay=self.latency)
+
+    async def _apply(self) -> Optional[JSONResponse]:
+        self.requests += 1
+        fault = self._next_fault()
+        if fault.delay:
+            await asyncio.sleep(fault.delay)
+        if fault.status == 200:
+            self.completed += 1
+            return None
+        headers = {"retry-after": str(fault.retry_after)} if fault.retry_after is not None else {}
+        body = {"error": {"message": f"Injected {fault.status}", "type": ERROR_TYPES.get(fault.status, "error"), "code": None}}
+        return JSONResponse(body, status_code=fault.status, headers=headers)
+
+    async def _chat_completions(self, request: Request) -> JSONResponse:
+        payload = await request.json()
+        error = await self._apply()
+        if error is not None:
+            return error
+        return JSONResponse({
+            "id": f"chatcmpl-fake-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11}
+        })
+
+    async def _embeddings(self, request: Request) -> JSONResponse:
+        payload = await request.json()
+        error = await self._apply()
+        if error is not None:
+            return error
+        inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+        return JSONResponse({
+            "object": "list",
+            "model": payload.get("model", "text-embedding-3-small"),
+            "data": [{"object": "embedding", "index": i, "embedding": [float(len(text)), 1.0]} for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}
+        })
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI API that injects 429s and latency")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    args = parser.parse_args()
+    fake = FakeOpenAI(latency=args.latency_ms / 1000, rate_limit_rate=args.rate_limit_rate)
+    uvicorn.run(fake.app, host="127.0.0.1", port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.api.v1.endpoints import chat
+from app.core import llm
+from app.core.config import settings
+from app.core.conversation import ConversationState, conversation_memory
+from app.core.profile_store import empty_profile, profile_store
+from app.core.security import get_current_user
+from app.main import app
+from tests.fake_openai import FakeOpenAI
+
+pytestmark = pytest.mark.anyio
+
+MODEL_LATENCY = 0.3
+CONCURRENT_REQUESTS = 6
+
+@pytest.fixture
+async def client(monkeypatch):
+    """
+    The real app and pipeline, with a slow fake OpenAI and in-memory profile and history.
+    """
+    fake = FakeOpenAI(latency=MODEL_LATENCY)
+
+    async def get(user_id):
+        return empty_profile()
+
+    async def load(user_id):
+        return ConversationState()
+
+    async def store_turn(user_id, message, emotion, response):
+        pass
+
+    monkeypatch.setattr(llm, "client", fake.client())
+    monkeypatch.setattr(profile_store, "get", get)
+    monkeypatch.setattr(conversation_memory, "load", load)
+    monkeypatch.setattr(chat, "store_turn", store_turn)
+    monkeypatch.setattr(settings, "RAG_ENABLED", False)
+    app.dependency_overrides[get_current_user] = lambda: {"_id": "concurrency-user", "email": "user@example.com"}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            yield client
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+async def _send(client: httpx.AsyncClient, message: str) -> float:
+    started = time.monotonic()
+    response = await client.post(f"{settings.API_V1_STR}/chat/send", json={"message": message})
+    assert response.status_code == 200, response.text
+    assert response.json()["response"] == "ok"
+    return time.monotonic() - started
+
+async def test_concurrent_sends_overlap_instead_of_queueing(client):
+    single = await _send(client, "I keep going over the meeting in my head")
+    assert single >= MODEL_LATENCY
+
+    started = time.monotonic()
+    await asyncio.gather(*[_send(client, f"Message number {i} about my week") for i in range(CONCURRENT_REQUESTS)])
+    elapsed = time.monotonic() - started
+
+    # Serialized they would take CONCURRENT_REQUESTS times as long as one
+    assert elapsed < single * 2
+
+async def test_event_loop_serves_other_requests_during_a_chat(client):
+    send = asyncio.create_task(_send(client, "Work has been overwhelming lately"))
+    await asyncio.sleep(MODEL_LATENCY / 3)
+
+    started = time.monotonic()
+    response = await client.get("/")
+    assert response.status_code == 200
+    assert time.monotonic() - started < MODEL_LATENCY / 3
+    assert not send.done()
+    await send
@@ -0,0 +1,26 @@
+from app.core.chunk_store import BLOB_SUFFIX, OFFSETS_SUFFIX, ChunkStore, ChunkStoreWriter
+
+def test_append_and_read(tmp_path):
+    prefix = str(tmp_path / "chunks")
+    with ChunkStoreWriter(prefix) as writer:
+        assert [writer.append(text) for text in ("first", "", "dritte Zeile ü")] == [0, 1, 2]
+
+    store = ChunkStore(prefix)
+    assert len(store) == 3
+    assert store.get_many([2, 0, 1, 7]) == ["dritte Zeile ü", "first", ""]
+
+def test_unpublished_bytes_of_a_crashed_writer_are_discarded(tmp_path):
+    prefix = str(tmp_path / "chunks")
+    with ChunkStoreWriter(prefix) as writer:
+        writer.append("first")
+    # A writer died after writing its text but before publishing the offset
+    with open(prefix + BLOB_SUFFIX, "ab") as f:
+        f.write(b"ORPHAN")
+    with open(prefix + OFFSETS_SUFFIX, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    with ChunkStoreWriter(prefix) as writer:
+        assert writer.append("next") == 1
+
+    store = ChunkStore(prefix)
+    assert store.get_many([0, 1]) == ["first", "next"]
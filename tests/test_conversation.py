@@ -0,0 +1,81 @@
+import copy
+from typing import Dict, List, Optional
+
+import pytest
+
+from app.core import conversation
+from app.core.conversation import ConversationMemory
+
+pytestmark = pytest.mark.anyio
+
+class FakeConversations:
+    """The updates ConversationMemory issues, on one in-memory document per user."""
+
+    def __init__(self):
+        self.docs: Dict[str, Dict] = {}
+
+    async def find_one(self, query: Dict, projection: Optional[Dict] = None) -> Optional[Dict]:
+        doc = self.docs.get(query["user_id"])
+        return copy.deepcopy(doc) if doc else None
+
+    async def find_one_and_update(self, query: Dict, update: Dict, **kwargs) -> Dict:
+        doc = self.docs.setdefault(query["user_id"], {"user_id": query["user_id"], "turns": []})
+        doc.setdefault("summary", update["$setOnInsert"]["summary"])
+        doc["turns"].append(update["$push"]["turns"])
+        return copy.deepcopy(doc)
+
+    async def update_one(self, query: Dict, update: Dict):
+        doc = self.docs.get(query["user_id"])
+        matched = doc is not None and doc["summary"] == query["summary"]
+        if matched:
+            doc["summary"] = update["$set"]["summary"]
+            folded = set(update["$pull"]["turns"]["id"]["$in"])
+            doc["turns"] = [turn for turn in doc["turns"] if turn["id"] not in folded]
+        return type("UpdateResult", (), {"modified_count": int(matched)})()
+
+@pytest.fixture
+def memory(monkeypatch):
+    memory = ConversationMemory(recent_turns=2, max_stored_turns=4)
+    collection = FakeConversations()
+    monkeypatch.setattr(ConversationMemory, "collection", property(lambda self: collection))
+    memory.fake = collection
+    return memory
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    state = {"available": False, "folded": []}
+
+    async def summarize_turns(summary: str, turns: List[Dict]) -> Optional[str]:
+        if not state["available"]:
+            return None
+        state["folded"].extend(turn["message"] for turn in turns)
+        return " ".join(filter(None, [summary] + [turn["message"] for turn in turns]))
+
+    monkeypatch.setattr(conversation, "summarize_turns", summarize_turns)
+    return state
+
+async def test_unsummarized_turns_are_never_dropped(memory, summarizer):
+    for i in range(8):
+        await memory.append("u1", f"m{i}", f"r{i}")
+
+    # The summary model is down: every turn is still stored
+    assert [turn["message"] for turn in memory.fake.docs["u1"]["turns"]] == [f"m{i}" for i in range(8)]
+
+    summarizer["available"] = True
+    needs_fold = await memory.append("u1", "m8", "r8")
+
+    # Past max_stored_turns the append folded inline, oldest turns first
+    assert not needs_fold
+    assert summarizer["folded"] == [f"m{i}" for i in range(7)]
+    state = await memory.load("u1")
+    assert state.summary == " ".join(f"m{i}" for i in range(7))
+    assert [turn["message"] for turn in state.turns] == ["m7", "m8"]
+
+async def test_append_within_the_limit_leaves_folding_to_the_job(memory, summarizer):
+    summarizer["available"] = True
+    results = [await memory.append("u1", f"m{i}", f"r{i}") for i in range(4)]
+
+    assert results == [False, False, True, True]
+    assert summarizer["folded"] == []
+    assert await memory.fold("u1")
+    assert [turn["message"] for turn in memory.fake.docs["u1"]["turns"]] == ["m2", "m3"]
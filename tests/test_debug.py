@@ -0,0 +1,41 @@
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.core.security import get_current_user
+from app.core.tracing import tracer
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"_id": "admin-id", "email": "admin@example.com"}
+USER = {"_id": "user-id", "email": "user@example.com"}
+
+@pytest.fixture
+async def client(monkeypatch):
+    monkeypatch.setattr(settings, "TRACE_ADMIN_EMAILS", [ADMIN["email"]])
+    monkeypatch.setattr(tracer, "enabled", True)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    app.dependency_overrides.pop(get_current_user, None)
+
+def _as(user: dict) -> None:
+    app.dependency_overrides[get_current_user] = lambda: user
+
+@pytest.mark.parametrize("limit", [0, -1])
+async def test_trace_limit_must_be_positive(client, limit):
+    _as(ADMIN)
+
+    response = await client.get(f"{settings.API_V1_STR}/debug/traces", params={"limit": limit})
+
+    assert response.status_code == 422
+
+async def test_metrics_are_only_for_trace_admins(client):
+    _as(USER)
+    assert (await client.get(f"{settings.API_V1_STR}/debug/metrics")).status_code == 403
+
+    _as(ADMIN)
+    assert (await client.get(f"{settings.API_V1_STR}/debug/metrics")).status_code == 200
+
+def test_recent_with_no_limit_returns_nothing():
+    assert tracer.recent(0) == []
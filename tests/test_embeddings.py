@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+from app.core.embeddings import EmbeddingService, EmbeddingStore
+
+pytestmark = pytest.mark.anyio
+
+class FakeEmbeddings:
+    """Embeds a text as [len(text), 1]; rejects the whole request if any input contains BAD."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def create(self, model, input):
+        self.requests.append(list(input))
+        if any("BAD" in text for text in input):
+            response = httpx.Response(400, request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+            raise openai.BadRequestError("Invalid input", response=response, body=None)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[float(len(text)), 1.0]) for i, text in enumerate(input)
+        ])
+
+@pytest.fixture
+def service(tmp_path):
+    embeddings = FakeEmbeddings()
+    service = EmbeddingService(
+        client=SimpleNamespace(embeddings=embeddings),
+        store=EmbeddingStore(str(tmp_path / "embeddings.db")),
+        batch_window_ms=20
+    )
+    yield service, embeddings
+    service.close()
+
+async def test_concurrent_calls_share_one_batch(service):
+    service, embeddings = service
+
+    vectors = await asyncio.gather(service.embed("a"), service.embed("bb"), service.embed("a"))
+
+    assert [vector.tolist() for vector in vectors] == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert embeddings.requests == [["a", "bb"]]
+
+async def test_rejected_input_only_fails_its_own_caller(service):
+    service, embeddings = service
+    texts = ["one", "two", "BAD", "four", "five"]
+
+    results = await asyncio.gather(*(service.embed(text) for text in texts), return_exceptions=True)
+
+    assert isinstance(results[2], openai.BadRequestError)
+    for text, result in zip(texts, results):
+        if text != "BAD":
+            assert np.array_equal(result, [float(len(text)), 1.0])
+    # The good texts were cached, so only the bad one goes to the API again
+    embeddings.requests.clear()
+    with pytest.raises(openai.BadRequestError):
+        await service.embed_many(["one", "BAD"])
+    assert embeddings.requests == [["BAD"]]
@@ -0,0 +1,26 @@
+import numpy as np
+
+from app.core.emotion_classifier import EMOTION_LEXICON, EMOTIONS, emotion_classifier, tokenize
+from app.core.emotion_eval import LABELLED_EXAMPLES
+
+def _reference_cue_counts(text):
+    features = emotion_classifier.features(text)
+    counts = {}
+    for emotion in EMOTIONS:
+        cues = {emotion_classifier._hash(" ".join(tokenize(term))) for term in EMOTION_LEXICON[emotion]}
+        counts[emotion] = int(np.isin(features, list(cues)).sum())
+    return counts
+
+def test_cue_counts_match_a_per_emotion_scan():
+    for text, _ in LABELLED_EXAMPLES:
+        assert emotion_classifier.cue_counts(text) == _reference_cue_counts(text)
+
+def test_agreeing_cues_are_decisive_and_single_cues_are_not():
+    text = "I'm so angry and frustrated with my boss"
+    scores, confidence = emotion_classifier.classify(text)
+    assert emotion_classifier.cue_counts(text)["angry"] >= 2
+    assert emotion_classifier.is_decisive(text, scores, confidence, threshold=0.5, min_cues=2)
+
+    text = "Great, I got fired today"
+    scores, confidence = emotion_classifier.classify(text)
+    assert not emotion_classifier.is_decisive(text, scores, confidence, threshold=0.5, min_cues=2)
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from app.core.jobs import InMemoryJobBackend, JobQueue
+
+pytestmark = pytest.mark.anyio
+
+async def _drain(queue: JobQueue, until, timeout: float = 2.0) -> None:
+    await queue.start()
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not until() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+    finally:
+        await queue.stop()
+
+async def test_items_for_a_running_key_wait_and_are_coalesced():
+    queue = JobQueue(InMemoryJobBackend(), workers=3, poll_interval=0.01)
+    running = set()
+    batches = []
+    release = asyncio.Event()
+
+    async def handler(key, items):
+        assert key not in running
+        running.add(key)
+        await release.wait()
+        batches.append(list(items))
+        running.discard(key)
+
+    queue.register("profile", handler)
+    await queue.submit("profile", "u1", "a")
+    await queue.start()
+    while "u1" not in running:
+        await asyncio.sleep(0.01)
+    assert await queue.submit("profile", "u1", "b") is True
+    assert await queue.submit("profile", "u1", "c") is False
+    release.set()
+    await _drain(queue, lambda: len(batches) == 2)
+
+    assert batches == [["a"], ["b", "c"]]
+
+async def test_failed_jobs_are_retried_up_to_max_attempts():
+    backend = InMemoryJobBackend()
+    queue = JobQueue(backend, workers=1, poll_interval=0.01, max_attempts=3, retry_delay=0.01)
+    calls = []
+
+    async def handler(key, items):
+        calls.append(list(items))
+        raise RuntimeError("provider down")
+
+    queue.register("profile", handler)
+    await queue.submit("profile", "u1", "a")
+    await _drain(queue, lambda: len(calls) >= 3 and not backend._running)
+
+    assert calls == [["a"], ["a"], ["a"]]
+    assert await backend.pending_count() == 0
+
+async def test_retry_keeps_items_that_arrived_while_failing():
+    backend = InMemoryJobBackend()
+    queue = JobQueue(backend, workers=1, poll_interval=0.01, max_attempts=2, retry_delay=0.01)
+    calls = []
+
+    async def handler(key, items):
+        calls.append(list(items))
+        if len(calls) == 1:
+            await queue.submit("profile", key, "b")
+            raise RuntimeError("provider down")
+
+    queue.register("profile", handler)
+    await queue.submit("profile", "u1", "a")
+    await _drain(queue, lambda: len(calls) == 2)
+
+    assert calls == [["a"], ["a", "b"]]
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import pytest
+from bson import ObjectId
+
+from app.db.pagination import InvalidCursorError, keyset_page
+
+pytestmark = pytest.mark.anyio
+
+class FakeCursor:
+    def __init__(self, collection: "FakeCollection", docs: List[Dict]):
+        self.collection = collection
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def skip(self, count: int):
+        self.collection.skips.append(count)
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count: int):
+        self.collection.limits.append(count)
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length: int):
+        return self.docs[:length]
+
+def _matches(doc: Dict, query: Dict[str, Any]) -> bool:
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(_matches(doc, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            if not all(op == "$lt" and doc[field] < value for op, value in condition.items()):
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+class FakeCollection:
+    """The subset of a Motor collection keyset_page uses, recording each query."""
+
+    def __init__(self, docs: List[Dict]):
+        self.docs = docs
+        self.queries: List[Dict] = []
+        self.limits: List[int] = []
+        self.skips: List[int] = []
+
+    def find(self, query: Dict, projection: Dict = None) -> FakeCursor:
+        self.queries.append(query)
+        return FakeCursor(self, [dict(doc) for doc in self.docs if _matches(doc, query)])
+
+def _chats(count: int, user_id: str = "u1") -> List[Dict]:
+    # Several messages share each timestamp, so pages must break ties on _id
+    started = datetime(2024, 1, 1)
+    return [
+        {"_id": ObjectId(), "user_id": user_id, "message": f"message {i}", "created_at": started + timedelta(seconds=i // 3)}
+        for i in range(count)
+    ]
+
+def _shape(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_shape(item) for item in value]
+    return type(value).__name__
+
+async def _walk(collection: FakeCollection, limit: int, fields=None) -> List[List[Dict]]:
+    pages, cursor = [], None
+    while True:
+        docs, cursor = await keyset_page(collection, {"user_id": "u1"}, "created_at", limit, cursor=cursor, fields=fields)
+        pages.append(docs)
+        if cursor is None:
+            return pages
+
+async def test_pages_cover_every_message_once_newest_first():
+    chats = _chats(1000) + _chats(50, user_id="someone-else")
+    collection = FakeCollection(chats)
+
+    pages = await _walk(collection, 37)
+
+    seen = [doc["_id"] for page in pages for doc in page]
+    expected = sorted((doc for doc in chats if doc["user_id"] == "u1"), key=lambda doc: (doc["created_at"], doc["_id"]), reverse=True)
+    assert seen == [doc["_id"] for doc in expected]
+    assert all(len(page) == 37 for page in pages[:-1])
+
+async def test_deep_pages_issue_the_same_bounded_query_as_shallow_ones():
+    collection = FakeCollection(_chats(3000))
+
+    pages = await _walk(collection, 50)
+
+    assert len(pages) == 60
+    # Every page after the first seeks with the same range predicate: no skip, same limit
+    assert not collection.skips
+    assert set(collection.limits) == {51}
+    assert len({repr(_shape(query)) for query in collection.queries[1:]}) == 1
+
+async def test_projection_keeps_only_the_requested_fields():
+    collection = FakeCollection(_chats(10))
+
+    docs, cursor = await keyset_page(collection, {"user_id": "u1"}, "created_at", 5, fields=["message"])
+
+    assert all(set(doc) == {"message"} for doc in docs)
+    assert cursor is not None
+
+async def test_tampered_cursor_is_rejected():
+    collection = FakeCollection(_chats(10))
+
+    with pytest.raises(InvalidCursorError):
+        await keyset_page(collection, {"user_id": "u1"}, "created_at", 5, cursor="not-a-cursor")
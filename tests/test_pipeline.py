@@ -0,0 +1,26 @@
+import pytest
+
+from app.core import pipeline
+from app.core.config import settings
+from app.core.deadline import deadline_scope
+from app.core.jobs import job_queue
+
+pytestmark = pytest.mark.anyio
+
+async def test_profile_refresh_is_queued_even_without_time_for_optional_stages(monkeypatch):
+    submitted = []
+
+    async def submit(kind, key, item):
+        submitted.append((kind, key, item))
+        return True
+
+    monkeypatch.setattr(job_queue, "submit", submit)
+
+    # Less than the time reserved for the response: every optional stage is skipped
+    with deadline_scope(settings.CHAT_RESPONSE_RESERVE_MS / 2) as deadline:
+        turn = await pipeline.prepare_turn("u1", "I could not sleep again")
+
+    assert submitted == [(pipeline.PROFILE_REFRESH_JOB, "u1", "I could not sleep again")]
+    assert "profile_update" not in deadline.skipped_stages
+    assert {"emotions", "rag", "profile", "conversation"} <= set(deadline.skipped_stages)
+    assert turn.emotions == {}
@@ -0,0 +1,87 @@
+import copy
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.core.profile_store import ProfileStore
+from app.db.mongodb import mongodb
+
+pytestmark = pytest.mark.anyio
+
+class FakeProfiles:
+    """Just enough of a collection for the versioned profile writes."""
+
+    def __init__(self):
+        self.docs = {}
+        self.failing = set()
+
+    async def find_one(self, query):
+        return copy.deepcopy(self.docs.get(query["user_id"]))
+
+    async def insert_one(self, doc):
+        if doc["user_id"] in self.docs:
+            raise DuplicateKeyError("duplicate user_id")
+        self.docs[doc["user_id"]] = copy.deepcopy(doc)
+
+    async def update_one(self, query, update):
+        if query["user_id"] in self.failing:
+            raise RuntimeError("write failed")
+        doc = self.docs.get(query["user_id"])
+        if doc is None or doc["version"] != query["version"]:
+            return SimpleNamespace(matched_count=0)
+        doc.update(copy.deepcopy(update["$set"]))
+        doc["version"] += update["$inc"]["version"]
+        return SimpleNamespace(matched_count=1)
+
+def _trait(score):
+    return {"short_term": score, "long_term": score}
+
+@pytest.fixture
+def profiles(monkeypatch):
+    collection = FakeProfiles()
+    monkeypatch.setattr(mongodb, "get_collection", lambda name: collection)
+    return collection
+
+async def test_concurrent_workers_keep_each_others_traits(profiles):
+    profiles.docs["u1"] = {
+        "user_id": "u1",
+        "psychoanalysis": {"axioms": {"I must be perfect": _trait(0.6)}, "thinking_patterns": {"ruminates": _trait(0.5)}},
+        "about_user": {},
+        "version": 1
+    }
+    first, second = ProfileStore(), ProfileStore()
+    first_view, second_view = await first.get("u1"), await second.get("u1")
+
+    first_view["psychoanalysis"]["axioms"]["I must be perfect"] = _trait(0.8)
+    await first.update("u1", {"psychoanalysis": first_view["psychoanalysis"]})
+    second_view["psychoanalysis"]["thinking_patterns"]["catastrophizes"] = _trait(0.7)
+    del second_view["psychoanalysis"]["thinking_patterns"]["ruminates"]
+    await second.update("u1", {"psychoanalysis": second_view["psychoanalysis"]})
+
+    await first.flush()
+    await second.flush()
+    await second.flush()
+
+    stored = profiles.docs["u1"]
+    assert stored["version"] == 3
+    assert stored["psychoanalysis"] == {
+        "axioms": {"I must be perfect": _trait(0.8)},
+        "thinking_patterns": {"catastrophizes": _trait(0.7)}
+    }
+    assert (await second.get("u1"))["psychoanalysis"] == stored["psychoanalysis"]
+
+async def test_flush_continues_after_a_failing_user(profiles):
+    store = ProfileStore()
+    for user_id in ("u1", "u2", "u3"):
+        profiles.docs[user_id] = {"user_id": user_id, "psychoanalysis": {}, "about_user": {}, "version": 1}
+        await store.update(user_id, {"about_user": {"name": user_id}})
+    profiles.failing.add("u2")
+
+    await store.flush()
+
+    assert profiles.docs["u1"]["about_user"] == {"name": "u1"}
+    assert profiles.docs["u3"]["about_user"] == {"name": "u3"}
+    profiles.failing.clear()
+    await store.flush()
+    assert profiles.docs["u2"]["about_user"] == {"name": "u2"}
@@ -0,0 +1,83 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import analyzer
+from app.core.config import settings
+from app.core.llm import llm_router
+from app.core.profile_store import profile_store
+from app.core.prompts import compact_json
+from app.core.responder import build_response_messages
+from app.core.tokens import count_message_tokens, count_tokens
+
+PROFILE_SIZES = [8, 64, 512, 4096]
+MESSAGE = "I snapped at my sister again and now I can't stop replaying it"
+CHUNKS = [f"Earlier I said that weekends at my parents' place always end in an argument ({i})" for i in range(10)]
+
+def _profile(traits: int) -> dict:
+    """A psychoanalysis with `traits` observations spread over the categories, scores falling with i."""
+    categories = analyzer.PROFILE_CATEGORIES
+    profile = {category: {} for category in categories}
+    for i in range(traits):
+        score = round(1 - i / traits, 2)
+        profile[categories[i % len(categories)]][f"observation {i} about how the user reacts to conflict"] = {
+            "short_term": score, "long_term": score
+        }
+    return profile
+
+def _spread(counts) -> int:
+    return max(counts) - min(counts)
+
+@pytest.fixture
+def profile_prompts(monkeypatch):
+    prompts = []
+
+    async def complete(stage, messages, **kwargs):
+        prompts.append(messages)
+        content = json.dumps({category: {} for category in analyzer.PROFILE_CATEGORIES})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    async def update(user_id, changes):
+        return changes
+
+    monkeypatch.setattr(llm_router, "complete", complete)
+    monkeypatch.setattr(profile_store, "update", update)
+    return prompts
+
+@pytest.mark.anyio
+async def test_profile_update_tokens_stay_flat_as_the_profile_grows(profile_prompts):
+    budget = settings.stage_route("profile").prompt_budget_tokens
+
+    for traits in PROFILE_SIZES:
+        await analyzer.update_psycho_profile("u1", MESSAGE, CHUNKS, _profile(traits))
+    counts = [count_message_tokens(messages) for messages in profile_prompts]
+
+    # Serialized whole, the largest profile alone would be several times the budget
+    assert count_tokens(compact_json(_profile(PROFILE_SIZES[-1]))) > 4 * budget
+    assert max(counts) <= budget
+    assert _spread(counts[1:]) <= budget * 0.05
+    # The instruction prefix is byte-identical on every call, so it can be cached
+    assert len({messages[0]["content"] for messages in profile_prompts}) == 1
+
+def test_response_tokens_stay_flat_as_the_profile_grows():
+    budget = settings.stage_route("response").prompt_budget_tokens
+
+    counts = [
+        count_message_tokens(build_response_messages(MESSAGE, {"psychoanalysis": _profile(traits)}, CHUNKS))
+        for traits in PROFILE_SIZES
+    ]
+
+    assert max(counts) <= budget
+    assert _spread(counts[1:]) <= budget * 0.05
+
+def test_budgeted_profile_keeps_the_strongest_traits():
+    profile = _profile(PROFILE_SIZES[-1])
+
+    messages = build_response_messages(MESSAGE, {"psychoanalysis": profile}, [])
+    shown = json.loads(messages[-1]["content"].split("Profile:\n", 1)[1].split("\n\n", 1)[0])
+    kept = [name for traits in shown.values() for name in traits]
+
+    assert "observation 0 about how the user reacts to conflict" in kept
+    assert f"observation {PROFILE_SIZES[-1] - 1} about how the user reacts to conflict" not in kept
+    assert MESSAGE in messages[-1]["content"]
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from app.core.scheduler import CircuitBreaker, CircuitOpenError, LLMScheduler, RateLimiter
+from tests.fake_openai import Fault, FakeOpenAI
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+@pytest.fixture
+def fake():
+    return FakeOpenAI()
+
+def _scheduler(max_retries: int = 3,
+               hedge_after_ms=None,
+               failure_threshold: int = 100,
+               reset_seconds: float = 30.0) -> LLMScheduler:
+    return LLMScheduler(
+        limiter=RateLimiter(requests_per_minute=10000, tokens_per_minute=10_000_000),
+        breaker=CircuitBreaker(failure_threshold, reset_seconds),
+        max_retries=max_retries,
+        backoff_base=0.01,
+        backoff_max=0.05,
+        hedge_after_ms=hedge_after_ms
+    )
+
+def _call(client):
+    return lambda: client.chat.completions.create(model="gpt-4", messages=MESSAGES)
+
+async def test_retries_rate_limits_honouring_retry_after(fake):
+    scheduler = _scheduler()
+    fake.inject(Fault(429, retry_after=0.2), Fault(503))
+    started = time.monotonic()
+
+    response = await scheduler.submit(_call(fake.client()))
+
+    assert response.choices[0].message.content == "ok"
+    assert fake.requests == 3
+    assert time.monotonic() - started >= 0.2
+
+async def test_gives_up_after_max_retries(fake):
+    scheduler = _scheduler(max_retries=2)
+    fake.inject(*[Fault(429, retry_after=0.0)] * 5)
+
+    with pytest.raises(openai.RateLimitError):
+        await scheduler.submit(_call(fake.client()))
+    assert fake.requests == 3
+
+async def test_caller_errors_are_not_retried(fake):
+    scheduler = _scheduler()
+    fake.inject(Fault(400))
+
+    with pytest.raises(openai.BadRequestError):
+        await scheduler.submit(_call(fake.client()))
+    assert fake.requests == 1
+    assert scheduler.breaker.state == "closed"
+
+async def test_slow_call_is_hedged(fake):
+    scheduler = _scheduler(hedge_after_ms=50)
+    fake.inject(Fault(delay=2.0))
+    started = time.monotonic()
+
+    response = await scheduler.submit(_call(fake.client()))
+
+    assert response.choices[0].message.content == "ok"
+    assert time.monotonic() - started < 1.0
+    assert fake.requests == 2
+    # The slow primary was cancelled rather than left running
+    await asyncio.sleep(0.05)
+    assert fake.completed == 1
+
+async def test_breaker_opens_and_sheds_calls(fake):
+    scheduler = _scheduler(max_retries=0, failure_threshold=2)
+    fake.inject(Fault(500), Fault(500))
+    client = fake.client()
+
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            await scheduler.submit(_call(client))
+
+    assert scheduler.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        await scheduler.submit(_call(client))
+    assert fake.requests == 2
+
+async def test_half_open_probe_closes_or_reopens_the_breaker(fake):
+    scheduler = _scheduler(max_retries=0, failure_threshold=1, reset_seconds=0.1)
+    client = fake.client()
+    fake.inject(Fault(500))
+    with pytest.raises(openai.InternalServerError):
+        await scheduler.submit(_call(client))
+
+    # A failed probe opens the breaker again
+    await asyncio.sleep(0.15)
+    assert scheduler.breaker.state == "half_open"
+    fake.inject(Fault(500))
+    with pytest.raises(openai.InternalServerError):
+        await scheduler.submit(_call(client))
+    assert scheduler.breaker.state == "open"
+
+    # A successful probe closes it
+    await asyncio.sleep(0.15)
+    await scheduler.submit(_call(client))
+    assert scheduler.breaker.state == "closed"
+
+async def test_only_one_probe_runs_while_half_open(fake):
+    scheduler = _scheduler(max_retries=0, failure_threshold=1, reset_seconds=0.1)
+    client = fake.client()
+    fake.inject(Fault(500))
+    with pytest.raises(openai.InternalServerError):
+        await scheduler.submit(_call(client))
+    await asyncio.sleep(0.15)
+
+    fake.inject(Fault(delay=0.2))
+    probe = asyncio.create_task(scheduler.submit(_call(client)))
+    await asyncio.sleep(0.05)
+    with pytest.raises(CircuitOpenError):
+        await scheduler.submit(_call(client))
+    await probe
+    assert scheduler.breaker.state == "closed"
+
+async def test_cancelled_probe_reopens_instead_of_blocking_forever(fake):
+    scheduler = _scheduler(max_retries=0, failure_threshold=1, reset_seconds=0.1)
+    client = fake.client()
+    fake.inject(Fault(500))
+    with pytest.raises(openai.InternalServerError):
+        await scheduler.submit(_call(client))
+    await asyncio.sleep(0.15)
+
+    fake.inject(Fault(delay=5.0))
+    probe = asyncio.create_task(scheduler.submit(_call(client)))
+    await asyncio.sleep(0.05)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert scheduler.breaker.state == "open"
+    await asyncio.sleep(0.15)
+    response = await scheduler.submit(_call(client))
+    assert response.choices[0].message.content == "ok"
+    assert scheduler.breaker.state == "closed"
@@ -0,0 +1,104 @@
+import json
+from typing import Dict, List
+
+import httpx
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.core.config import settings
+from app.db.mongodb import mongodb
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+ROWS = 2500
+
+class FakeLogs:
+    """sentiment_logs: counts round trips and rejects logs of the user "rejected"."""
+
+    def __init__(self):
+        self.docs: List[Dict] = []
+        self.round_trips = 0
+
+    async def insert_one(self, doc: Dict):
+        self.round_trips += 1
+        doc["_id"] = ObjectId()
+        self.docs.append(doc)
+        return type("InsertOneResult", (), {"inserted_id": doc["_id"]})()
+
+    async def insert_many(self, docs: List[Dict], ordered: bool = True):
+        self.round_trips += 1
+        assert not ordered
+        write_errors = []
+        for i, doc in enumerate(docs):
+            if doc["user_id"] == "rejected":
+                write_errors.append({"index": i, "errmsg": "Document failed validation"})
+            else:
+                self.docs.append(doc)
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": len(docs) - len(write_errors)})
+
+class FakeRollups:
+    def __init__(self):
+        self.round_trips = 0
+
+    async def update_one(self, query, update, upsert=False):
+        self.round_trips += 1
+
+    async def bulk_write(self, requests, ordered=True):
+        self.round_trips += 1
+
+@pytest.fixture
+async def client(monkeypatch):
+    collections = {"sentiment_logs": FakeLogs(), "sentiment_rollups": FakeRollups()}
+    monkeypatch.setattr(mongodb, "db", collections)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        client.collections = collections
+        yield client
+
+def _log(i: int, user_id: str = "u1") -> Dict:
+    return {
+        "message_id": f"m{i}",
+        "user_id": user_id,
+        "timestamp": "2024-03-01T09:30:00+02:00",
+        "sentiment_score": 0.25,
+        "emotion_tags": ["sadness", "fear"]
+    }
+
+def _round_trips(client) -> int:
+    return sum(collection.round_trips for collection in client.collections.values())
+
+async def test_bulk_ingestion_needs_a_few_round_trips_instead_of_two_per_row(client):
+    logs = [_log(i) for i in range(ROWS)]
+
+    response = await client.post(f"{settings.API_V1_STR}/sentiment/logs/bulk", json=logs)
+
+    assert response.json() == {"inserted": ROWS, "failed": 0, "errors": []}
+    batches = -(-ROWS // settings.SENTIMENT_BULK_BATCH_SIZE)
+    # One insert_many and one rollup bulk_write per batch
+    assert _round_trips(client) == 2 * batches
+
+    before = _round_trips(client)
+    for log in logs[:20]:
+        response = await client.post(f"{settings.API_V1_STR}/sentiment/logs", json=log)
+        assert response.status_code == 200, response.text
+    assert _round_trips(client) - before == 2 * 20
+
+async def test_bad_rows_are_reported_without_failing_the_batch(client):
+    lines = [json.dumps(_log(0)), "{not json", json.dumps({**_log(2), "sentiment_score": "very"}),
+             json.dumps(_log(3, user_id="rejected")), json.dumps(_log(4))]
+
+    response = await client.post(
+        f"{settings.API_V1_STR}/sentiment/logs/bulk",
+        content="\n".join(lines).encode(),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+
+    body = response.json()
+    assert body["inserted"] == 2
+    assert [error["row"] for error in body["errors"]] == [1, 2, 3]
+    stored = client.collections["sentiment_logs"].docs
+    assert [doc["message_id"] for doc in stored] == ["m0", "m4"]
+    # Offsets are folded into naive UTC
+    assert stored[0]["timestamp"].isoformat() == "2024-03-01T07:30:00"
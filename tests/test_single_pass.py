@@ -0,0 +1,54 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import pipeline
+from app.core.conversation import ConversationState
+
+pytestmark = pytest.mark.anyio
+
+STORED = {"thinking_patterns": {"seeks reassurance": {"short_term": 0.4, "long_term": 0.3}}}
+
+@pytest.fixture
+def single_pass(monkeypatch):
+    stored = {}
+
+    async def get_psycho_profile(user_id):
+        return {"psychoanalysis": STORED}
+
+    async def load(user_id):
+        return ConversationState()
+
+    async def update(user_id, changes):
+        stored.update(changes)
+        return changes
+
+    def respond_with(updates):
+        async def analyze_and_respond(*args):
+            return SimpleNamespace(profile_updates=updates, reply="I hear you.")
+        monkeypatch.setattr(pipeline, "analyze_and_respond", analyze_and_respond)
+
+    monkeypatch.setattr(pipeline, "get_psycho_profile", get_psycho_profile)
+    monkeypatch.setattr(pipeline.conversation_memory, "load", load)
+    monkeypatch.setattr(pipeline.profile_store, "update", update)
+    monkeypatch.setattr(pipeline.settings, "RAG_ENABLED", False)
+    return respond_with, stored
+
+async def test_profile_updates_are_validated_before_storing(single_pass):
+    respond_with, stored = single_pass
+    respond_with({
+        "thinking_patterns": {"all-or-nothing thinking": {"short_term": 7, "long_term": "high"}},
+        "axioms": {"I must be perfect": "0.8"}
+    })
+
+    assert await pipeline._respond_single_pass("u1", "I failed again") == "I hear you."
+
+    psychoanalysis = stored["psychoanalysis"]
+    assert psychoanalysis["thinking_patterns"]["all-or-nothing thinking"] == {"short_term": 1.0, "long_term": 1.0}
+    assert psychoanalysis["thinking_patterns"]["seeks reassurance"] == STORED["thinking_patterns"]["seeks reassurance"]
+    for traits in psychoanalysis.values():
+        for scores in traits.values():
+            assert set(scores) == {"short_term", "long_term"}
+            assert all(isinstance(score, float) and 0.0 <= score <= 1.0 for score in scores.values())
+    json.dumps(psychoanalysis)
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import DONE, PENDING, InMemorySingleFlightBackend, SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+async def test_least_recently_used_results_are_evicted_first():
+    backend = InMemorySingleFlightBackend(max_entries=2)
+    for key in ("a", "b"):
+        await backend.claim(key, 60)
+        await backend.complete(key, {"reply": key}, 60)
+
+    # Reading "a" makes "b" the oldest
+    assert await backend.claim("a", 60) == (DONE, {"reply": "a"})
+    await backend.claim("c", 60)
+    await backend.complete("c", {"reply": "c"}, 60)
+
+    assert await backend.claim("a", 60) == (DONE, {"reply": "a"})
+    assert await backend.claim("b", 60) == (None, None)
+
+async def test_in_flight_requests_survive_a_full_cache():
+    backend = InMemorySingleFlightBackend(max_entries=1)
+    flight = SingleFlight(backend, wait_timeout=1.0)
+    started, release = asyncio.Event(), asyncio.Event()
+    calls = []
+
+    async def slow():
+        calls.append("slow")
+        started.set()
+        await release.wait()
+        return {"reply": "slow"}
+
+    original = asyncio.create_task(flight.run("slow", slow, 60))
+    await started.wait()
+    for i in range(5):
+        await flight.run(f"fast-{i}", lambda i=i: asyncio.sleep(0, {"reply": i}), 60)
+
+    assert await backend.claim("slow", 60) == (PENDING, None)
+    duplicate = asyncio.create_task(flight.run("slow", slow, 60))
+    release.set()
+
+    assert await original == await duplicate == {"reply": "slow"}
+    assert calls == ["slow"]
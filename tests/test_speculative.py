@@ -0,0 +1,97 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import analyzer, pipeline
+from app.core.config import settings
+from app.core.conversation import ConversationState
+from app.core.llm import llm_router
+from app.core.metrics import StageMetrics
+from app.core.profile_store import profile_store
+
+pytestmark = pytest.mark.anyio
+
+PROFILE = {
+    "thinking_patterns": {
+        "catastrophizes about work": {"short_term": 0.7, "long_term": 0.6},
+        "seeks reassurance": {"short_term": 0.4, "long_term": 0.3}
+    },
+    "defense_mechanisms": {"intellectualization": {"short_term": 0.5, "long_term": 0.5}}
+}
+
+def _completion(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+def _prompt_profile(messages) -> dict:
+    content = messages[-1]["content"]
+    if "Profile:\n" not in content:
+        return {}
+    return json.loads(content.split("Profile:\n", 1)[1].split("\n\n", 1)[0])
+
+@pytest.fixture
+def fake_profile_llm(monkeypatch):
+    """
+    Profile model that keeps the keys of the profile it is shown and nudges the scores.
+    """
+    prompts = []
+
+    async def complete(stage, messages, **kwargs):
+        prompts.append(messages)
+        current = _prompt_profile(messages)
+        updated = {
+            category: {name: {term: round(score + 0.05, 2) for term, score in value.items()} for name, value in traits.items()}
+            for category, traits in current.items()
+        }
+        return _completion(json.dumps(updated))
+
+    async def update(user_id, changes):
+        return changes
+
+    monkeypatch.setattr(llm_router, "complete", complete)
+    monkeypatch.setattr(profile_store, "update", update)
+    return prompts
+
+async def test_profile_update_is_shown_the_current_profile(fake_profile_llm):
+    result = await analyzer.update_psycho_profile("u1", "Work was awful again", [], PROFILE)
+
+    assert _prompt_profile(fake_profile_llm[0]) == PROFILE
+    assert set(result["thinking_patterns"]) == set(PROFILE["thinking_patterns"])
+
+def test_reworded_trait_counts_its_score_difference():
+    reworded = {
+        **PROFILE,
+        "thinking_patterns": {
+            "catastrophizing about the job": {"short_term": 0.75, "long_term": 0.6},
+            "seeks reassurance": {"short_term": 0.4, "long_term": 0.3}
+        }
+    }
+
+    assert pipeline.profile_change(PROFILE, reworded) == pytest.approx(0.05)
+
+def test_new_trait_is_still_significant():
+    extended = {**PROFILE, "axioms": {"I must never fail": {"short_term": 0.9, "long_term": 0.8}}}
+
+    assert pipeline.profile_change(PROFILE, extended) > settings.SPECULATIVE_SIGNIFICANCE_THRESHOLD
+
+async def test_speculative_replies_hit_when_the_profile_is_stable(fake_profile_llm, monkeypatch):
+    stage_metrics = StageMetrics()
+    replies = []
+
+    async def generate_response(user_text, psycho_data, context_chunks, conversation):
+        replies.append(user_text)
+        return f"reply to {user_text}"
+
+    monkeypatch.setattr(pipeline, "metrics", stage_metrics)
+    monkeypatch.setattr(pipeline, "generate_response", generate_response)
+
+    turns = 5
+    for i in range(turns):
+        turn = pipeline.TurnContext([], {"psychoanalysis": PROFILE}, {}, ConversationState())
+        assert await pipeline._respond_speculative("u1", f"message {i}", turn) == f"reply to message {i}"
+
+    counters = stage_metrics.snapshot()["speculative"]
+    assert counters["hits"] == turns
+    assert "misses" not in counters
+    # One response call per turn: nothing was regenerated
+    assert len(replies) == turns
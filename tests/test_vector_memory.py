@@ -0,0 +1,37 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.core.vector_memory import VectorMemory
+
+pytestmark = pytest.mark.anyio
+
+async def test_search_returns_nearest_messages(tmp_path):
+    memory = VectorMemory(directory=str(tmp_path))
+    vectors = np.eye(4, dtype=np.float32)
+    assert await memory.append("u1", vectors[:2], ["work stress", "family dinner"]) == [0, 1]
+    assert await memory.append("u1", vectors[2:], ["sleep trouble", "new job"]) == [2, 3]
+
+    hits = await memory.search("u1", np.array([0.1, 0.0, 1.0, 0.0]), k=2)
+
+    assert [text for text, _ in hits] == ["sleep trouble", "work stress"]
+    assert hits[0][1] == pytest.approx(1.0 / np.linalg.norm([0.1, 1.0]))
+    assert await memory.search("someone-else", vectors[0]) == []
+
+async def test_search_runs_off_the_event_loop(tmp_path, monkeypatch):
+    memory = VectorMemory(directory=str(tmp_path))
+    await memory.append("u1", np.eye(2, dtype=np.float32), ["a", "b"])
+    await memory.search("u1", np.array([1.0, 0.0]))
+    threads = []
+    search = memory._search
+
+    def recording_search(*args):
+        threads.append(threading.current_thread())
+        return search(*args)
+
+    monkeypatch.setattr(memory, "_search", recording_search)
+    # The mapping is open now; the search must still leave the loop thread
+    await memory.search("u1", np.array([1.0, 0.0]))
+
+    assert threads and threads[0] is not threading.main_thread()